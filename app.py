@@ -62,6 +62,27 @@ hr {
 API_URL = "http://localhost:8000"
 
 
+def run_job(path, payload):
+    """POST a crawl/index request, then poll its background job until it finishes."""
+    response = requests.post(f"{API_URL}{path}", json=payload)
+    response.raise_for_status()
+    job = response.json()
+    if "job_id" not in job:
+        return job
+    bar = st.progress(0.0)
+    while job.get("status") in ("queued", "running"):
+        time.sleep(0.5)
+        job = requests.get(f"{API_URL}/jobs/{job['job_id']}").json()
+        progress = job.get("progress") or {}
+        if progress.get("total"):
+            bar.progress(min(1.0, progress["done"] / progress["total"]),
+                         text=f"{progress['done']}/{progress['total']} {progress.get('unit') or ''}")
+    bar.empty()
+    if job["status"] == "failed":
+        raise RuntimeError(job["error"])
+    return job["result"] or {"status": job["status"]}
+
+
 # App Title
 
 st.markdown("<h1 style='text-align:center;'>🧭 RAG Knowledge Explorer</h1>", unsafe_allow_html=True)
@@ -75,6 +96,7 @@ st.markdown("### 🌍 Step 1: Discover a Website")
 st.markdown("Provide a URL and let the explorer gather its contents.")
 
 crawl_url = st.text_input("🔗 Website to Explore:", value="https://docs.streamlit.io/")
+collection = st.text_input("🗄 Collection:", value="default", help="Each collection has its own index; use one per site.")
 col1, col2, col3 = st.columns(3)
 with col1:
     max_pages = st.number_input("📚 Number of Pages:", min_value=1, value=10)
@@ -93,12 +115,12 @@ if st.button("🌐 Begin Exploration", use_container_width=True):
                     "start_url": crawl_url,
                     "max_pages": int(max_pages),
                     "max_depth": int(max_depth),
-                    "crawl_delay_ms": int(crawl_delay_ms)
+                    "crawl_delay_ms": int(crawl_delay_ms),
+                    "collection": collection
                 }
-                response = requests.post(f"{API_URL}/crawl", json=payload)
-                response.raise_for_status()
+                result = run_job("/crawl", payload)
                 st.success("✨ Exploration completed successfully!")
-                st.json(response.json())
+                st.json(result)
             except requests.exceptions.RequestException as e:
                 st.error(f"Error during crawl: {e}")
             except Exception as e:
@@ -118,12 +140,12 @@ if st.button("📂 Generate Index", key="index_button", use_container_width=True
             payload = {
                 "chunk_size": 256,
                 "chunk_overlap": 50,
-                "embedding_model": "sentence-transformers/all-MiniLM-L6-v2"
+                "embedding_model": "sentence-transformers/all-MiniLM-L6-v2",
+                "collection": collection
             }
-            response = requests.post(f"{API_URL}/index", json=payload)
-            response.raise_for_status()
+            result = run_job("/index", payload)
             st.success("🗂️ Index generated successfully!")
-            st.json(response.json())
+            st.json(result)
         except requests.exceptions.RequestException as e:
             st.error(f"Error during indexing: {e}")
         except Exception as e:
@@ -144,7 +166,7 @@ if st.button("🔎 Retrieve Insight", use_container_width=True):
     else:
         with st.spinner("Analyzing your query..."):
             try:
-                response = requests.post(f"{API_URL}/ask", json={"question": question})
+                response = requests.post(f"{API_URL}/ask", json={"question": question, "collection": collection})
                 response.raise_for_status()
                 result = response.json()
 
@@ -0,0 +1,71 @@
+# benchmarks/bench_ann.py
+"""
+Recall@k, single-query latency and memory for each vectorstore index type,
+measured against the exact flat index on synthetic clustered vectors.
+
+    python -m benchmarks.bench_ann --n 200000 --dim 384 --k 10
+"""
+import argparse
+import time
+import numpy as np
+from indexing import ann
+
+
+def clustered(n, dim, clusters, rng):
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    return centers[labels] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def measure(index, queries, truth, k):
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, q in enumerate(queries):
+        t0 = time.perf_counter()
+        _, ids = index.search(q[None, :], k)
+        latencies.append(time.perf_counter() - t0)
+        found[i] = ids[0]
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+    ms = np.array(latencies) * 1000
+    return recall, np.percentile(ms, 50), np.percentile(ms, 99)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=100000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--nlist", type=int, default=1024)
+    ap.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    ap.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    data = clustered(args.n, args.dim, clusters=max(16, args.n // 500), rng=rng)
+    queries = clustered(args.queries, args.dim, clusters=16, rng=rng)
+
+    print(f"{'index':<14}{'param':<14}{'build s':>9}{'recall@' + str(args.k):>11}{'p50 ms':>9}{'p99 ms':>9}{'bytes/vec':>11}")
+    truth = None
+    for kind in ann.INDEX_TYPES:
+        cfg = ann.index_config({"index_type": kind, "nlist": args.nlist, "pq_m": 16 if args.dim % 16 == 0 else 8})
+        t0 = time.perf_counter()
+        index = ann.build_index(data, cfg)
+        build = time.perf_counter() - t0
+        if truth is None:
+            _, truth = index.search(queries, args.k)
+        size = ann.bytes_per_vector(index)
+        if kind == "hnsw":
+            params = [("efSearch", v, dict(ef_search=v)) for v in args.ef_search]
+        elif kind.startswith("ivf"):
+            params = [("nprobe", v, dict(nprobe=v)) for v in args.nprobe]
+        else:
+            params = [("-", "", {})]
+        for name, value, knobs in params:
+            ann.set_search_params(index, **knobs)
+            recall, p50, p99 = measure(index, queries, truth, args.k)
+            print(f"{kind:<14}{name + '=' + str(value) if value else name:<14}{build:>9.2f}{recall:>11.3f}{p50:>9.3f}{p99:>9.3f}{size:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
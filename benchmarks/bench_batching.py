@@ -0,0 +1,92 @@
+# benchmarks/bench_batching.py
+"""
+Retrieval throughput and latency with and without the query batcher, at several
+levels of concurrency, over a synthetic corpus indexed into a temporary directory.
+
+    python -m benchmarks.bench_batching --chunks 50000 --threads 1 8 32
+    python -m benchmarks.bench_batching --model fake   # FAISS path only, no model
+"""
+import argparse
+import random
+import tempfile
+import threading
+import time
+import numpy as np
+from indexing import vectorstore
+from indexing.vectorstore import FaissVectorStore
+from retrieval.batcher import QueryBatcher
+from benchmarks.site import WORDS
+
+
+def make_docs(n, words=40, seed=0):
+    rng = random.Random(seed)
+    return [{"page_content": " ".join(rng.choice(WORDS) for _ in range(words)),
+             "metadata": {"source": f"https://example.com/{i // 10}", "chunk_index": i % 10}} for i in range(n)]
+
+
+def run(search, queries, threads):
+    latencies = []
+    lock = threading.Lock()
+    per_thread = len(queries) // threads
+
+    def worker(offset):
+        mine = []
+        for q in queries[offset:offset + per_thread]:
+            t0 = time.perf_counter()
+            search(q)
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(mine)
+
+    pool = [threading.Thread(target=worker, args=(i * per_thread,)) for i in range(threads)]
+    t0 = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    ms = np.array(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(ms, 50), np.percentile(ms, 99)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2", help='"fake" skips the model')
+    ap.add_argument("--chunks", type=int, default=20000)
+    ap.add_argument("--queries", type=int, default=512)
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32])
+    ap.add_argument("--max-wait-ms", type=float, default=2.0)
+    ap.add_argument("--max-batch", type=int, default=32)
+    args = ap.parse_args()
+
+    if args.model == "fake":
+        from langchain_community.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=384)
+    else:
+        from indexing.embedder import get_embedding_model
+        embeddings = get_embedding_model(args.model)
+
+    vectorstore.INDEX_DIR = tempfile.mkdtemp(prefix="bench_batching_")
+    store = FaissVectorStore(embeddings, model_name=args.model)
+    store.index_documents(make_docs(args.chunks))
+    rng = random.Random(1)
+    queries = [" ".join(rng.choice(WORDS) for _ in range(6)) for _ in range(args.queries)]
+
+    print(f"{args.chunks} chunks, k={args.k}, max_wait={args.max_wait_ms}ms, max_batch={args.max_batch}")
+    print(f"{'threads':>7} {'path':>8} {'qps':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for threads in args.threads:
+        batcher = QueryBatcher(max_wait_ms=args.max_wait_ms, max_batch=args.max_batch)
+        paths = {
+            "direct": lambda q: store.retrieve(q, k=args.k),
+            "batched": lambda q: batcher.search(store, q, k=args.k),
+        }
+        for name, search in paths.items():
+            search(queries[0])  # warm-up
+            qps, p50, p99 = run(search, queries, threads)
+            print(f"{threads:>7} {name:>8} {qps:>8.0f} {p50:>8.2f} {p99:>8.2f}")
+        print(f"{'':>7} batches: {batcher.stats()}")
+
+
+if __name__ == "__main__":
+    main()
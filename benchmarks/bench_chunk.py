@@ -0,0 +1,69 @@
+# benchmarks/bench_chunk.py
+"""
+Chunking throughput and peak memory: the original per-page LangChain Document +
+RecursiveCharacterTextSplitter path against the offset-based chunker, serially,
+lazily (iter_chunks, nothing held) and across a process pool.
+
+    python -m benchmarks.bench_chunk --pages 2000 --workers 4
+"""
+import argparse
+import time
+import tracemalloc
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from crawler.parser import HTMLParser
+from indexing.chunker import chunk_documents, iter_chunks
+from benchmarks.site import make_page
+
+
+def langchain_baseline(docs, chunk_size, chunk_overlap):
+    # what chunk_documents did before: a Document per page, split_documents, metadata copies
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    outputs = []
+    for d in docs:
+        doc = Document(page_content=f"{d.get('title', '')}\n{d.get('content', '')}",
+                       metadata={"source": d["url"], "title": d.get("title", "")})
+        for i, c in enumerate(splitter.split_documents([doc])):
+            metadata = c.metadata.copy()
+            metadata["chunk_index"] = i
+            outputs.append({"page_content": c.page_content, "metadata": metadata})
+    return outputs
+
+
+def measure(label, fn):
+    t0 = time.perf_counter()
+    n = fn()
+    elapsed = time.perf_counter() - t0
+    # a second, traced run for memory: tracemalloc slows allocation-heavy code down
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<22}{n:>10}{elapsed:>9.2f}s{n / elapsed:>12.0f}{peak / 1e6:>12.1f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=2000)
+    ap.add_argument("--words", type=int, default=2000, help="body words per page")
+    ap.add_argument("--chunk-size", type=int, default=256)
+    ap.add_argument("--chunk-overlap", type=int, default=50)
+    ap.add_argument("--workers", type=int, default=4)
+    args = ap.parse_args()
+
+    parser = HTMLParser()
+    docs = [parser.parse_html(make_page(i, args.pages, words=args.words), f"http://bench.local/page/{i}")
+            for i in range(args.pages)]
+    size, overlap = args.chunk_size, args.chunk_overlap
+    print(f"{args.pages} pages, {sum(len(d['content']) for d in docs) / 1e6:.1f}M chars, "
+          f"chunk_size={size}, overlap={overlap}")
+    print(f"{'path':<22}{'chunks':>10}{'time':>10}{'chunks/s':>12}{'peak MB':>12}")
+    measure("langchain splitter", lambda: len(langchain_baseline(docs, size, overlap)))
+    measure("offsets", lambda: len(chunk_documents(docs, size, overlap)))
+    measure("offsets, streamed", lambda: sum(1 for _ in iter_chunks(docs, size, overlap)))
+    measure(f"offsets x{args.workers}", lambda: len(chunk_documents(docs, size, overlap, workers=args.workers)))
+    measure("tokens (64), streamed", lambda: sum(1 for _ in iter_chunks(docs, 64, 12, unit="tokens")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# benchmarks/bench_e2e.py
+"""
+End-to-end run against a local synthetic site and a local stand-in for the Groq
+API, fully offline: crawl -> parse -> chunk -> embed/index -> search -> /ask.
+Reports pages/s, parse MB/s, chunks/s, embeddings/s, search QPS, p50/p99 /ask
+latency, recall@k and answer accuracy on generated question/answer pairs.
+
+    python -m benchmarks.bench_e2e --pages 200
+    python -m benchmarks.bench_e2e --json > baseline.json
+    python -m benchmarks.bench_e2e --baseline baseline.json --tolerance 0.2   # exit 1 on regression
+
+Run from the repository root (main.py reads config/settings.yaml on import).
+Embeddings default to an offline hashing model; pass --model to use a real one.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+# throughputs regress when they drop, latencies when they rise
+HIGHER_IS_BETTER = ("pages_per_s", "parse_mb_per_s", "chunks_per_s", "embeddings_per_s", "search_qps",
+                    "recall_at_k", "answer_accuracy")
+LOWER_IS_BETTER = ("ask_p50_ms", "ask_p99_ms", "context_tokens")
+
+
+def rate(n, seconds):
+    return round(n / seconds, 2) if seconds > 0 else 0.0
+
+
+def crawl(site_url, pages, concurrency, out_dir):
+    from crawler.crawler import WebCrawler
+    from crawler.async_crawler import AsyncWebCrawler
+    common = dict(max_depth=10 ** 6, max_pages=pages, delay=0, output_dir=out_dir)
+    crawler = (AsyncWebCrawler(site_url, concurrency=concurrency, **common) if concurrency > 0
+               else WebCrawler(site_url, **common))
+    t0 = time.perf_counter()
+    crawler.start()
+    seconds = time.perf_counter() - t0
+    return dict(crawler.store.items(crawler.changed_urls)), seconds
+
+
+def run(args):
+    import main as app
+    from fastapi.testclient import TestClient
+    from crawler.parser import HTMLParser
+    from indexing import vectorstore
+    from indexing.chunker import chunk_documents
+    from indexing.vectorstore import FaissVectorStore
+    from evaluation.evaluate import evaluate_retrieval, evaluate_answers
+    from utils import metrics
+    from benchmarks.site import SyntheticSite, make_questions
+    from benchmarks.fake_llm import FakeCompletionServer
+
+    if args.model == "hashing":
+        from benchmarks.hashing import HashingEmbeddings
+        embeddings = HashingEmbeddings()
+    else:
+        embeddings = app.load_embeddings(args.model)
+
+    results = {"pages": args.pages, "k": args.k, "mode": args.mode}
+    with tempfile.TemporaryDirectory(prefix="bench_e2e_") as tmp, \
+            SyntheticSite(args.pages, latency=args.latency) as site, \
+            FakeCompletionServer(ttft=args.llm_ttft, token_delay=args.llm_token_delay) as llm:
+        vectorstore.INDEX_DIR = os.path.join(tmp, "index")
+
+        pages, seconds = crawl(site.url, args.pages, args.concurrency, os.path.join(tmp, "raw_html"))
+        results["pages_crawled"] = len(pages)
+        results["pages_per_s"] = rate(len(pages), seconds)
+
+        size_mb = sum(len(html.encode("utf-8")) for html in pages.values()) / 1e6
+        t0 = time.perf_counter()
+        docs = HTMLParser().parse_multiple(pages)
+        results["parse_mb_per_s"] = rate(size_mb, time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        chunks = chunk_documents(docs, app.cfg["index"]["chunk_size"], app.cfg["index"]["chunk_overlap"])
+        results["chunks"] = len(chunks)
+        results["chunks_per_s"] = rate(len(chunks), time.perf_counter() - t0)
+
+        store = FaissVectorStore(embeddings, index_cfg=app.cfg["vectorstore"], model_name=args.model)
+        with metrics.trace() as spans:
+            store.index_documents(chunks)
+        embed_s = sum(s for stage, s in spans if stage == "embed")
+        results["embeddings_per_s"] = rate(len(chunks), embed_s)
+
+        pairs = make_questions(site.url, args.pages)
+        search = lambda q, k: store.retrieve(q, k=k, mode=args.mode)
+        results.update(evaluate_retrieval(search, pairs, args.k))
+        results["recall_at_k"] = results.pop(f"recall@{args.k}")
+        queries = [p["question"] for p in pairs] * max(1, args.search_rounds)
+        t0 = time.perf_counter()
+        for q in queries:
+            search(q, args.k)
+        results["search_qps"] = rate(len(queries), time.perf_counter() - t0)
+
+        # /ask through the app itself, uncached, against the local completion server
+        os.environ["GROQ_API_KEY"] = os.environ.get("GROQ_API_KEY") or "offline"
+        app.cfg["generation"]["base_url"] = llm.url
+        app._query_cache = None
+        app._collections.put(app.DEFAULT_COLLECTION, store)
+        client = TestClient(app.app)
+        latencies, context_tokens = [], []
+
+        def ask(question):
+            t0 = time.perf_counter()
+            body = client.post("/ask", json={"question": question, "top_k": args.k,
+                                             "retrieval_mode": args.mode}).json()
+            latencies.append(time.perf_counter() - t0)
+            context_tokens.append(body.get("context", {}).get("tokens", 0))
+            return body
+
+        ask(pairs[0]["question"])  # warm-up: client and chain construction
+        latencies.clear()
+        context_tokens.clear()
+        results.update(evaluate_answers(ask, pairs[:args.asks]))
+        ms = np.array(latencies) * 1000
+        results["ask_p50_ms"] = round(float(np.percentile(ms, 50)), 2)
+        results["ask_p99_ms"] = round(float(np.percentile(ms, 99)), 2)
+        results["context_tokens"] = round(float(np.mean(context_tokens)), 1)
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    out = []
+    for key in HIGHER_IS_BETTER:
+        if key in baseline and results.get(key, 0) < baseline[key] * (1 - tolerance):
+            out.append(f"{key}: {results.get(key)} < {baseline[key]} (-{tolerance:.0%})")
+    for key in LOWER_IS_BETTER:
+        if key in baseline and results.get(key, 0) > baseline[key] * (1 + tolerance):
+            out.append(f"{key}: {results.get(key)} > {baseline[key]} (+{tolerance:.0%})")
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=200)
+    ap.add_argument("--latency", type=float, default=0.0, help="server-side delay per page (s)")
+    ap.add_argument("--concurrency", type=int, default=16, help="async crawler concurrency; 0 crawls with WebCrawler")
+    ap.add_argument("--model", default="hashing", help='embedding model; "hashing" needs no download')
+    ap.add_argument("--mode", default="hybrid", help="retrieval mode: vector, bm25 or hybrid")
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--search-rounds", type=int, default=5)
+    ap.add_argument("--asks", type=int, default=100)
+    ap.add_argument("--llm-ttft", type=float, default=0.02)
+    ap.add_argument("--llm-token-delay", type=float, default=0.0)
+    ap.add_argument("--json", action="store_true", help="print the results as JSON")
+    ap.add_argument("--baseline", help="JSON from an earlier --json run to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    args = ap.parse_args()
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, value in results.items():
+            print(f"{key:<20}{value:>14}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failed = regressions(results, json.load(f), args.tolerance)
+        for line in failed:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# benchmarks/bench_embed.py
+"""
+Embedding throughput on CPU: the old per-request path (load the model, embed)
+against the pooled model for each backend.
+
+    python -m benchmarks.bench_embed --chunks 2000 --backends torch int8 onnx
+"""
+import argparse
+import time
+from langchain_community.embeddings import SentenceTransformerEmbeddings
+from indexing.embedder import get_embedding_model, set_threads
+from benchmarks.site import make_page
+
+
+def make_chunks(n, size=256):
+    text = " ".join(make_page(i, n, words=60) for i in range(max(1, n // 10)))
+    chunks = [text[i:i + size] for i in range(0, len(text), size)]
+    return (chunks * (n // max(1, len(chunks)) + 1))[:n]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    ap.add_argument("--chunks", type=int, default=2000)
+    ap.add_argument("--batch-size", type=int, default=64)
+    ap.add_argument("--threads", type=int, default=0)
+    ap.add_argument("--requests", type=int, default=3, help="simulated /index calls per backend")
+    ap.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx"])
+    args = ap.parse_args()
+
+    set_threads(args.threads)
+    chunks = make_chunks(args.chunks)
+    per_request = chunks[: len(chunks) // args.requests]
+    print(f"{'path':<22}{'seconds':>10}{'chunks/s':>12}")
+
+    t0 = time.perf_counter()
+    for _ in range(args.requests):
+        SentenceTransformerEmbeddings(model_name=args.model).embed_documents(per_request)
+    s = time.perf_counter() - t0
+    print(f"{'load per request':<22}{s:>10.2f}{len(per_request) * args.requests / s:>12.1f}")
+
+    for backend in args.backends:
+        try:
+            model = get_embedding_model(args.model, batch_size=args.batch_size, backend=backend)
+        except Exception as e:  # onnx needs optional packages
+            print(f"{'pooled ' + backend:<22}  skipped: {e}")
+            continue
+        model.embed_documents(per_request[:8])  # warm-up
+        t0 = time.perf_counter()
+        for _ in range(args.requests):
+            get_embedding_model(args.model, batch_size=args.batch_size, backend=backend).embed_documents(per_request)
+        s = time.perf_counter() - t0
+        print(f"{'pooled ' + backend:<22}{s:>10.2f}{len(per_request) * args.requests / s:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
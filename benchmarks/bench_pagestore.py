@@ -0,0 +1,80 @@
+# benchmarks/bench_pagestore.py
+"""
+Raw HTML storage: the old one-file-per-URL layout against the PageStore
+segments, by disk usage (allocated blocks), write throughput and random
+reads, on synthetic pages of which --revisits are fetched again unchanged.
+
+    python -m benchmarks.bench_pagestore --pages 5000
+"""
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+from crawler.pagestore import PageStore
+from benchmarks.site import make_page
+
+
+def file_name(url):
+    # what WebCrawler.save_html did before
+    name = re.sub(r'[\\/*?:"<>|]', "_", url).replace("://", "_").replace("/", "_")[:200]
+    return f"{name}.html"
+
+
+def allocated_mb(directory):
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            total += os.stat(os.path.join(root, name)).st_blocks * 512
+    return total / 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=5000)
+    ap.add_argument("--words", type=int, default=1500)
+    ap.add_argument("--revisits", type=float, default=0.5, help="share of pages fetched a second time, unchanged")
+    ap.add_argument("--reads", type=int, default=2000)
+    args = ap.parse_args()
+
+    pages = [(f"http://bench.local/page/{i}", make_page(i, args.pages, words=args.words)) for i in range(args.pages)]
+    rng = random.Random(0)
+    fetches = pages + rng.sample(pages, int(len(pages) * args.revisits))
+    raw_mb = sum(len(h.encode("utf-8")) for _, h in fetches) / 1e6
+    sample = [rng.choice(pages)[0] for _ in range(args.reads)]
+    print(f"{len(fetches)} fetches of {len(pages)} pages, {raw_mb:.1f} MB of HTML")
+    print(f"{'layout':<12}{'disk MB':>9}{'files':>8}{'write MB/s':>12}{'reads/s':>10}")
+
+    with tempfile.TemporaryDirectory() as out:
+        t0 = time.perf_counter()
+        for url, html in fetches:
+            with open(os.path.join(out, file_name(url)), "w", encoding="utf-8") as f:
+                f.write(html)
+        write_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for url in sample:
+            with open(os.path.join(out, file_name(url)), encoding="utf-8") as f:
+                f.read()
+        read_s = time.perf_counter() - t0
+        print(f"{'files':<12}{allocated_mb(out):>9.1f}{len(os.listdir(out)):>8}{raw_mb / write_s:>12.1f}"
+              f"{len(sample) / read_s:>10.0f}")
+
+    with tempfile.TemporaryDirectory() as out:
+        store = PageStore(out)
+        t0 = time.perf_counter()
+        for url, html in fetches:
+            store.put(url, html)
+        write_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for url in sample:
+            store.get(url)
+        read_s = time.perf_counter() - t0
+        files = len(os.listdir(out))
+        store.close()
+        print(f"{'pagestore':<12}{allocated_mb(out):>9.1f}{files:>8}{raw_mb / write_s:>12.1f}"
+              f"{len(sample) / read_s:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
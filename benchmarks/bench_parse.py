@@ -0,0 +1,72 @@
+# benchmarks/bench_parse.py
+"""
+Parse throughput over saved pages (a crawler PageStore directory, or .html
+files): the original BeautifulSoup path (links and text parsed separately)
+against the single-pass lxml extractor, serially and across a process pool.
+
+    python -m benchmarks.bench_parse --dir data/raw_html --workers 4
+"""
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from bs4 import BeautifulSoup
+from urllib.parse import urljoin
+from crawler.parser import HTMLParser
+from crawler.extractor import extract
+from crawler.pagestore import PageStore
+from benchmarks.site import make_page
+
+
+def load_corpus(directory, synthetic):
+    pages = {}
+    if os.path.exists(os.path.join(directory, "index.sqlite")):
+        pages = dict(PageStore(directory).items())
+    for path in sorted(glob.glob(os.path.join(directory, "*.html"))):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            pages[path] = f.read()
+    if not pages:
+        print(f"No pages in {directory}; using {synthetic} synthetic pages")
+        pages = {f"http://bench.local/page/{i}": make_page(i, synthetic, words=2000) for i in range(synthetic)}
+    return pages
+
+
+def bs4_baseline(html, url):
+    # what WebCrawler.get_links + HTMLParser.parse_html did before: two html.parser passes
+    soup = BeautifulSoup(html, "html.parser")
+    links = {urljoin(url, a["href"]) for a in soup.find_all("a", href=True)}
+    doc = HTMLParser(backend="bs4").parse_html(html, url)
+    doc["links"] = sorted(links)
+    return doc
+
+
+def timed(label, fn, pages, size_mb):
+    t0 = time.perf_counter()
+    fn(pages)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<28}{elapsed:>9.2f}s{size_mb / elapsed:>10.2f} MB/s{len(pages) / elapsed:>10.0f} pages/s")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dir", default="data/raw_html")
+    ap.add_argument("--synthetic", type=int, default=500, help="pages to generate when --dir is empty")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args()
+
+    pages = load_corpus(args.dir, args.synthetic)
+    size_mb = sum(len(h.encode("utf-8")) for h in pages.values()) / 1e6
+    print(f"{len(pages)} pages, {size_mb:.1f} MB")
+
+    timed("bs4 (links + text)", lambda p: [bs4_baseline(h, u) for u, h in p.items()], pages, size_mb)
+    timed("lxml single pass", lambda p: [extract(h, u) for u, h in p.items()], pages, size_mb)
+
+    def pooled(p):
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            list(pool.map(extract, p.values(), p.keys(), chunksize=max(1, len(p) // (args.workers * 4))))
+    timed(f"lxml x{args.workers} processes", pooled, pages, size_mb)
+
+
+if __name__ == "__main__":
+    main()
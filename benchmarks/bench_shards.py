@@ -0,0 +1,85 @@
+# benchmarks/bench_shards.py
+"""
+Search throughput and latency of one in-process FaissVectorStore against the
+same corpus sharded across local shard server processes, the overlap of their
+top-k results, and what a search returns with one shard server killed.
+
+    python -m benchmarks.bench_shards --chunks 200000 --shards 4 --workers 4 --threads 1 8 32
+"""
+import argparse
+import random
+import tempfile
+import time
+from indexing import vectorstore
+from indexing.shards import ShardPool, ShardedStore
+from indexing.vectorstore import FaissVectorStore
+from benchmarks.bench_batching import make_docs, run
+from benchmarks.hashing import HashingEmbeddings
+from benchmarks.site import WORDS
+
+
+def overlap(a, b, queries, k, mode):
+    ids = lambda docs: {(d.metadata["source"], d.metadata["chunk_index"]) for d in docs}
+    same = [len(ids(a.retrieve(q, k=k, mode=mode)) & ids(b.retrieve(q, k=k, mode=mode))) / k for q in queries]
+    return sum(same) / len(same)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=50000)
+    ap.add_argument("--shards", type=int, default=4)
+    ap.add_argument("--workers", type=int, default=4, help="shard server processes")
+    ap.add_argument("--queries", type=int, default=512)
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--mode", default="vector")
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32])
+    ap.add_argument("--timeout-ms", type=int, default=2000)
+    args = ap.parse_args()
+
+    vectorstore.INDEX_DIR = tempfile.mkdtemp(prefix="bench_shards_")
+    embeddings = HashingEmbeddings()
+    docs = make_docs(args.chunks)
+    chunks = [d["page_content"] for d in docs]
+    vectors = embeddings.embed_documents(chunks)
+    metadatas = [d["metadata"] for d in docs]
+
+    single = FaissVectorStore(embeddings, model_name="hashing", collection="single")
+    t0 = time.perf_counter()
+    single.build(chunks, vectors, metadatas)
+    print(f"single build  {time.perf_counter() - t0:.2f}s")
+
+    pool = ShardPool(workers=args.workers, timeout_ms=args.timeout_ms, retry_s=30, index_dir=vectorstore.INDEX_DIR)
+    t0 = time.perf_counter()
+    pool.start()
+    print(f"pool start    {time.perf_counter() - t0:.2f}s ({args.workers} servers)")
+    sharded = ShardedStore(embeddings, pool, args.shards, model_name="hashing", collection="sharded")
+    t0 = time.perf_counter()
+    sharded.build(chunks, vectors, metadatas)
+    print(f"sharded build {time.perf_counter() - t0:.2f}s ({args.shards} shards, {sharded.counts})")
+
+    rng = random.Random(1)
+    queries = [" ".join(rng.choice(WORDS) for _ in range(6)) for _ in range(args.queries)]
+    print(f"top-{args.k} overlap with the single store ({args.mode}): "
+          f"{overlap(single, sharded, queries[:100], args.k, args.mode):.3f}")
+
+    print(f"{'threads':>7} {'store':>8} {'qps':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for threads in args.threads:
+        for label, store in (("single", single), ("sharded", sharded)):
+            qps, p50, p99 = run(lambda q: store.retrieve(q, k=args.k, mode=args.mode), queries, threads)
+            print(f"{threads:>7} {label:>8} {qps:>8.0f} {p50:>8.2f} {p99:>8.2f}")
+
+    victim = pool.servers[0]
+    victim.process.kill()
+    victim.process.wait()
+    victim.process = None  # keep it down for the rest of the run
+    t0 = time.perf_counter()
+    first = sharded.retrieve(queries[0], k=args.k, mode=args.mode)
+    first_ms = (time.perf_counter() - t0) * 1000
+    _, p50, _ = run(lambda q: sharded.retrieve(q, k=args.k, mode=args.mode), queries[:100], 1)
+    print(f"server 0 killed: first search {first_ms:.1f}ms ({len(first)} docs), then p50 {p50:.2f}ms, "
+          f"overlap {overlap(single, sharded, queries[:100], args.k, args.mode):.3f}")
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
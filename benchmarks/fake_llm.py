@@ -0,0 +1,108 @@
+# benchmarks/fake_llm.py
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def default_reply(prompt):
+    """Repeats the context sentence that shares the most words with the question."""
+    context, _, question = prompt.partition("Question:")
+    question = question.strip().split("\n", 1)[0]  # the prompt's closing instructions are not part of it
+    words = set(re.findall(r"\w+", question.lower()))
+    best, best_overlap = "I don't know.", 0
+    for sentence in re.split(r"(?<=[.!?])\s+", context.partition("Context:")[2]):
+        overlap = len(words & set(re.findall(r"\w+", sentence.lower())))
+        if overlap > best_overlap:
+            best, best_overlap = sentence.strip(), overlap
+    return best
+
+
+class FakeCompletionServer:
+    """
+    Local stand-in for the Groq chat completions API (the OpenAI-compatible
+    /openai/v1/chat/completions route), streaming or not. `ttft` seconds pass
+    before the first token and `token_delay` between tokens, so latency numbers
+    are repeatable without network access. Point the app at it with
+    generation.base_url (or GROQ_BASE_URL) set to `url`.
+    """
+
+    def __init__(self, reply=default_reply, ttft=0.05, token_delay=0.005, host="127.0.0.1", port=0):
+        self.reply = reply
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.requests = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                fake.requests += 1
+                prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+                tokens = re.findall(r"\S+\s*", fake.reply(prompt))[:body.get("max_tokens") or None]
+                time.sleep(fake.ttft)
+                if body.get("stream"):
+                    self._stream(body.get("model"), tokens)
+                else:
+                    time.sleep(fake.token_delay * len(tokens))
+                    self._json(body.get("model"), "".join(tokens))
+
+            def _chunk(self, model, delta, finish=None):
+                return {"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+
+            def _stream(self, model, tokens):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                events = [self._chunk(model, {"role": "assistant", "content": ""})]
+                events += [self._chunk(model, {"content": t}) for t in tokens]
+                events.append(self._chunk(model, {}, "stop"))
+                for n, event in enumerate(events):
+                    if 1 < n < len(events) - 1:
+                        time.sleep(fake.token_delay)
+                    self._write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def _write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _json(self, model, text):
+                data = json.dumps({
+                    "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,38 @@
+# benchmarks/hashing.py
+import hashlib
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from indexing.lexical import tokenize
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Offline stand-in for a sentence-transformer: signed feature hashing of the
+    lexical tokens, L2-normalised. Texts that share words land near each other,
+    so recall numbers mean something, and nothing has to be downloaded.
+    """
+
+    def __init__(self, size=384):
+        self.size = size
+        self._slots = {}
+
+    def _slot(self, token):
+        slot = self._slots.get(token)
+        if slot is None:
+            h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            slot = self._slots[token] = (h % self.size, 1.0 if h >> 63 else -1.0)
+        return slot
+
+    def _embed(self, text):
+        vec = np.zeros(self.size, dtype=np.float32)
+        for token in tokenize(text):
+            i, sign = self._slot(token)
+            vec[i] += sign
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
@@ -0,0 +1,178 @@
+# benchmarks/site.py
+import gzip
+import hashlib
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("index vector query embedding crawler page token latency cache shard "
+         "retrieval answer source chunk parser document server client model").split()
+
+
+# what the root page of a site with `junk` links to besides its pages
+JUNK_LINKS = ("/files/report.pdf", "/download/archive", "/huge", "/legacy")
+JUNK_BYTES = 2 * 1024 * 1024
+HUGE_BYTES = 8 * 1024 * 1024
+
+
+def make_page(i, n_pages, links_per_page=5, words=300, seed=0, tracking=False, extra_links=()):
+    """
+    Deterministic HTML page `i` of a synthetic site with `n_pages` pages. With
+    `tracking`, every link also appears with tracking parameters and a trailing
+    slash, as real sites' share buttons and menus produce.
+    """
+    rng = random.Random(seed * 100003 + i)
+    body = " ".join(rng.choice(WORDS) for _ in range(words))
+    targets = {(i + 1) % n_pages} | {rng.randrange(n_pages) for _ in range(links_per_page - 1)}
+    hrefs = ["/page/{t}"]
+    if tracking:
+        hrefs += ["/page/{t}/?utm_source=nav&utm_medium=menu", f"/page/{{t}}?ref_src=page{i}#top"]
+    links = "".join(f'<li><a href="{h.format(t=t)}">Page {t}</a></li>' for t in sorted(targets) for h in hrefs)
+    links += "".join(f'<li><a href="{h}">{h}</a></li>' for h in extra_links)
+    return (
+        f"<html><head><title>Page {i}</title></head><body>"
+        f"<nav><ul>{links}</ul></nav>"
+        f"<h1>Page {i}</h1><p>Fact {i}: the code for page {i} is K{i:05d}.</p>"
+        f"<p>{body}</p></body></html>"
+    )
+
+
+class SyntheticSite:
+    """
+    Serves `n_pages` linked HTML pages from a local threaded HTTP server.
+    `latency` (seconds) is added to every response to imitate a remote host.
+    With `sitemap` the site serves /sitemap.xml; `tracking` adds duplicate
+    spellings of every link (see make_page). `requests` counts requests served.
+
+    With `junk` the root page also links to what a crawler should not keep
+    (JUNK_LINKS): a PDF, a binary download without an extension, an HTML page
+    larger than any sane cap sent without Content-Length, and a windows-1252
+    page with no declared charset. With `compress`, responses are gzip-encoded for
+    clients that accept it. `bytes_sent` counts body bytes on the wire.
+    """
+
+    def __init__(self, n_pages=200, latency=0.0, host="127.0.0.1", port=0, sitemap=False, tracking=False,
+                 junk=False, compress=False):
+        self.n_pages = n_pages
+        self.latency = latency
+        self.sitemap = sitemap
+        self.tracking = tracking
+        self.junk = junk
+        self.compress = compress
+        self.bytes_sent = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with site.lock:
+                    site.requests += 1
+                if site.latency:
+                    time.sleep(site.latency)
+                path = self.path.split("?")[0].rstrip("/")
+                if path == "/robots.txt":
+                    return self._send(200, "User-agent: *\nAllow: /\n", "text/plain")
+                if path == "/sitemap.xml" and site.sitemap:
+                    return self._send(200, make_sitemap(site.url, site.n_pages), "application/xml")
+                if path in ("", "/index.html"):
+                    extra = JUNK_LINKS if site.junk else ()
+                    return self._send(200, make_page(0, site.n_pages, tracking=site.tracking, extra_links=extra))
+                if site.junk and path == "/files/report.pdf":
+                    return self._send(200, b"%PDF-1.4\n" + bytes(JUNK_BYTES), "application/pdf")
+                if site.junk and path == "/download/archive":
+                    return self._send(200, bytes(JUNK_BYTES), "application/octet-stream")
+                if site.junk and path == "/huge":
+                    return self._stream_huge()
+                if site.junk and path == "/legacy":
+                    page = make_page(0, site.n_pages).replace("<h1>Page 0</h1>", "<h1>Caf\u00e9 \u2013 legacy</h1>")
+                    return self._send(200, page.encode("cp1252"), "text/html")
+                if path.startswith("/page/"):
+                    try:
+                        i = int(path.rsplit("/", 1)[1])
+                    except ValueError:
+                        i = -1
+                    if 0 <= i < site.n_pages:
+                        return self._send(200, make_page(i, site.n_pages, tracking=site.tracking))
+                self._send(404, "not found", "text/plain")
+
+            def _send(self, status, body, ctype="text/html; charset=utf-8"):
+                data = body.encode("utf-8") if isinstance(body, str) else body
+                etag = '"%s"' % hashlib.md5(data).hexdigest()
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    status, data = 304, b""
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("ETag", etag)
+                if data and site.compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    data = gzip.compress(data, 6)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self._write(data)
+
+            def _stream_huge(self):
+                """An endless-looking page: no Content-Length, body ends when the connection closes."""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                chunk = ("<p>" + " ".join(WORDS) + "</p>").encode("utf-8") * 512
+                try:
+                    self._write(b"<html><body>")
+                    for _ in range(HUGE_BYTES // len(chunk)):
+                        self._write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client stopped reading
+
+            def _write(self, data):
+                self.wfile.write(data)
+                with site.lock:
+                    site.bytes_sent += len(data)
+
+        self.server = _QuietServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        pass  # crawlers hang up on skipped responses mid-body
+
+
+def make_sitemap(base_url, n_pages, now=None):
+    """sitemap.xml listing every page; page i was last modified i hours before `now`."""
+    now = now or time.time()
+    entries = "".join(
+        f"<url><loc>{base_url}/page/{i}</loc>"
+        f"<lastmod>{time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(now - i * 3600))}</lastmod></url>"
+        for i in range(1, n_pages))
+    return f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'
+
+
+def make_questions(base_url, n_pages):
+    """One question per page (page 0 is the site root) with its source URL and expected answer."""
+    return [{"question": f"What is the code for page {i}?", "source": f"{base_url}/page/{i}", "answer": f"K{i:05d}"}
+            for i in range(1, n_pages)]
@@ -0,0 +1,173 @@
+# crawler/async_crawler.py
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
+import aiohttp
+from crawler.crawler import WebCrawler
+from crawler.extractor import extract
+from crawler.fetch import CHUNK_BYTES, TooLarge, check_size, decode_html, header_skip, non_html_extension
+from crawler.manifest import content_hash
+from utils.metrics import timed
+
+
+class TokenBucket:
+    """Per-host token bucket: `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncWebCrawler(WebCrawler):
+    """
+    Crawler that fetches from the priority frontier with `concurrency` workers
+    over a pooled aiohttp session. Politeness is enforced by a token bucket per host instead of
+    a global sleep; `rate_per_host` defaults to 1 / delay. With `parse_workers` > 0
+    page extraction runs in a process pool so parsing keeps up with fetching.
+    """
+
+    def __init__(self, start_url, concurrency=8, rate_per_host=None, burst=1, parse_workers=0, **kwargs):
+        super().__init__(start_url, **kwargs)
+        self.concurrency = max(1, concurrency)
+        if rate_per_host is None:
+            rate_per_host = 1.0 / self.delay if self.delay > 0 else 0
+        self.rate_per_host = rate_per_host
+        self.burst = max(1, burst)
+        self.buckets = {}  # {host: TokenBucket}
+        self.parse_workers = parse_workers
+        self.parse_pool = None
+
+    def _bucket(self, url):
+        host = urlparse(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate_per_host, self.burst)
+        return self.buckets[host]
+
+    async def fetch(self, session, url):
+        """
+        Returns (status, html, headers); html is None unless status is 200 and the
+        body is HTML within max_bytes (skips are recorded here).
+        """
+        await self._bucket(url).acquire()
+        with timed("fetch", items=1):
+            async with session.get(url, headers=self.request_headers(url)) as resp:
+                if resp.status != 200:
+                    return resp.status, None, resp.headers
+                skipped = header_skip(resp.headers, self.max_bytes)
+                if skipped:
+                    self.record(url, 0, skipped)
+                    return resp.status, None, resp.headers
+                body = bytearray()
+                try:
+                    async for chunk in resp.content.iter_chunked(CHUNK_BYTES):
+                        body += chunk
+                        check_size(len(body), self.max_bytes)
+                except TooLarge:
+                    self.record(url, self.max_bytes, "too_large")
+                    return resp.status, None, resp.headers
+        self.record(url, len(body))
+        return resp.status, decode_html(bytes(body), resp.headers.get("Content-Type")), resp.headers
+
+    async def _worker(self, session):
+        while not self.stopped.is_set():
+            # one max_pages slot per url in flight or already kept, so the best
+            # queued urls are fetched rather than the first discovered
+            item = self.frontier.pop() if self.reserved < self.max_pages else None
+            if item is None:
+                if self.in_flight == 0:
+                    return
+                self.wakeup.clear()
+                await self.wakeup.wait()  # until a fetch finishes, queueing links or freeing its slot
+                continue
+            self.reserved += 1
+            self.in_flight += 1
+            try:
+                await self._process(session, *item)
+            finally:
+                self.in_flight -= 1
+                self.wakeup.set()
+
+    async def _process(self, session, url, depth):
+        self.logger.info(f"[Depth {depth}] Crawling: {url}")
+        links = None
+        try:
+            links = await self._fetch_page(session, url)
+        finally:
+            if links is None:
+                # the max_pages slot reserved for this url produced no page
+                self.reserved -= 1
+        if links:
+            self.enqueue(links, depth + 1)
+        if self.finish(url):
+            # SQLite and manifest writes are blocking; keep them off the event loop
+            await asyncio.to_thread(self.save_checkpoint)
+
+    async def _fetch_page(self, session, url):
+        """Fetch and record one page; returns its links, or None if it was not kept."""
+        if non_html_extension(url):
+            self.record(url, 0, "extension")
+            return None
+        try:
+            status, html, headers = await self.fetch(session, url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.error(f"Error fetching {url}: {e}")
+            self.record(url, 0, "error")
+            return None
+        if status == 304 and self.manifest is not None:
+            self.record(url)
+            return self.not_modified(url)
+        if status != 200:
+            self.logger.warning(f"Non-200 status for {url}: {status}")
+            self.record(url, 0, f"http_{status}")
+            return None
+        if html is None:
+            return None
+        if self.is_unchanged(url, content_hash(html)):
+            return self.not_modified(url)
+        # HTML parsing and disk writes are blocking; keep them off the event loop
+        with timed("parse", items=1):
+            doc = await asyncio.get_running_loop().run_in_executor(self.parse_pool, extract, html, url)
+        return await asyncio.to_thread(self.store_page, url, html, headers, doc)
+
+    async def crawl(self):
+        self.reserved = self.page_count()  # pages restored from a checkpoint count against max_pages
+        self.in_flight = 0
+        self.wakeup = asyncio.Event()
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=10)
+        headers = {"User-Agent": "RAG-WebCrawler/1.0"}  # per-request headers add Accept-Encoding
+        if self.parse_workers > 0:
+            self.parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        try:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+                await asyncio.gather(*(self._worker(session) for _ in range(self.concurrency)))
+        finally:
+            if self.parse_pool is not None:
+                self.parse_pool.shutdown()
+                self.parse_pool = None
+
+    def start(self):
+        self.logger.info(f"Starting async crawl with {self.concurrency} workers...")
+        t0 = time.time()
+        self.seed()
+        asyncio.run(self.crawl())
+        result = self.summary()
+        result["elapsed_s"] = round(time.time() - t0, 3)
+        return result
@@ -0,0 +1,129 @@
+# crawler/checkpoint.py
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlparse
+
+CHECKPOINT_DIR = "data/crawls"
+
+QUEUED = "queued"
+CHANGED = "changed"      # fetched and kept (new or changed content)
+UNCHANGED = "unchanged"  # 304 or identical to the manifest
+FAILED = "failed"        # fetched, nothing kept (errors, non-200)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    depth INTEGER NOT NULL,
+    priority REAL NOT NULL,
+    status TEXT NOT NULL,
+    doc BLOB
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class CrawlCheckpoint:
+    """
+    On-disk state of one site's crawl, so a crawl that dies can resume: every URL
+    admitted to the frontier with its depth and priority (insertion order is the
+    rowid), its status, and the extracted doc of each kept page. One SQLite file
+    per site under data/crawls.
+
+    Changes are buffered and written in one transaction by flush(); the crawler
+    calls it (with the manifest save) whenever due() reports `interval_s` seconds
+    have passed since the last one. A page is buffered only once done()
+    is called for it, after its links are queued, so a checkpoint never records a
+    page as fetched without the links it led to. Whatever was not yet flushed when
+    the process died is fetched again on resume.
+    """
+
+    def __init__(self, start_url, checkpoint_dir=CHECKPOINT_DIR, interval_s=5.0):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        domain = urlparse(start_url).netloc.replace(":", "_") or "default"
+        self.path = os.path.join(checkpoint_dir, f"{domain}.sqlite")
+        self.interval_s = interval_s
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.lock = threading.Lock()  # buffers
+        self.db_lock = threading.Lock()  # connection
+        self.new = []  # [(url, depth, priority)]
+        self.fetched = {}  # {url: (status, doc)} -- waiting for done()
+        self.finished = []  # [(status, doc blob, url)]
+        self.last_flush = time.monotonic()
+        self.flushes = 0
+
+    def meta(self):
+        with self.db_lock:
+            return dict(self.conn.execute("SELECT key, value FROM meta"))
+
+    def resumable(self, start_url):
+        """True if an unfinished crawl of `start_url` is on disk."""
+        meta = self.meta()
+        return meta.get("start_url") == start_url and meta.get("state") in ("running", "stopped")
+
+    def reset(self, start_url):
+        """Forget any earlier crawl and start recording a new one."""
+        with self.lock:
+            self.new, self.fetched, self.finished = [], {}, []
+        with self.db_lock, self.conn:
+            self.conn.execute("DELETE FROM urls")
+            self.conn.execute("DELETE FROM meta")
+            self.conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                                  [("start_url", start_url), ("state", "running"), ("started", str(time.time()))])
+
+    def rows(self):
+        """Yields (url, depth, priority, status, doc) in the order URLs were admitted."""
+        with self.db_lock:
+            rows = self.conn.execute("SELECT url, depth, priority, status, doc FROM urls ORDER BY rowid").fetchall()
+        for url, depth, priority, status, doc in rows:
+            yield url, depth, priority, status, json.loads(zlib.decompress(doc)) if doc else None
+
+    def mark_running(self):
+        self._set_state("running")
+
+    def queued(self, url, depth, priority):
+        with self.lock:
+            self.new.append((url, depth, priority))
+
+    def fetch_done(self, url, status, doc=None):
+        """Record the outcome of fetching `url`; it is flushed once done(url) is called."""
+        with self.lock:
+            self.fetched[url] = (status, doc)
+
+    def done(self, url):
+        """`url` and the links it led to are all queued; its outcome can be flushed."""
+        with self.lock:
+            status, doc = self.fetched.pop(url, (FAILED, None))
+            blob = zlib.compress(json.dumps(doc).encode("utf-8"), 1) if doc is not None else None
+            self.finished.append((status, blob, url))
+
+    def due(self):
+        return time.monotonic() - self.last_flush >= self.interval_s
+
+    def flush(self):
+        with self.lock:
+            new, finished = self.new, self.finished
+            self.new, self.finished = [], []
+            self.last_flush = time.monotonic()
+        with self.db_lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO urls (url, depth, priority, status) VALUES (?, ?, ?, 'queued')", new)
+            self.conn.executemany("UPDATE urls SET status = ?, doc = ? WHERE url = ?", finished)
+        self.flushes += 1
+
+    def close(self, finished=True):
+        """Final flush and close; a finished crawl is no longer resumable."""
+        self.flush()
+        self._set_state("finished" if finished else "stopped")
+        with self.db_lock:
+            self.conn.close()
+
+    def _set_state(self, state):
+        with self.db_lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('state', ?)", (state,))
@@ -1,17 +1,47 @@
 # crawler/crawler.py
-import os
+import threading
 import time
+from collections import Counter
 import requests
 from urllib.parse import urlparse, urljoin
-from bs4 import BeautifulSoup
 from urllib import robotparser
-import hashlib
-import re
 from utils.logger import get_logger
+from utils.metrics import timed
+from crawler.manifest import content_hash
+from crawler.checkpoint import CHANGED, UNCHANGED, QUEUED
+from crawler.extractor import extract, extract_links
+from crawler.fetch import (ACCEPT_ENCODING, CHUNK_BYTES, TooLarge, decode_html, header_skip, non_html_extension,
+                           read_capped)
+from crawler.pagestore import PageStore
+from crawler.frontier import (Frontier, canonicalize, discover_sitemap, link_priority, sitemap_priority,
+                              SEED_PRIORITY, SITEMAP_DEPTH)
 
 class WebCrawler:
-    def __init__(self, start_url, max_depth=2, max_pages=200, delay=0.5, output_dir="data/raw_html"):
-        self.start_url = start_url.rstrip("/")
+    """
+    Fetches pages one at a time from a priority frontier (crawler/frontier.py):
+    the start URL first, then sitemap.xml entries (most recently modified first),
+    then pages found through links, shallowest first. URLs are canonicalized so
+    each page is fetched once however it is spelled.
+
+    Fetched HTML goes to `store`, a PageStore (crawler/pagestore.py), by default
+    one under `output_dir` (None keeps no raw HTML); with `keep_pages` the
+    extracted docs are also kept in memory, in `parsed`.
+
+    With a `checkpoint` (crawler/checkpoint.py CrawlCheckpoint) the frontier and
+    every page's outcome are saved as the crawl goes; `resume` continues an
+    unfinished crawl of the same start URL from there instead of starting over.
+
+    Bodies are streamed (crawler/fetch.py): links to non-HTML files are not
+    requested, non-HTML responses and ones over `max_bytes` are dropped on their
+    headers, a body that grows past `max_bytes` is cut off, and the charset comes
+    from the headers or the page. Bytes read and skip reasons per URL are in
+    `fetches`.
+    """
+
+    def __init__(self, start_url, max_depth=2, max_pages=200, delay=0.5, output_dir="data/raw_html", manifest=None,
+                 on_page=None, keep_pages=True, sitemap=True, sitemap_max_urls=50000, checkpoint=None, resume=False,
+                 store=None, max_bytes=5 * 1024 * 1024):
+        self.start_url = canonicalize(start_url) or start_url.rstrip("/")
         parsed = urlparse(self.start_url)
         self.scheme = parsed.scheme or "http"
         self.domain = parsed.netloc
@@ -19,10 +49,24 @@ class WebCrawler:
         self.max_pages = max_pages
         self.delay = delay
         self.output_dir = output_dir
-        self.visited = set()
-        self.pages = {}  # {url: html}
-
-        os.makedirs(self.output_dir, exist_ok=True)
+        self.store = store if store is not None else PageStore(output_dir) if output_dir else None
+        self.frontier = Frontier()
+        self.visited = self.frontier.seen  # fingerprints of every URL admitted to the frontier
+        self.sitemap = sitemap  # seed the frontier from the site's sitemaps
+        self.sitemap_max_urls = sitemap_max_urls
+        self.unchanged = set()  # urls whose content matches the manifest
+        self.parsed = {}  # {url: parsed doc} -- extracted in the same pass as links
+        self.manifest = manifest  # optional CrawlManifest for conditional recrawls
+        self.on_page = on_page  # optional callback(doc) for every new/changed page
+        self.keep_pages = keep_pages  # False: hand pages to on_page only, hold nothing
+        self.changed_urls = []
+        self.max_bytes = max_bytes  # body size cap; 0 or None for no cap
+        self.fetches = {}  # {url: (body bytes read, skip reason or None)}
+        self.checkpoint = checkpoint
+        self.resume = resume
+        self.resumed = None  # {"pages", "queued"} restored from the checkpoint
+        self.checkpoint_lock = threading.Lock()
+        self.stopped = threading.Event()  # set (e.g. by a cancelled job) to end the crawl early
 
         self.logger=get_logger("crawler")
         self.logger.info(f"Initializing crawler for {self.start_url}")
@@ -32,7 +76,8 @@ class WebCrawler:
         robots_url = urljoin(self.start_url, "/robots.txt")
         self.rp.set_url(robots_url)
         try:
-            self.rp.read()
+            with timed("robots"):
+                self.rp.read()
             self.logger.info(f"Loaded robots.txt from {robots_url}")
         except Exception as e:
             self.logger.warning(f"Could not read robots.txt: {e}")
@@ -47,7 +92,8 @@ class WebCrawler:
             self.logger.warning(f"robots.txt unreadable — skipping {url}")
             return False
         try:
-            allowed = self.rp.can_fetch("*", url)
+            with timed("robots"):
+                allowed = self.rp.can_fetch("*", url)
             if not allowed:
                 self.logger.warning(f"Blocked by robots.txt: {url}")
             return allowed
@@ -59,76 +105,264 @@ class WebCrawler:
         p = urlparse(url)
         return p.netloc == self.domain or (p.netloc == "" and p.path)
 
-    def save_html(self, url, html):
-        name = re.sub(r'[\\/*?:"<>|]', "_", url)
-        name = name.replace("://", "_").replace("/", "_")
-        name = name[:200]  # optional: limit length
-        path = os.path.join(self.output_dir, f"{name}.html")
-    
-    # Save the file
-        with open(path, "w", encoding="utf-8") as f:
-         f.write(html)
-    
-    # Log saved path
-        self.logger.info(f"Saved {url} → {path}")
-   # print("Before")
+    def save_html(self, url, html, digest=None):
+        if self.store is not None:
+            with timed("store", items=1):
+                self.store.put(url, html, digest)
 
     def get_links(self, html, base_url):
-        soup = BeautifulSoup(html, "html.parser")
-        links = set()
-        for a in soup.find_all("a", href=True):
-            href = a.get("href")
-            if href is None or href.strip() == "":
-                continue
-            full = urljoin(base_url, href.split("#")[0])
-            parsed = urlparse(full)
-            if parsed.scheme not in ("http", "https"):
-                continue
-            if self.is_same_domain(full) and self.is_allowed(full):
-                links.add(full.rstrip("/"))
-        return links
+        return self.filter_links(extract_links(html, base_url))
+
+    def filter_links(self, links):
+        return {link for link in links if self.is_same_domain(link) and self.is_allowed(link)}
     
     #print("After")
 
-    def crawl_page(self, url, depth):
-        """Recursively crawl pages within allowed depth and domain."""
-        if len(self.pages) >= self.max_pages or depth > self.max_depth or url in self.visited:
-            return
+    def page_count(self):
+        return len(self.changed_urls) + len(self.unchanged)
 
-        if not self.is_allowed(url):
-            self.visited.add(url)
-            return
+    def request_headers(self, url):
+        headers = {"User-Agent": "RAG-WebCrawler/1.0", "Accept-Encoding": ACCEPT_ENCODING,
+                   "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.1"}
+        if self.manifest is not None:
+            headers.update(self.manifest.conditional_headers(url))
+        return headers
 
-        self.visited.add(url)
-        self.logger.info(f"[Depth {depth}] Crawling: {url}")
+    def record(self, url, size=0, skipped=None):
+        """Log a fetch of `url`: body bytes read and, if the page was not kept, why."""
+        self.fetches[url] = (size, skipped)
+        if skipped:
+            self.logger.info(f"Skipped {url}: {skipped}")
 
+    def not_modified(self, url):
+        """Handle a 304 (or identical content): keep the page, reuse its links from the manifest."""
+        self.unchanged.add(url)
+        self.manifest.touch(url)
+        if self.checkpoint is not None:
+            self.checkpoint.fetch_done(url, UNCHANGED)
+        self.logger.info(f"Not modified: {url}")
+        return set(self.manifest.links(url))
+
+    def is_unchanged(self, url, digest):
+        return self.manifest is not None and self.manifest.is_unchanged(url, digest)
+
+    def store_page(self, url, html, headers, doc=None):
+        """
+        Record a fetched page and return its links. `doc` is the extract() result when
+        the caller already parsed the page elsewhere (e.g. in a process pool).
+        """
+        digest = content_hash(html)
+        if self.is_unchanged(url, digest):
+            return self.not_modified(url)
+        if doc is None:
+            with timed("parse", items=1):
+                doc = extract(html, url)
+        links = self.filter_links(doc.pop("links"))
+        if self.manifest is not None:
+            self.manifest.update(url, digest, links, etag=headers.get("ETag"),
+                                 last_modified=headers.get("Last-Modified"))
+        self.changed_urls.append(url)
+        if self.checkpoint is not None:
+            # with a page store the doc is re-extracted from it on resume
+            self.checkpoint.fetch_done(url, CHANGED, doc if self.store is None else None)
+        if self.keep_pages:
+            self.parsed[url] = doc
+        self.save_html(url, html, digest)
+        if self.on_page is not None:
+            self.on_page(doc)
+        return links
+
+    def fetch_bytes(self, url):
+        """Body of a plain GET (sitemaps), or None on any failure."""
         try:
-            resp = requests.get(url, timeout=10, headers={"User-Agent": "RAG-WebCrawler/1.0"})
-            if resp.status_code != 200:
-                self.logger.warning(f"Non-200 status for {url}: {resp.status_code}")
-                return
-
-            html = resp.text
-            self.pages[url] = html
-            self.save_html(url, html)
-            time.sleep(self.delay)
+            with timed("fetch", items=1):
+                resp = requests.get(url, timeout=10, headers={"User-Agent": "RAG-WebCrawler/1.0"})
+        except requests.exceptions.RequestException as e:
+            self.logger.warning(f"Error fetching {url}: {e}")
+            return None
+        return resp.content if resp.status_code == 200 else None
+
+    def sitemap_urls(self):
+        """Sitemaps listed in robots.txt, or /sitemap.xml when it lists none."""
+        listed = self.rp.site_maps() if self.rp is not None else None
+        return listed or [urljoin(self.start_url + "/", "/sitemap.xml")]
+
+    def push(self, url, depth, priority=None):
+        """Admit `url` to the frontier (recording it in the checkpoint); its canonical form, or None if seen."""
+        priority = link_priority(depth) if priority is None else priority
+        url = self.frontier.push(url, depth, priority)
+        if url and self.checkpoint is not None:
+            self.checkpoint.queued(url, depth, priority)
+        return url
+
+    def seed(self):
+        """
+        Queue the start URL and, when enabled, the same-site URLs of its sitemaps;
+        or, when resuming, the frontier and pages saved by the checkpoint.
+        """
+        if self.checkpoint is not None:
+            if self.resume and self.checkpoint.resumable(self.start_url):
+                return self.restore()
+            self.checkpoint.reset(self.start_url)
+        if self.is_allowed(self.start_url):
+            self.push(self.start_url, 0, SEED_PRIORITY)
+        if not self.sitemap or self.max_depth < SITEMAP_DEPTH:
+            return
+        with timed("sitemap"):
+            entries = discover_sitemap(self.fetch_bytes, self.sitemap_urls(), self.sitemap_max_urls)
+        allowed = self.filter_links(canonicalize(loc) for loc, _, _ in entries)
+        now = time.time()
+        for loc, priority, lastmod in entries:
+            loc = canonicalize(loc)
+            if loc in allowed and self.push(loc, SITEMAP_DEPTH, sitemap_priority(priority, lastmod, now)):
+                self.frontier.sitemap_urls += 1
+        self.logger.info(f"Seeded {self.frontier.sitemap_urls} URLs from sitemaps")
 
-            links = self.get_links(html, url)
+    def restore(self):
+        """Rebuild the frontier and the kept pages from the checkpoint; fetched pages are not fetched again."""
+        pages = 0
+        for url, depth, priority, status, doc in self.checkpoint.rows():
+            if status == QUEUED:
+                self.frontier.push(url, depth, priority)
+                continue
+            self.frontier.seen.add(url)
+            pages += status in (CHANGED, UNCHANGED)
+            if status == UNCHANGED:
+                self.unchanged.add(url)
+            elif status == CHANGED:
+                self.changed_urls.append(url)
+                if doc is None and (self.keep_pages or self.on_page is not None):
+                    doc = self.stored_doc(url)
+                if doc is None:
+                    continue
+                if self.keep_pages:
+                    self.parsed[url] = doc
+                if self.on_page is not None:
+                    self.on_page(doc)
+        self.checkpoint.mark_running()
+        self.resumed = {"pages": pages, "queued": len(self.frontier)}
+        self.logger.info(f"Resumed crawl of {self.start_url}: {pages} pages done, {len(self.frontier)} queued")
+
+    def stored_doc(self, url):
+        """extract() of the page's saved HTML, without links; None if it is not in the store."""
+        html = self.store.get(url) if self.store is not None else None
+        if html is None:
+            return None
+        doc = extract(html, url)
+        doc.pop("links")
+        return doc
+
+    def enqueue(self, links, depth):
+        if depth <= self.max_depth:
             for link in links:
-                if len(self.pages) >= self.max_pages:
-                    break
-                self.crawl_page(link, depth + 1)
+                self.push(link, depth)
+
+    def finish(self, url):
+        """
+        `url` was fetched and its links queued: let the checkpoint record it. True
+        if a checkpoint is due (see save_checkpoint).
+        """
+        if self.checkpoint is None:
+            return False
+        self.checkpoint.done(url)
+        return self.checkpoint.due()
 
+    def save_checkpoint(self):
+        """Write the checkpoint and the manifest; skipped if another thread is already writing them."""
+        if not self.checkpoint_lock.acquire(blocking=False):
+            return
+        try:
+            with timed("checkpoint"):
+                if self.manifest is not None:
+                    self.manifest.save()
+                self.checkpoint.flush()
+        finally:
+            self.checkpoint_lock.release()
+
+    def fetch(self, url):
+        """
+        Returns (status, html, headers); html is None unless status is 200 and the
+        body is HTML within max_bytes (skips are recorded here).
+        """
+        with timed("fetch", items=1):
+            with requests.get(url, timeout=10, headers=self.request_headers(url), stream=True) as resp:
+                if resp.status_code != 200:
+                    return resp.status_code, None, resp.headers
+                # closing the response unread drops the connection instead of downloading the body
+                skipped = header_skip(resp.headers, self.max_bytes)
+                if skipped:
+                    self.record(url, 0, skipped)
+                    return resp.status_code, None, resp.headers
+                try:
+                    body = read_capped(resp.iter_content(CHUNK_BYTES), self.max_bytes)
+                except TooLarge:
+                    self.record(url, self.max_bytes, "too_large")
+                    return resp.status_code, None, resp.headers
+        self.record(url, len(body))
+        return resp.status_code, decode_html(body, resp.headers.get("Content-Type")), resp.headers
+
+    def crawl_page(self, url, depth):
+        """Fetch and record one page; returns its links (empty if it was not kept)."""
+        self.logger.info(f"[Depth {depth}] Crawling: {url}")
+        if non_html_extension(url):
+            self.record(url, 0, "extension")
+            return set()
+        try:
+            status, html, headers = self.fetch(url)
+            if status == 304 and self.manifest is not None:
+                self.record(url)
+                links = self.not_modified(url)
+            elif status != 200:
+                self.logger.warning(f"Non-200 status for {url}: {status}")
+                self.record(url, 0, f"http_{status}")
+                return set()
+            elif html is None:
+                return set()
+            else:
+                links = self.store_page(url, html, headers)
+            time.sleep(self.delay)
+            return links
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Error fetching {url}: {e}")
+            self.record(url, 0, "error")
+            return set()
+
+    def crawl(self):
+        while self.page_count() < self.max_pages and not self.stopped.is_set():
+            item = self.frontier.pop()
+            if item is None:
+                break
+            url, depth = item
+            self.enqueue(self.crawl_page(url, depth), depth + 1)
+            if self.finish(url):
+                self.save_checkpoint()
 
     def start(self):
         self.logger.info("Starting crawl...")
-        self.crawl_page(self.start_url, 0)
-        self.logger.info(f"Crawl finished. Pages: {len(self.pages)}, Skipped: {len(self.visited) - len(self.pages)}")
+        self.seed()
+        self.crawl()
+        return self.summary()
+
+    def summary(self):
+        if self.manifest is not None:
+            self.manifest.save()
+        if self.checkpoint is not None:
+            # a stopped (cancelled) crawl stays resumable
+            self.checkpoint.close(finished=not self.stopped.is_set())
+        fetched = self.page_count()
+        skipped = len(self.visited) - len(self.frontier) - fetched  # fetched but not kept (errors, non-200, skips)
+        fetches = dict(self.fetches)
+        self.logger.info(f"Crawl finished. Pages: {fetched}, Changed: {len(self.changed_urls)}, Skipped: {skipped}")
 
         return {
-            "page_count": len(self.pages),
-            "skipped_count": len(self.visited) - len(self.pages),
-            "urls": list(self.pages.keys())
+            "page_count": fetched,
+            "skipped_count": skipped,
+            "changed_count": len(self.changed_urls),
+            "unchanged_count": len(self.unchanged),
+            "frontier": self.frontier.stats(),
+            "resumed": self.resumed,
+            "fetched_bytes": sum(size for size, _ in fetches.values()),
+            "skip_reasons": dict(Counter(reason for _, reason in fetches.values() if reason)),
+            "fetches": [{"url": url, "bytes": size, "skipped": reason} for url, (size, reason) in fetches.items()],
+            "urls": self.changed_urls + sorted(self.unchanged)
         }
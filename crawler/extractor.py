@@ -0,0 +1,61 @@
+# crawler/extractor.py
+import re
+from urllib.parse import urlparse, urljoin
+import lxml.html
+from lxml import etree
+from crawler.frontier import canonicalize
+
+IGNORED = ("script", "style", "noscript", "iframe", "header", "footer", "nav")
+
+_PARSER = lxml.html.HTMLParser(encoding="utf-8", remove_comments=True, remove_pis=True)
+_WS = re.compile(r"\s+")
+
+
+def _tree(html: str):
+    try:
+        return lxml.html.document_fromstring(html.encode("utf-8", errors="replace"), parser=_PARSER)
+    except (etree.ParserError, ValueError):
+        return None
+
+
+def _resolve(hrefs, base_url):
+    links = set()
+    for href in hrefs:
+        href = href.strip()
+        if not href:
+            continue
+        try:
+            full = canonicalize(urljoin(base_url, href.split("#")[0]))
+        except ValueError:  # malformed, e.g. an unbalanced IPv6 bracket
+            continue
+        if full:
+            links.add(full)
+    return links
+
+
+def extract(html: str, url: str) -> dict:
+    """
+    Single lxml pass over a page: absolute links (taken before site chrome is
+    stripped, so nav menus still feed the crawler), title and cleaned text.
+    Returns the HTMLParser.parse_html dict plus a "links" list.
+    """
+    doc = {"url": url, "domain": urlparse(url).netloc, "title": "", "content": "", "links": []}
+    tree = _tree(html)
+    if tree is None:
+        return doc
+
+    doc["links"] = sorted(_resolve(tree.xpath("//a/@href"), url))
+    title = tree.find(".//title")
+    if title is not None and title.text:
+        doc["title"] = title.text.strip()
+
+    etree.strip_elements(tree, *IGNORED, with_tail=False)
+    doc["content"] = _WS.sub(" ", " ".join(tree.itertext())).strip()
+    return doc
+
+
+def extract_links(html: str, base_url: str) -> set:
+    tree = _tree(html)
+    if tree is None:
+        return set()
+    return _resolve(tree.xpath("//a/@href"), base_url)
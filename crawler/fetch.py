@@ -0,0 +1,101 @@
+# crawler/fetch.py
+"""
+What both crawlers check while fetching a page: content type and size from the
+response headers (before any of the body is read), a byte cap while the body
+streams in, and the body's character encoding, taken from the headers or the
+document itself instead of statistical detection.
+"""
+import codecs
+import importlib.util
+import re
+from urllib.parse import urlsplit
+
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+# links to these are not HTML pages; skip them without a request
+NON_HTML_EXTENSIONS = {
+    "pdf", "jpg", "jpeg", "png", "gif", "webp", "svg", "ico", "bmp", "tif", "tiff", "mp3", "mp4", "m4a", "avi",
+    "mov", "webm", "wav", "ogg", "zip", "gz", "tgz", "bz2", "xz", "7z", "rar", "tar", "exe", "dmg", "msi", "iso",
+    "apk", "bin", "doc", "docx", "xls", "xlsx", "ppt", "pptx", "odt", "css", "js", "woff", "woff2", "ttf", "eot",
+    "json", "xml", "rss", "csv",
+}
+# requests (urllib3) and aiohttp decode br only when a brotli package is installed
+BROTLI = any(importlib.util.find_spec(name) for name in ("brotli", "brotlicffi"))
+ACCEPT_ENCODING = "gzip, deflate, br" if BROTLI else "gzip, deflate"
+CHUNK_BYTES = 64 * 1024
+SNIFF_BYTES = 4096
+
+_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_.:-]+)""", re.I)
+_BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+
+
+class TooLarge(Exception):
+    pass
+
+
+def non_html_extension(url):
+    name = urlsplit(url).path.rsplit("/", 1)[-1]
+    return "." in name and name.rsplit(".", 1)[-1].lower() in NON_HTML_EXTENSIONS
+
+
+def header_skip(headers, max_bytes):
+    """Why a 200 response should not be read, judging by its headers; None to read it."""
+    content_type = headers.get("Content-Type", "").split(";")[0].strip().lower()
+    if content_type and content_type not in HTML_TYPES:
+        return "content_type"
+    try:
+        length = int(headers.get("Content-Length") or 0)
+    except ValueError:
+        length = 0
+    # the (possibly compressed) length only bounds the body from below
+    if max_bytes and length > max_bytes:
+        return "too_large"
+    return None
+
+
+def check_size(size, max_bytes):
+    if max_bytes and size > max_bytes:
+        raise TooLarge(f"body exceeds {max_bytes} bytes")
+
+
+def read_capped(chunks, max_bytes):
+    """Joins the (decompressed) body chunks; raises TooLarge as soon as they pass `max_bytes`."""
+    body = bytearray()
+    for chunk in chunks:
+        body += chunk
+        check_size(len(body), max_bytes)
+    return bytes(body)
+
+
+def _codec(name):
+    try:
+        return codecs.lookup(name.decode("ascii") if isinstance(name, bytes) else name).name
+    except (LookupError, UnicodeDecodeError):
+        return None
+
+
+def decode_html(body, content_type=""):
+    """
+    Text of an HTML body: charset from the Content-Type header, else a byte order
+    mark, else a <meta charset> near the top, else UTF-8 if it decodes, else
+    windows-1252 (what browsers assume for undeclared pages).
+    """
+    encoding = None
+    for param in (content_type or "").split(";")[1:]:
+        key, _, value = param.partition("=")
+        if key.strip().lower() == "charset":
+            encoding = _codec(value.strip().strip('"\''))
+    if encoding is None:
+        for bom, name in _BOMS:
+            if body.startswith(bom):
+                encoding = name
+                break
+    if encoding is None:
+        match = _CHARSET_RE.search(body[:SNIFF_BYTES])
+        if match:
+            encoding = _codec(match.group(1))
+    if encoding is None:
+        try:
+            return body.decode("utf-8")
+        except UnicodeDecodeError:
+            encoding = "cp1252"
+    return body.decode(encoding, errors="replace")
@@ -0,0 +1,73 @@
+# crawler/manifest.py
+import hashlib
+import json
+import os
+import time
+from urllib.parse import urlparse
+
+MANIFEST_DIR = "data/manifest"
+
+
+def content_hash(html: str) -> str:
+    return hashlib.sha256(html.encode("utf-8", errors="replace")).hexdigest()
+
+
+class CrawlManifest:
+    """
+    Per-URL record of what was fetched last time: ETag, Last-Modified, content hash,
+    fetch time and outgoing links. One JSON file per site under data/manifest.
+
+    The links let a recrawl keep traversing through pages that answered 304 Not
+    Modified, since those responses carry no body to extract links from.
+    """
+
+    def __init__(self, start_url, manifest_dir=MANIFEST_DIR):
+        os.makedirs(manifest_dir, exist_ok=True)
+        domain = urlparse(start_url).netloc.replace(":", "_") or "default"
+        self.path = os.path.join(manifest_dir, f"{domain}.json")
+        self.entries = {}  # {url: {etag, last_modified, hash, fetched_at, links}}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def clear(self):
+        self.entries = {}
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def conditional_headers(self, url) -> dict:
+        entry = self.entries.get(url)
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def links(self, url) -> list:
+        return self.entries.get(url, {}).get("links", [])
+
+    def is_unchanged(self, url, digest) -> bool:
+        return self.entries.get(url, {}).get("hash") == digest
+
+    def update(self, url, digest, links, etag=None, last_modified=None):
+        self.entries[url] = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "hash": digest,
+            "fetched_at": time.time(),
+            "links": sorted(links),
+        }
+
+    def touch(self, url):
+        if url in self.entries:
+            self.entries[url]["fetched_at"] = time.time()
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            # a copy: checkpoints save while fetcher threads keep updating entries
+            json.dump(dict(self.entries), f)
+        os.replace(tmp, self.path)
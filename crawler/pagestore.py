@@ -0,0 +1,185 @@
+# crawler/pagestore.py
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from crawler.manifest import content_hash
+
+PAGE_STORE_DIR = "data/raw_html"
+# record: magic, raw length, compressed length, sha256 of the page, then the zlib payload
+RECORD = struct.Struct("<4sII32s")
+MAGIC = b"RPG1"
+COMPRESS_LEVEL = 6
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    fetched_at REAL
+);
+CREATE TABLE IF NOT EXISTS last_crawl (
+    url TEXT PRIMARY KEY
+);
+"""
+
+
+class PageStore:
+    """
+    Raw HTML of crawled pages in append-only, zlib-compressed segment files
+    (segment-NNNNN.bin, rolled over at `segment_mb`), addressed by the page's
+    content hash: a page seen again, under the same or another URL, is stored
+    once. index.sqlite maps each URL to the hash of its latest content and each
+    hash to its record's segment and offset, and keeps the URLs the last crawl
+    kept (set_crawl), which is what a rebuild from the store should cover.
+
+    Every record carries its own header (lengths and hash), so segments can be
+    scanned without the index. Reads go through a memory map of the segment and
+    decompress one record. Replaced content is not reclaimed.
+    """
+
+    def __init__(self, root, segment_mb=256):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.segment_bytes = segment_mb * 1024 * 1024
+        self.conn = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.lock = threading.Lock()
+        self.maps = {}  # {segment: mmap}
+        segments = sorted(int(name[8:13]) for name in os.listdir(root)
+                          if name.startswith("segment-") and name.endswith(".bin"))
+        self.segment = segments[-1] if segments else 0
+        self.file = None
+
+    def _path(self, segment):
+        return os.path.join(self.root, f"segment-{segment:05d}.bin")
+
+    def _append(self, data):
+        """Writes one record to the active segment; returns (segment, offset of the payload)."""
+        if self.file is None:
+            self.file = open(self._path(self.segment), "ab")
+        if self.file.tell() and self.file.tell() + len(data) > self.segment_bytes:
+            self.file.close()
+            self.segment += 1
+            self.file = open(self._path(self.segment), "ab")
+        offset = self.file.tell()
+        self.file.write(data)
+        self.file.flush()
+        return self.segment, offset + RECORD.size
+
+    def put(self, url, html, digest=None):
+        """Store `html` as the current content of `url`; returns its content hash."""
+        digest = digest or content_hash(html)
+        record = None
+        if not self._known(digest):
+            # compress outside the lock so fetcher threads do not queue behind each other
+            raw = html.encode("utf-8", errors="replace")
+            payload = zlib.compress(raw, COMPRESS_LEVEL)
+            record = (RECORD.pack(MAGIC, len(raw), len(payload), bytes.fromhex(digest)) + payload,
+                      len(payload), len(raw))
+        with self.lock, self.conn:
+            if record is not None and not self._known(digest, locked=True):
+                data, length, size = record
+                segment, offset = self._append(data)
+                self.conn.execute("INSERT INTO blobs VALUES (?, ?, ?, ?, ?)", (digest, segment, offset, length, size))
+            self.conn.execute("INSERT OR REPLACE INTO urls VALUES (?, ?, ?)", (url, digest, time.time()))
+        return digest
+
+    def _known(self, digest, locked=False):
+        if not locked:
+            with self.lock:
+                return self._known(digest, locked=True)
+        return self.conn.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone() is not None
+
+    def _map(self, segment, end):
+        mm = self.maps.get(segment)
+        if mm is None or len(mm) < end:  # the active segment grew since it was mapped
+            if mm is not None:
+                mm.close()
+            with open(self._path(segment), "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[segment] = mm
+        return mm
+
+    def read(self, digest):
+        """The page with content hash `digest`, or None."""
+        with self.lock:
+            row = self.conn.execute("SELECT segment, offset, length FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                return None
+            segment, offset, length = row
+            payload = self._map(segment, offset + length)[offset:offset + length]
+        return zlib.decompress(payload).decode("utf-8", errors="replace")
+
+    def get(self, url):
+        """The latest stored HTML of `url`, or None."""
+        digest = self.digest(url)
+        return self.read(digest) if digest else None
+
+    def digest(self, url):
+        with self.lock:
+            row = self.conn.execute("SELECT digest FROM urls WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def urls(self):
+        with self.lock:
+            return [url for url, in self.conn.execute("SELECT url FROM urls ORDER BY rowid")]
+
+    def set_crawl(self, urls, merge=False):
+        """
+        Record `urls` as the pages of the last crawl. merge=True adds them to the
+        recorded set instead, for a crawl that stopped before it saw the whole site.
+        """
+        with self.lock, self.conn:
+            if not merge:
+                self.conn.execute("DELETE FROM last_crawl")
+            self.conn.executemany("INSERT OR IGNORE INTO last_crawl VALUES (?)", [(url,) for url in urls])
+
+    def crawl_urls(self):
+        """URLs of the last recorded crawl, in the order they were recorded ([] if none was)."""
+        with self.lock:
+            return [url for url, in self.conn.execute("SELECT url FROM last_crawl ORDER BY rowid")]
+
+    def items(self, urls=None):
+        """Yields (url, html) for `urls` (default: every stored URL), one page in memory at a time."""
+        for url in self.urls() if urls is None else urls:
+            html = self.get(url)
+            if html is not None:
+                yield url, html
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def __contains__(self, url):
+        return self.digest(url) is not None
+
+    def stats(self):
+        with self.lock:
+            blobs, raw, stored = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length), 0) FROM blobs").fetchone()
+            urls = self.conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+        disk = sum(os.path.getsize(self._path(s)) for s in range(self.segment + 1) if os.path.exists(self._path(s)))
+        return {"urls": urls, "pages": blobs, "raw_mb": round(raw / 1e6, 2), "stored_mb": round(stored / 1e6, 2),
+                "segments_mb": round(disk / 1e6, 2), "segments": self.segment + 1}
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            for mm in self.maps.values():
+                mm.close()
+            self.maps = {}
+            self.conn.close()
@@ -1,12 +1,30 @@
 # crawler/parser.py
 import re
+from concurrent.futures import ProcessPoolExecutor
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse
+from crawler import extractor
 
 class HTMLParser:
-    IGNORED = {"script", "style", "noscript", "iframe", "header", "footer", "nav"}
+    IGNORED = set(extractor.IGNORED)
+
+    def __init__(self, backend="lxml", workers=0):
+        """
+        backend: "lxml" (single-pass C parser, see crawler/extractor.py) or "bs4"
+        (the original BeautifulSoup html.parser path, kept for comparison).
+        workers: parse_multiple fans out over a process pool when > 1.
+        """
+        self.backend = backend
+        self.workers = workers
 
     def parse_html(self, html: str, url: str) -> dict:
+        if self.backend == "bs4":
+            return self.parse_html_bs4(html, url)
+        doc = extractor.extract(html, url)
+        doc.pop("links")
+        return doc
+
+    def parse_html_bs4(self, html: str, url: str) -> dict:
         soup = BeautifulSoup(html, "html.parser")
         for tag in self.IGNORED:
             for node in soup.find_all(tag):
@@ -24,4 +42,9 @@ class HTMLParser:
         }
 
     def parse_multiple(self, pages: dict):
+        if self.workers > 1 and len(pages) > 1:
+            urls = list(pages.keys())
+            chunksize = max(1, len(urls) // (self.workers * 4))
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                return list(pool.map(self.parse_html, [pages[u] for u in urls], urls, chunksize=chunksize))
         return [ self.parse_html(html, url) for url, html in pages.items() ]
@@ -0,0 +1,87 @@
+# evaluation/evaluate.py
+"""
+Retrieval and answer quality over question/answer pairs. Each pair is a dict
+{"question", "source", "answer"}: `source` is the URL that holds the answer and
+`answer` a string the generated answer should contain.
+
+    python -m evaluation.evaluate --qa data/qa.jsonl --k 4 --mode hybrid
+"""
+import argparse
+import json
+from utils.logger import get_logger
+
+logger = get_logger("evaluate")
+
+
+def load_pairs(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def source_rank(docs, source):
+    """1-based rank of the first doc from `source`, or None."""
+    for rank, doc in enumerate(docs, 1):
+        metadata = doc.metadata if hasattr(doc, "metadata") else doc.get("metadata", {})
+        if metadata.get("source") == source:
+            return rank
+    return None
+
+
+def evaluate_retrieval(search, pairs, k=4):
+    """
+    search(question, k) -> ranked docs. Returns recall@k (share of questions whose
+    source is in the top k) and MRR over the same cut-off.
+    """
+    hits, reciprocal = 0, 0.0
+    for pair in pairs:
+        rank = source_rank(search(pair["question"], k)[:k], pair["source"])
+        if rank is not None:
+            hits += 1
+            reciprocal += 1.0 / rank
+    n = len(pairs) or 1
+    return {"queries": len(pairs), "k": k, f"recall@{k}": round(hits / n, 4), "mrr": round(reciprocal / n, 4)}
+
+
+def evaluate_answers(ask, pairs):
+    """
+    ask(question) -> /ask response body. answer_accuracy: the expected answer is in
+    the generated answer; grounded: it is also in one of the cited source snippets.
+    """
+    correct = grounded = 0
+    for pair in pairs:
+        response = ask(pair["question"])
+        expected = pair["answer"].lower()
+        if expected in (response.get("answer") or "").lower():
+            correct += 1
+            if any(expected in (s.get("snippet") or "").lower() for s in response.get("sources", [])):
+                grounded += 1
+    n = len(pairs) or 1
+    return {"answers": len(pairs), "answer_accuracy": round(correct / n, 4), "grounded": round(grounded / n, 4)}
+
+
+def main():
+    import yaml
+    from indexing.embedder import get_embedding_model
+    from indexing.vectorstore import FaissVectorStore
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--qa", required=True, help="JSONL of {question, source, answer}")
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--mode", default="vector", help="vector, bm25 or hybrid")
+    ap.add_argument("--collection", default=None, help="collection to evaluate (default: the default one)")
+    args = ap.parse_args()
+
+    with open("config/settings.yaml") as f:
+        cfg = yaml.safe_load(f)
+    model_name = FaissVectorStore.read_meta(args.collection).get("embedding_model") or cfg["index"]["embedding_model"]
+    store = FaissVectorStore(get_embedding_model(model_name), index_cfg=cfg["vectorstore"], model_name=model_name,
+                             collection=args.collection)
+    if not store.load():
+        logger.error("No saved index; call /index first.")
+        return
+    pairs = load_pairs(args.qa)
+    print(json.dumps(evaluate_retrieval(lambda q, k: store.retrieve(q, k=k, mode=args.mode), pairs, args.k), indent=2))
+
+
+if __name__ == "__main__":
+    main()
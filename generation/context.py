@@ -0,0 +1,145 @@
+# generation/context.py
+"""
+Turns the chunks retrieval returns into the context block of the prompt:
+MMR selection of `top_k` chunks (dropping near-duplicates), adjacent chunks
+of one page merged back into a single passage, and the passages packed into
+a token budget with a per-source cap. Every passage keeps its source URL, so
+the LLM can still cite it.
+"""
+import math
+from collections import Counter
+from langchain_core.documents import Document
+from indexing.lexical import tokenize
+
+CHARS_PER_TOKEN = 4  # rough estimate for English text with Llama-style tokenizers
+MIN_OVERLAP = 8      # shortest suffix/prefix match treated as chunk overlap when merging
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate(text, tokens):
+    """`text` cut to about `tokens` tokens, at a word boundary where there is one."""
+    if estimate_tokens(text) <= tokens:
+        return text
+    limit = max(0, tokens * CHARS_PER_TOKEN - len(" ..."))
+    cut = text.rfind(" ", 0, limit + 1)
+    return text[:cut if cut > limit // 2 else limit].rstrip() + " ..."
+
+
+def _cosine(a, b):
+    if not a or not b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(n * b.get(t, 0) for t, n in a.items())
+    return dot / (math.sqrt(sum(n * n for n in a.values())) * math.sqrt(sum(n * n for n in b.values())))
+
+
+def mmr(docs, k, lambda_=0.7, duplicate_threshold=0.9):
+    """
+    Maximal marginal relevance over `docs` in rank order: repeatedly picks the
+    chunk with the best lambda * relevance - (1 - lambda) * (similarity to the
+    chunks already picked). Relevance is taken from the rank (the fused hybrid
+    scores are not comparable to dense ones), similarity is the cosine of word
+    counts. Chunks at least `duplicate_threshold` similar to a picked one are
+    dropped. Returns (picked docs in pick order, number dropped as duplicates).
+    """
+    n = len(docs)
+    terms = [Counter(tokenize(d.page_content)) for d in docs]
+    closest = [0.0] * n
+    left = list(range(n))
+    picked, dropped = [], 0
+    while left and len(picked) < k:
+        best = max(left, key=lambda i: (lambda_ * (1 - i / n) - (1 - lambda_) * closest[i], -i))
+        left.remove(best)
+        picked.append(best)
+        keep = []
+        for i in left:
+            sim = _cosine(terms[best], terms[i])
+            if sim >= duplicate_threshold:
+                dropped += 1
+                continue
+            closest[i] = max(closest[i], sim)
+            keep.append(i)
+        left = keep
+    return [docs[i] for i in picked], dropped
+
+
+def join_overlapping(a, b):
+    """a + b without the text the chunker repeated at the end of a and the start of b."""
+    for size in range(min(len(a), len(b)), MIN_OVERLAP - 1, -1):
+        if a.endswith(b[:size]):
+            return a + b[size:]
+    return a + " " + b
+
+
+def merge_adjacent(docs):
+    """
+    One passage per run of consecutive chunk_index values of a source, in the
+    order of each run's best-ranked chunk.
+    """
+    by_source = {}  # {source: [(rank, doc)]}
+    for rank, d in enumerate(docs):
+        by_source.setdefault(d.metadata.get("source"), []).append((rank, d))
+    runs = []
+    for chunks in by_source.values():
+        chunks.sort(key=lambda c: c[1].metadata.get("chunk_index", -1))
+        run = chunks[:1]
+        for rank, d in chunks[1:]:
+            previous = run[-1][1].metadata.get("chunk_index")
+            if previous is None or d.metadata.get("chunk_index") != previous + 1:
+                runs.append(run)
+                run = []
+            run.append((rank, d))
+        runs.append(run)
+    runs.sort(key=lambda run: min(rank for rank, _ in run))
+
+    passages = []
+    for run in runs:
+        chunks = [d for _, d in run]
+        text = chunks[0].page_content
+        for d in chunks[1:]:
+            text = join_overlapping(text, d.page_content)
+        metadata = dict(chunks[0].metadata)
+        metadata["chunks"] = [d.metadata.get("chunk_index") for d in chunks]
+        also_at = sorted({u for d in chunks for u in d.metadata.get("duplicate_sources") or []})
+        if also_at:
+            metadata["duplicate_sources"] = also_at
+        passages.append(Document(page_content=text, metadata=metadata))
+    return passages
+
+
+def pack_context(docs, top_k, max_tokens=1500, per_source_tokens=600, mmr_lambda=0.7, duplicate_threshold=0.9):
+    """
+    Returns (passages, stats): the passages that go into the prompt, each within
+    `per_source_tokens` per source and all within `max_tokens`, and counters
+    describing what was selected, merged and cut.
+    """
+    picked, dropped = mmr(docs, top_k, mmr_lambda, duplicate_threshold)
+    passages = merge_adjacent(picked)
+    used = Counter()  # tokens per source
+    total, truncated, packed = 0, 0, []
+    for p in passages:
+        source = p.metadata.get("source")
+        room = min(per_source_tokens - used[source], max_tokens - total)
+        if room <= 0:
+            truncated += 1
+            continue
+        text = p.page_content
+        if estimate_tokens(text) > room:
+            text = truncate(text, room)
+            truncated += 1
+        tokens = estimate_tokens(text)
+        used[source] += tokens
+        total += tokens
+        packed.append(Document(page_content=text, metadata=p.metadata))
+    stats = {"candidates": len(docs), "selected": len(picked), "duplicates": dropped,
+             "passages": len(packed), "truncated": truncated, "tokens": total}
+    return packed, stats
+
+
+def format_context(passages):
+    """The prompt's context: each passage under its [source URL], as the prompt asks citations to look."""
+    return "\n\n".join(f"[{p.metadata.get('source')}]\n{p.page_content}" for p in passages)
@@ -1,4 +1,6 @@
 import os
+import threading
+from functools import lru_cache
 from typing import Any, Dict, List
 from langchain.prompts import PromptTemplate
 from langchain_core.runnables import RunnableLambda
@@ -7,20 +9,46 @@ from langchain.chains.retrieval import create_retrieval_chain
 from langchain_core.prompt_values import PromptValue  # Added this to ensure type safety
 
 # --- Groq-Specific Imports ---
-from groq import Groq
+from groq import AsyncGroq, Groq
 # ------------------------------
 
-def _call_groq_api(prompt_value: PromptValue, model_name: str, max_new_tokens: int, temperature: float) -> str:
+from generation.context import format_context
+from utils.logger import get_logger
+from utils.metrics import STAGE_ERRORS
+
+logger = get_logger("generator")
+
+_clients = {}  # {(async?, base_url): client}
+_clients_lock = threading.Lock()
+
+
+def get_client(use_async=False, base_url=None):
+    """
+    Process-wide Groq client (one per base_url), so every request reuses the
+    same HTTP connection pool instead of opening new connections. base_url
+    points the app at another OpenAI-compatible server, e.g. a local fake for tests.
+    """
+    key = (use_async, base_url)
+    with _clients_lock:
+        if key not in _clients:
+            cls = AsyncGroq if use_async else Groq
+            # the client raises if no API key is set
+            _clients[key] = cls(api_key=os.environ.get("GROQ_API_KEY"), base_url=base_url)
+        return _clients[key]
+
+
+def _call_groq_api(prompt_value: PromptValue, model_name: str, max_new_tokens: int, temperature: float,
+                   base_url=None) -> str:
     """
     Internal function to call the Groq API for content generation.
     It takes the PromptValue object and converts it to the final string expected by the API.
     """
     try:
-        # 1. Initialize client inside the function to guarantee API key is available
-        groq_client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-
-        if groq_client.api_key is None:
+        # 1. Shared client; constructing it fails when the API key is missing
+        if not os.environ.get("GROQ_API_KEY"):
+            STAGE_ERRORS.inc(stage="llm")
             return "Error: Groq API Key is not set in the environment variables."
+        groq_client = get_client(base_url=base_url)
 
         # 2. Convert the LangChain PromptValue object into the final string
         final_prompt_string = prompt_value.to_string() 
@@ -41,21 +69,39 @@ def _call_groq_api(prompt_value: PromptValue, model_name: str, max_new_tokens: i
         return response.choices[0].message.content
     
     except Exception as e:
-        print(f"Groq API Call Error: {e}")
+        # /ask returns the error text as the answer, so timed("llm") never sees an exception
+        STAGE_ERRORS.inc(stage="llm")
+        logger.exception(f"Groq API call failed: {e}")
         # Added a check for common Groq API errors (like 401/404)
         if "400" in str(e) or "401" in str(e):
              return f"Error during Groq API call: API Key or model error detected."
         return f"Error during Groq API call: {str(e)}"
 
 
-def make_llm(model_name="llama3-8b-8192", max_new_tokens=256, temperature=0.0):
+async def stream_groq_api(prompt: str, model_name: str, max_new_tokens: int, temperature: float, base_url=None):
+    """Yields the completion for `prompt` token by token as the API streams it."""
+    if not os.environ.get("GROQ_API_KEY"):
+        raise RuntimeError("Groq API Key is not set in the environment variables.")
+    stream = await get_client(use_async=True, base_url=base_url).chat.completions.create(
+        model=model_name,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        max_tokens=max_new_tokens,
+        stream=True
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def make_llm(model_name="llama3-8b-8192", max_new_tokens=256, temperature=0.0, base_url=None):
     """
     Wraps the Groq API call within a RunnableLambda to function as the LLM in the LCEL chain.
     """
     
     # We define the LLM wrapper as a RunnableLambda that takes a PromptValue and calls the API
     return RunnableLambda(
-        lambda prompt_value: _call_groq_api(prompt_value, model_name, max_new_tokens, temperature)
+        lambda prompt_value: _call_groq_api(prompt_value, model_name, max_new_tokens, temperature, base_url)
     )
 
 # ----------------------------------------------------------------------
@@ -75,14 +121,27 @@ Question:
 Answer concisely and include source citations.
 """
 
+# The PromptTemplate expects the 'input' and 'context' variables from the chain.
+PROMPT = PromptTemplate(
+    template=GROUND_PROMPT,
+    input_variables=["context", "input"] 
+)
+
+def build_prompt(question, docs):
+    """The PromptValue for `docs` (packed passages, see generation/context.py), each labelled with its source URL."""
+    return PROMPT.format_prompt(context=format_context(docs), input=question)
+
+def format_prompt(question, docs):
+    """build_prompt as a string (for the streaming path)."""
+    return build_prompt(question, docs).to_string()
+
+@lru_cache(maxsize=8)
+def get_llm(model_name, max_new_tokens, temperature, base_url=None):
+    """make_llm for one generation config, built once and reused by every request."""
+    return make_llm(model_name, max_new_tokens, temperature, base_url)
+
 def build_qa_chain(llm, retriever):
-    # The PromptTemplate expects the 'input' and 'context' variables from the chain.
-    prompt = PromptTemplate(
-        template=GROUND_PROMPT,
-        input_variables=["context", "input"] 
-    )
-    
-    document_chain = create_stuff_documents_chain(llm, prompt)
+    document_chain = create_stuff_documents_chain(llm, PROMPT)
     retrieval_chain = create_retrieval_chain(retriever, document_chain)
     
     return retrieval_chain
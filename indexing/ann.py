@@ -0,0 +1,161 @@
+# indexing/ann.py
+import faiss
+import numpy as np
+from utils.logger import get_logger
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+
+DEFAULTS = {
+    "index_type": "flat",
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 64,
+    "nlist": 1024,
+    "nprobe": 16,
+    "pq_m": 16,
+    "pq_bits": 8,
+}
+
+logger = get_logger("ann")
+
+
+def index_config(cfg=None):
+    """Merges the vectorstore section of settings.yaml over DEFAULTS."""
+    merged = dict(DEFAULTS)
+    merged.update({k: v for k, v in (cfg or {}).items() if k in DEFAULTS})
+    if merged["index_type"] not in INDEX_TYPES:
+        raise ValueError(f"Unknown index_type {merged['index_type']!r}; expected one of {INDEX_TYPES}")
+    return merged
+
+
+def factory_string(cfg, dim, n):
+    """
+    FAISS index_factory spec for `n` training vectors. IVF needs ~39 training points
+    per list and PQ needs 2**pq_bits, so small corpora shrink nlist or fall back to
+    a flat index rather than training a degenerate quantizer.
+    """
+    kind = cfg["index_type"]
+    if kind == "flat":
+        return "Flat"
+    if kind == "hnsw":
+        return f"HNSW{cfg['hnsw_m']}"
+    nlist = min(cfg["nlist"], max(1, n // 39))
+    if kind == "ivf_pq":
+        if n < 2 ** cfg["pq_bits"] or dim % cfg["pq_m"]:
+            logger.warning(f"ivf_pq needs >= {2 ** cfg['pq_bits']} vectors and pq_m dividing {dim}; using flat")
+            return "Flat"
+        return f"IVF{nlist},PQ{cfg['pq_m']}x{cfg['pq_bits']}"
+    return f"IVF{nlist},Flat"
+
+
+def build_index(vectors, cfg):
+    """Builds, trains (when the index type needs it) and fills an index with `vectors`."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    spec = factory_string(cfg, dim, n)
+    index = faiss.index_factory(dim, spec)
+    if cfg["index_type"] == "hnsw":
+        index.hnsw.efConstruction = cfg["ef_construction"]
+    if not index.is_trained:
+        index.train(vectors)
+    if n:
+        index.add(vectors)
+    set_search_params(index, nprobe=cfg["nprobe"], ef_search=cfg["ef_search"])
+    return index
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Query-time knobs; parameters that do not apply to the index type are ignored."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if nprobe and ivf is not None:
+        ivf.nprobe = nprobe
+    hnsw = getattr(index, "hnsw", None)
+    if ef_search and hnsw is not None:
+        hnsw.efSearch = ef_search
+
+
+def same_kind(index, cfg):
+    """True when `index` already is the configured index type."""
+    if cfg["index_type"] == "hnsw":
+        return hasattr(index, "hnsw")
+    ivf = faiss.try_extract_index_ivf(index)
+    if cfg["index_type"] == "flat":
+        return isinstance(index, faiss.IndexFlat)
+    if ivf is None:
+        return False
+    # try_extract_index_ivf returns the IndexIVF base class; downcast to see PQ
+    return isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) == (cfg["index_type"] == "ivf_pq")
+
+
+def reconstruct(index, labels):
+    """The stored vectors of `labels`, in that order (lossy for PQ codes)."""
+    if not len(labels):
+        return np.zeros((0, index.d), dtype=np.float32)
+    labels = np.asarray(labels, dtype=np.int64)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return index.reconstruct_batch(labels)
+    # IVF labels are not positions; a hashtable direct map resolves them (and unlike
+    # the array map it does not need contiguous labels)
+    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    try:
+        return index.reconstruct_batch(labels)
+    finally:
+        ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+
+
+def delete_mode(index):
+    """
+    How rows are dropped from `index`:
+      "renumber"   flat: remove_ids shifts the later rows down, labels are positions
+      "ids"        IVF: rows keep the int64 label they were added with (add_with_ids)
+                   and remove_ids drops them by label
+      "tombstone"  HNSW cannot remove; deleted labels are excluded at search time
+                   (search_params) until the index is rebuilt
+    A memory-mapped index is read-only whatever its type: FaissVectorStore
+    tombstones its rows until the next snapshot.
+    """
+    if faiss.try_extract_index_ivf(index) is not None:
+        return "ids"
+    if hasattr(index, "hnsw"):
+        return "tombstone"
+    return "renumber"
+
+
+def exclude(labels):
+    """IDSelector accepting every label but `labels`."""
+    batch = faiss.IDSelectorBatch(np.asarray(sorted(labels), dtype=np.int64))
+    selector = faiss.IDSelectorNot(batch)
+    selector.referenced_objects = [batch]  # the SWIG wrapper does not keep it alive
+    return selector
+
+
+def search_params(index, nprobe=None, ef_search=None, selector=None):
+    """
+    Per-call faiss.SearchParameters overriding nprobe (IVF) / efSearch (HNSW) and
+    filtering rows through `selector`, or None to search with the index's own
+    settings. Unlike set_search_params this leaves the index untouched, so
+    concurrent searches can use different values.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        if not nprobe and selector is None:
+            return None
+        params = faiss.SearchParametersIVF(nprobe=nprobe or ivf.nprobe)
+    elif hasattr(index, "hnsw"):
+        if not ef_search and selector is None:
+            return None
+        params = faiss.SearchParametersHNSW(efSearch=ef_search or index.hnsw.efSearch)
+    elif selector is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def bytes_per_vector(index):
+    if index.ntotal == 0:
+        return 0.0
+    return len(faiss.serialize_index(index)) / index.ntotal
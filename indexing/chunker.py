@@ -1,45 +1,137 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from utils.metrics import observe
 
-def chunk_documents(docs, chunk_size=256, chunk_overlap=50):
+# break points tried in order, as RecursiveCharacterTextSplitter does for web text
+SEPARATORS = ("\n\n", "\n", " ")
+TOKEN_RE = re.compile(r"\S+")
+UNITS = ("chars", "tokens")
+
+
+def page_text(doc):
+    """The text a page is chunked from; chunk offsets index into this string."""
+    return f"{doc.get('title', '')}\n{doc.get('content', '')}"
+
+
+def char_spans(text, chunk_size=256, chunk_overlap=50):
+    """
+    (start, end) offsets of chunks of at most `chunk_size` characters. Each chunk
+    ends at the last paragraph break, line break or space that fits (a hard cut
+    only when there is none) and the next one starts up to `chunk_overlap`
+    characters earlier, on a word boundary, unless the break was a line break.
+    Leading/trailing whitespace is trimmed.
     """
-    Splits document content into smaller chunks using a RecursiveCharacterTextSplitter
-    to keep context coherent. The chunk size should now reliably be small enough
-    to fit within the Groq API limits.
+    n = len(text)
+    pos = prev_end = 0
+    while True:
+        # new text starts at `floor`; a break before it would only repeat the overlap
+        floor = max(pos, prev_end)
+        while floor < n and text[floor].isspace():
+            floor += 1
+        if floor >= n:
+            return
+        while text[pos].isspace():
+            pos += 1
+        if floor >= pos + chunk_size:
+            pos = floor  # the overlap leaves no room for new text
+        limit = pos + chunk_size
+        if limit >= n:
+            end = n
+        else:
+            end = limit
+            for sep in SEPARATORS:
+                cut = text.rfind(sep, floor + 1, limit + len(sep))
+                if cut != -1:
+                    end = cut
+                    break
+        stop = end
+        while text[stop - 1].isspace():
+            stop -= 1
+        yield pos, stop
+        if end >= n:
+            return
+        prev_end = nxt = end
+        # no overlap across a line or paragraph break, so a block repeated on many
+        # pages (banner, sidebar) chunks the same way everywhere
+        if chunk_overlap > 0 and text[end] != "\n":
+            space = text.find(" ", max(end - chunk_overlap, pos + 1) - 1, end)
+            if space != -1 and space + 1 < end:
+                nxt = space + 1
+        pos = nxt
+
+
+def token_spans(text, chunk_size=256, chunk_overlap=50, tokenize=None):
+    """
+    (start, end) offsets of windows of at most `chunk_size` tokens overlapping by
+    `chunk_overlap` tokens. tokenize(text) -> [(start, end)] token offsets; the
+    default is whitespace-separated words.
+    """
+    if chunk_overlap >= chunk_size:
+        # a window would not advance past the previous one
+        raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+    tokens = tokenize(text) if tokenize else [m.span() for m in TOKEN_RE.finditer(text)]
+    step = chunk_size - chunk_overlap
+    for i in range(0, len(tokens), step):
+        window = tokens[i:i + chunk_size]
+        yield window[0][0], window[-1][1]
+        if i + chunk_size >= len(tokens):
+            return
+
+
+def _spans(text, chunk_size, chunk_overlap, unit):
+    fn = token_spans if unit == "tokens" else char_spans
+    return list(fn(text, chunk_size, chunk_overlap))
+
+
+def iter_spans(docs, chunk_size=256, chunk_overlap=50, unit="chars", workers=0):
+    """
+    Yields (page id, start, end) per chunk, page id being the position of the page
+    in `docs`. With workers > 1 pages are split across a process pool; only the
+    offsets come back, never the chunk strings.
+    """
+    if unit not in UNITS:
+        raise ValueError(f"chunk unit must be one of {', '.join(UNITS)}")
+    split = partial(_spans, chunk_size=chunk_size, chunk_overlap=chunk_overlap, unit=unit)
+    if workers > 1 and len(docs) > 1:
+        chunksize = max(1, len(docs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for page, spans in enumerate(pool.map(split, map(page_text, docs), chunksize=chunksize)):
+                for start, end in spans:
+                    yield page, start, end
+        return
+    fn = token_spans if unit == "tokens" else char_spans
+    for page, doc in enumerate(docs):
+        for start, end in fn(page_text(doc), chunk_size, chunk_overlap):
+            yield page, start, end
+
+
+def iter_chunks(docs, chunk_size=256, chunk_overlap=50, unit="chars", workers=0):
+    """Lazily yields the { page_content, metadata } dicts chunk_documents returns."""
+    page, text, index = -1, "", 0
+    for p, start, end in iter_spans(docs, chunk_size, chunk_overlap, unit, workers):
+        if p != page:
+            page, text, index = p, page_text(docs[p]), 0
+        d = docs[p]
+        yield {
+            "page_content": text[start:end],
+            "metadata": {"source": d["url"], "title": d.get("title", ""), "chunk_index": index}
+        }
+        index += 1
+
+
+def chunk_documents(docs, chunk_size=256, chunk_overlap=50, unit="chars", workers=0):
+    """
+    Splits page content into chunks of at most `chunk_size` characters (or tokens,
+    with unit="tokens"), preferring paragraph, line and word boundaries, with
+    `chunk_overlap` of context carried between neighbours. The chunk size should
+    be small enough to fit within the Groq API limits.
 
     docs: list of dicts { 'url', 'title', 'content' }
-    returns list of LangChain Document objects (with page_content and metadata)
-    """
-    # Using RecursiveCharacterTextSplitter is robust for web content
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        # Default separators are usually best for web text: ["\n\n", "\n", " ", ""]
-    )
-
-    outputs = []
-    for d in docs:
-        # Create a single document object from the raw page content and metadata
-        doc = Document(
-            page_content=f"{d.get('title','')}\n{d.get('content','')}",
-            metadata={
-                "source": d["url"],
-                "title": d.get("title","")
-            }
-        )
-        
-        # Split the document
-        chunks = splitter.split_documents([doc])
-        
-        # Format the output into the expected list of dictionaries
-        for i, c in enumerate(chunks):
-            # Ensure metadata is copied and we add the chunk_index
-            metadata = c.metadata.copy()
-            metadata["chunk_index"] = i
-            
-            outputs.append({
-                "page_content": c.page_content,
-                "metadata": metadata
-            })
-            
+    returns list of dicts { page_content, metadata: { source, title, chunk_index } }
+    """
+    t0 = time.perf_counter()
+    outputs = list(iter_chunks(docs, chunk_size, chunk_overlap, unit, workers))
+    observe("chunk", time.perf_counter() - t0, items=len(docs))
     return outputs
@@ -0,0 +1,215 @@
+# indexing/dedup.py
+import hashlib
+import os
+import re
+import zlib
+from collections import defaultdict
+import numpy as np
+from utils.metrics import timed
+
+WORD_RE = re.compile(r"\w+")
+_PRIME = np.uint64((1 << 61) - 1)
+MAX_RECORDED = 16  # boilerplate can repeat on every page; cite a handful of copies, not all
+
+
+def _bands(num_perm, threshold):
+    """(bands, rows) for LSH: the most rows whose candidate cut-off (1/b)^(1/r) stays below threshold."""
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows == 0 and (rows / num_perm) ** (1.0 / rows) <= threshold:
+            best = (num_perm // rows, rows)
+    return best
+
+
+class NearDuplicateIndex:
+    """
+    MinHash over word `shingle`-grams with LSH banding. check(text, value) returns
+    the value stored for an earlier text whose estimated Jaccard similarity is at
+    least `threshold`, or stores `value` for this text and returns None. Exact
+    copies are caught by a content hash before any MinHash work. remove() forgets
+    the texts stored with some values; entries() / add() read and restore the rest.
+    """
+
+    def __init__(self, threshold=0.9, num_perm=64, shingle=3, seed=1):
+        self.threshold = threshold
+        self.shingle = shingle
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+        self.bands, self.rows = _bands(num_perm, threshold)
+        self.buckets = [defaultdict(list) for _ in range(self.bands)]
+        self.exact = {}
+        self.digests = []  # entry -> content hash
+        self.signatures = []  # entry -> uint32 MinHash signature
+        self.values = []  # entry -> value, None once removed (its bucket slots are skipped)
+
+    def signature(self, words):
+        n = self.shingle
+        grams = [" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))]
+        h = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+        # (a*h + b) mod p cannot overflow: a, b and h are all below 2**32
+        return ((h[:, None] * self.a + self.b) % _PRIME).min(axis=0).astype(np.uint32)
+
+    def check(self, text, value):
+        words = WORD_RE.findall(text.lower())
+        if not words:
+            return None
+        digest = hashlib.blake2b(" ".join(words).encode("utf-8"), digest_size=16).digest()
+        entry = self.exact.get(digest)
+        if entry is not None:
+            return self.values[entry]
+        sig = self.signature(words)
+        keys = self._keys(sig)
+        seen = set()
+        for bucket, key in zip(self.buckets, keys):
+            for entry in bucket.get(key, ()):
+                if entry not in seen and self.values[entry] is not None:
+                    seen.add(entry)
+                    if np.count_nonzero(self.signatures[entry] == sig) >= self.threshold * len(sig):
+                        return self.values[entry]
+        self.add(digest, sig, value, keys)
+        return None
+
+    def _keys(self, sig):
+        return [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, digest, sig, value, keys=None):
+        entry = len(self.values)
+        self.exact[digest] = entry
+        self.digests.append(digest)
+        self.signatures.append(sig)
+        self.values.append(value)
+        for bucket, key in zip(self.buckets, keys or self._keys(sig)):
+            bucket[key].append(entry)
+
+    def remove(self, values):
+        values = set(values)
+        for entry, value in enumerate(self.values):
+            if value in values:
+                self.values[entry] = None
+                if self.exact.get(self.digests[entry]) == entry:
+                    del self.exact[self.digests[entry]]
+
+    def entries(self):
+        """(digest, signature, value) of every text still stored."""
+        return [(self.digests[e], self.signatures[e], v) for e, v in enumerate(self.values) if v is not None]
+
+
+class Deduplicator:
+    """
+    Drops near-duplicate pages (versioned copies, print views, query-string
+    variants) and near-duplicate chunks (sidebars, banners and other boilerplate
+    repeated across pages) before they are embedded.
+
+    The first copy is kept and records the URLs of the copies merged into it in
+    metadata["duplicate_sources"], so an answer citing it can point at any of
+    them. In the pipeline a kept chunk may already be indexed when a later copy
+    arrives; that copy is still dropped but not recorded on it.
+
+    Chunk state lives for one run of /index or of the streaming pipeline. Page
+    state can be carried over to the next incremental run with save() / load(),
+    so a changed page is also checked against the unchanged pages it does not
+    re-read; release() forgets the pages a run re-reads and returns the copies
+    merged into them, which have to be checked again.
+    """
+
+    def __init__(self, page_threshold=0.9, chunk_threshold=0.95, num_perm=64):
+        self.pages_index = NearDuplicateIndex(page_threshold, num_perm) if page_threshold else None
+        self.chunks_index = NearDuplicateIndex(chunk_threshold, num_perm) if chunk_threshold else None
+        self.merged = defaultdict(list)  # kept page URL -> URLs of pages merged into it
+        self.stats = {"pages_dropped": 0, "chunks_dropped": 0}
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(page_threshold=cfg.get("page_threshold", 0.9), chunk_threshold=cfg.get("chunk_threshold", 0.95),
+                   num_perm=cfg.get("num_perm", 64))
+
+    def save(self, path):
+        """Write the page state (signatures and merged copies) to `path` (.npz)."""
+        if self.pages_index is None:
+            if os.path.exists(path):
+                os.remove(path)  # page dedup is off: what is there describes an older run
+            return
+        index = self.pages_index
+        entries = index.entries()
+        merged = [(kept, url) for kept, urls in self.merged.items() for url in urls]
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, params=np.array([index.threshold, len(index.a), index.shingle]),
+                 digests=np.frombuffer(b"".join(d for d, _, _ in entries), dtype=np.uint8).reshape(len(entries), 16),
+                 signatures=np.array([s for _, s, _ in entries], dtype=np.uint32).reshape(len(entries), len(index.a)),
+                 urls=np.array([v for _, _, v in entries], dtype=str),
+                 merged_kept=np.array([k for k, _ in merged], dtype=str),
+                 merged_urls=np.array([u for _, u in merged], dtype=str))
+        os.replace(tmp, path)
+
+    def load(self, path):
+        """
+        Page state saved by an earlier run; False (and nothing loaded) if there is
+        none or it was written with other MinHash settings.
+        """
+        index = self.pages_index
+        if index is None or not os.path.exists(path):
+            return False
+        with np.load(path) as saved:
+            if saved["params"].tolist() != [index.threshold, len(index.a), index.shingle]:
+                return False
+            for digest, sig, url in zip(saved["digests"], saved["signatures"], saved["urls"].tolist()):
+                index.add(digest.tobytes(), sig, url)
+            for kept, url in zip(saved["merged_kept"].tolist(), saved["merged_urls"].tolist()):
+                self.merged[kept].append(url)
+        return True
+
+    def release(self, urls):
+        """
+        Forget pages this run re-reads. Returns the URLs of the pages merged into
+        them, which are no longer indexed anywhere and need checking again.
+        """
+        urls = set(urls)
+        if self.pages_index is not None:
+            self.pages_index.remove(urls)
+        copies = set()
+        for kept in list(self.merged):
+            if kept in urls:
+                copies.update(self.merged.pop(kept))
+            else:
+                self.merged[kept] = [url for url in self.merged[kept] if url not in urls]
+                if not self.merged[kept]:
+                    del self.merged[kept]
+        return copies - urls
+
+    def pages(self, docs):
+        """Parsed pages { url, title, content } without near-duplicates of earlier ones."""
+        if self.pages_index is None:
+            return list(docs)
+        kept = []
+        with timed("dedup", items=len(docs)):
+            for d in docs:
+                original = self.pages_index.check(d.get("content", ""), d["url"])
+                if original is None or original == d["url"]:
+                    kept.append(d)
+                else:
+                    self.merged[original].append(d["url"])
+                    self.stats["pages_dropped"] += 1
+        return kept
+
+    def chunks(self, chunks):
+        """Chunks { page_content, metadata } without near-duplicates of earlier ones."""
+        kept = []
+        with timed("dedup", items=len(chunks)):
+            for c in chunks:
+                metadata = c["metadata"]
+                source = metadata["source"]
+                if source in self.merged:
+                    metadata["duplicate_sources"] = self.merged[source][:MAX_RECORDED]
+                original = self.chunks_index.check(c["page_content"], metadata) if self.chunks_index else None
+                if original is None:
+                    kept.append(c)
+                    continue
+                self.stats["chunks_dropped"] += 1
+                also = original.setdefault("duplicate_sources", [])
+                for url in [source] + self.merged.get(source, []):
+                    if len(also) >= MAX_RECORDED:
+                        break
+                    if url != original["source"] and url not in also:
+                        also.append(url)
+        return kept
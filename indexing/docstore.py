@@ -0,0 +1,221 @@
+# indexing/docstore.py
+import json
+import os
+import sqlite3
+import threading
+import weakref
+from typing import Dict, List, Union
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain.docstore.document import Document
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    Chunk text and metadata in a SQLite file, keyed by chunk id with an index on
+    source URL. Replaces LangChain's pickled InMemoryDocstore: nothing is read at
+    load time, and a search only fetches the rows of its top-k hits. Several
+    worker processes can open the same file read-only.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # rollback journal rather than WAL: a rebuilt docstore is swapped in with
+        # os.replace, and WAL side files are tied to the path, not the open file
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id TEXT PRIMARY KEY, source TEXT, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks(source)")
+        self.conn.commit()
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self.lock:
+            row = self.conn.execute("SELECT text, metadata FROM chunks WHERE id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def get_many(self, ids) -> List[Document]:
+        """Documents for `ids` in the same order, fetched in one query (missing ids are skipped)."""
+        ids = list(ids)
+        found = self.documents(ids)
+        return [found[cid] for cid in ids if cid in found]
+
+    def documents(self, ids) -> Dict[str, Document]:
+        """{id: Document} for the given ids (missing ids are left out)."""
+        ids = list(ids)
+        if not ids:
+            return {}
+        marks = ",".join("?" * len(ids))
+        with self.lock:
+            rows = self.conn.execute(f"SELECT id, text, metadata FROM chunks WHERE id IN ({marks})", ids).fetchall()
+        return {cid: Document(page_content=text, metadata=json.loads(meta)) for cid, text, meta in rows}
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        rows = [(cid, doc.metadata.get("source"), doc.page_content, json.dumps(doc.metadata))
+                for cid, doc in texts.items()]
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?)", rows)
+            self.conn.commit()
+
+    def delete(self, ids: List) -> None:
+        with self.lock:
+            self.conn.executemany("DELETE FROM chunks WHERE id = ?", [(cid,) for cid in ids])
+            self.conn.commit()
+
+    def replace(self, deleted: List, added: Dict[str, Document]) -> None:
+        """delete(deleted) then add(added), committed as one transaction."""
+        rows = [(cid, doc.metadata.get("source"), doc.page_content, json.dumps(doc.metadata))
+                for cid, doc in added.items()]
+        with self.lock:
+            self.conn.executemany("DELETE FROM chunks WHERE id = ?", [(cid,) for cid in deleted])
+            self.conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?)", rows)
+            self.conn.commit()
+
+    def __contains__(self, cid):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM chunks WHERE id = ?", (cid,)).fetchone() is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def ids_for_sources(self, sources) -> List[str]:
+        sources = list(sources)
+        out = []
+        with self.lock:
+            for start in range(0, len(sources), 500):  # stay under SQLite's parameter limit
+                batch = sources[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                out += [r[0] for r in self.conn.execute(f"SELECT id FROM chunks WHERE source IN ({marks})", batch)]
+        return out
+
+    def texts(self, ids) -> Dict[str, str]:
+        """{id: chunk text} for the given ids (missing ids are left out)."""
+        ids = list(ids)
+        out = {}
+        with self.lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                out.update(self.conn.execute(f"SELECT id, text FROM chunks WHERE id IN ({marks})", batch))
+        return out
+
+    def sources(self) -> List[str]:
+        with self.lock:
+            return [r[0] for r in self.conn.execute("SELECT DISTINCT source FROM chunks")]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    @classmethod
+    def fresh(cls, path):
+        """A new, empty docstore at `path` (any previous file there is removed)."""
+        _remove(path)
+        return cls(path)
+
+    @classmethod
+    def private(cls, path, source=None):
+        """
+        A docstore file only its owner writes: empty, or a copy of `source` (an open
+        SQLiteDocstore). The file is deleted when the object is garbage collected,
+        unless it has been moved away by then (FaissVectorStore.save renames it
+        over the snapshot's docstore).
+        """
+        store = cls.fresh(path)
+        if source is not None:
+            with source.lock, store.lock:
+                source.conn.backup(store.conn)
+        weakref.finalize(store, _discard, store.conn, path)
+        return store
+
+
+class OverlayDocstore(Docstore, AddableMixin):
+    """
+    Changes on top of a snapshot's docstore file, held in memory: added rows and
+    the ids of the snapshot's rows they delete or replace. The file itself is never
+    written, so an update costs what it changes rather than a copy of the file, and
+    other stores reading the snapshot do not see it. FaissVectorStore rebuilds the
+    overlay from its journal on load and folds it into the next snapshot's file
+    (merged_into) when it saves.
+    """
+
+    def __init__(self, base: SQLiteDocstore):
+        self.base = base
+        self.path = base.path
+        self.lock = threading.Lock()
+        self.added = {}  # {id: Document}
+        self.hidden = set()  # ids whose row in `base` is deleted or replaced
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self.lock:
+            if search in self.added:
+                return self.added[search]
+            if search in self.hidden:
+                return f"ID {search} not found."
+        return self.base.search(search)
+
+    def get_many(self, ids) -> List[Document]:
+        ids = list(ids)
+        found = self.documents(ids)
+        return [found[cid] for cid in ids if cid in found]
+
+    def documents(self, ids) -> Dict[str, Document]:
+        with self.lock:
+            found = {cid: self.added[cid] for cid in ids if cid in self.added}
+            rest = [cid for cid in ids if cid not in found and cid not in self.hidden]
+        found.update(self.base.documents(rest))
+        return found
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        with self.lock:
+            self.added.update(texts)
+            self.hidden.update(texts)
+
+    def delete(self, ids: List) -> None:
+        with self.lock:
+            for cid in ids:
+                self.added.pop(cid, None)
+                self.hidden.add(cid)
+
+    def __contains__(self, cid):
+        with self.lock:
+            if cid in self.added:
+                return True
+            if cid in self.hidden:
+                return False
+        return cid in self.base
+
+    def ids_for_sources(self, sources) -> List[str]:
+        sources = set(sources)
+        ids = self.base.ids_for_sources(sources)
+        with self.lock:
+            return ([cid for cid in ids if cid not in self.hidden] +
+                    [cid for cid, doc in self.added.items() if doc.metadata.get("source") in sources])
+
+    def texts(self, ids) -> Dict[str, str]:
+        return {cid: doc.page_content for cid, doc in self.documents(list(ids)).items()}
+
+    def merged_into(self, path) -> SQLiteDocstore:
+        """A private copy of the snapshot's file (SQLiteDocstore.private) with the overlay applied."""
+        store = SQLiteDocstore.private(path, source=self.base)
+        with self.lock:
+            store.replace(sorted(self.hidden), self.added)
+        return store
+
+    def close(self):
+        self.base.close()
+
+
+def _remove(path):
+    for suffix in ("", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def _discard(conn, path):
+    conn.close()
+    _remove(path)
@@ -1,8 +1,110 @@
 # indexing/embedder.py
+import threading
+from collections import OrderedDict
 from langchain_community.embeddings import SentenceTransformerEmbeddings
+from indexing.embedding_cache import EmbeddingCache, CachedEmbeddings
+from utils.logger import get_logger
 
-def get_embedding_model(model_name="sentence-transformers/all-MiniLM-L6-v2"):
+BACKENDS = ("torch", "int8", "onnx")
+
+_pool = OrderedDict()  # {(model_name, backend, cache_mb, batch_size): Embeddings}
+_caches = {}  # {cache name: EmbeddingCache} -- shared by pool entries, one per cache directory
+_loading = {}  # {pool key: Lock} -- one loader per configuration, outside _pool_lock
+_pool_lock = threading.Lock()
+_pool_size = 2
+_threads = 0
+
+logger = get_logger("embedder")
+
+
+def _load_model(model_name, backend, batch_size):
+    """
+    Loads one sentence-transformers model on CPU.
+    backend "torch" is the stock fp32 model, "int8" applies dynamic int8
+    quantization to its Linear layers, and "onnx" runs the exported graph on
+    onnxruntime (needs sentence-transformers>=3.2 and optimum[onnxruntime]).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {BACKENDS}")
+    import torch
+    if _threads:
+        # process-wide: applies to every model in the pool, not just this one
+        torch.set_num_threads(_threads)
+
+    model_kwargs = {"device": "cpu"}
+    if backend == "onnx":
+        model_kwargs["backend"] = "onnx"
+    model = SentenceTransformerEmbeddings(
+        model_name=model_name,
+        model_kwargs=model_kwargs,
+        encode_kwargs={"batch_size": batch_size},
+    )
+    if backend == "int8":
+        torch.quantization.quantize_dynamic(model.client, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+def set_pool_size(size):
+    global _pool_size
+    _pool_size = max(1, size)
+
+
+def set_threads(threads):
+    """torch intra-op threads for the whole process (0 = library default)."""
+    global _threads
+    _threads = max(0, threads)
+
+
+def _get_cache(model_name, backend, cache_mb):
+    # quantized/onnx vectors differ slightly from fp32 ones, so each backend gets its own cache
+    name = model_name if backend == "torch" else f"{model_name}#{backend}"
+    # keyed like the directory (by name): two instances over the same files would
+    # overwrite each other's rows. The size comes from the first caller, i.e. the config.
+    if name not in _caches:
+        _caches[name] = EmbeddingCache(name, max_bytes=cache_mb * 1024 * 1024)
+    return _caches[name]
+
+
+def get_embedding_model(model_name="sentence-transformers/all-MiniLM-L6-v2", cache_mb=0, batch_size=64,
+                        backend="torch"):
     """
     Returns a langchain Embeddings object backed by sentence-transformers.
+    With cache_mb > 0 it is wrapped in a persistent embedding cache of that size,
+    so unchanged chunks are not re-embedded across /index runs.
+
+    Models stay resident in a small LRU pool (see set_pool_size), so only the
+    first request for a given configuration pays for loading the weights.
     """
-    return SentenceTransformerEmbeddings(model_name=model_name)
+    key = (model_name, backend, cache_mb, batch_size)
+    with _pool_lock:
+        if key in _pool:
+            _pool.move_to_end(key)
+            return _pool[key]
+        loading = _loading.setdefault(key, threading.Lock())
+
+    # loading takes seconds; requests for models already in the pool must not wait on it
+    with loading:
+        with _pool_lock:
+            if key in _pool:
+                _pool.move_to_end(key)
+                return _pool[key]
+        logger.info(f"Loading embedding model {model_name} (backend={backend})")
+        try:
+            model = _load_model(model_name, backend, batch_size)
+        except Exception:
+            with _pool_lock:
+                _loading.pop(key, None)
+            raise
+        evicted = []
+        with _pool_lock:
+            if cache_mb:
+                model = CachedEmbeddings(model, _get_cache(model_name, backend, cache_mb), batch_size)
+            _pool[key] = model
+            _loading.pop(key, None)
+            while len(_pool) > _pool_size:
+                evicted.append(_pool.popitem(last=False))
+    for old_key, old in evicted:
+        if hasattr(old, "flush"):
+            old.flush()
+        logger.info(f"Evicted embedding model {old_key[0]} (backend={old_key[1]}) from pool")
+    return model
@@ -0,0 +1,154 @@
+# indexing/embedding_cache.py
+import hashlib
+import json
+import os
+import re
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+CACHE_DIR = "data/embedding_cache"
+
+
+class EmbeddingCache:
+    """
+    Content-addressed on-disk store of embedding vectors for one model.
+
+    Three memory-mapped arrays share a row number: `vectors.f32` (float32, dim wide),
+    `keys.bin` (20-byte sha1 of model name + text, all zero when free) and `ticks.i64` (last use, for
+    LRU eviction). The key -> row dict is rebuilt from keys.bin on open, so there is
+    no separate index file to keep consistent. Capacity is max_bytes / (dim * 4)
+    rows; when full, the least recently used `evict_fraction` of rows is dropped.
+    """
+
+    def __init__(self, model_name, max_bytes=512 * 1024 * 1024, cache_dir=CACHE_DIR, evict_fraction=0.1):
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.evict_fraction = evict_fraction
+        self.dir = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        os.makedirs(self.dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.dim = None
+        self.rows = {}  # {key: row}
+        self.free = []
+        self.tick = 0
+        meta_path = os.path.join(self.dir, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get("max_bytes") == max_bytes:
+                self._open(meta["dim"], "r+")
+            # a different size budget invalidates the layout; start over on first put
+
+    def key(self, text):
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode("utf-8")).digest()
+
+    def _open(self, dim, mode):
+        self.dim = dim
+        self.capacity = max(1, self.max_bytes // (dim * 4))
+        path = lambda name: os.path.join(self.dir, name)
+        self.vectors = np.memmap(path("vectors.f32"), dtype=np.float32, mode=mode, shape=(self.capacity, dim))
+        self.keys = np.memmap(path("keys.bin"), dtype=np.uint8, mode=mode, shape=(self.capacity, 20))
+        self.ticks = np.memmap(path("ticks.i64"), dtype=np.int64, mode=mode, shape=(self.capacity,))
+        occupied = self.keys.any(axis=1)
+        used = np.flatnonzero(occupied)
+        self.rows = {self.keys[row].tobytes(): row for row in used.tolist()}
+        self.free = np.flatnonzero(~occupied)[::-1].tolist()
+        self.tick = int(self.ticks.max()) if len(used) else 0
+        if mode == "w+":
+            with open(path("meta.json"), "w") as f:
+                json.dump({"model": self.model_name, "dim": dim, "max_bytes": self.max_bytes}, f)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get_many(self, keys):
+        """Returns a list aligned with `keys`: the cached vector, or None on a miss."""
+        with self.lock:
+            out = []
+            self.tick += 1
+            for k in keys:
+                row = self.rows.get(k)
+                if row is None:
+                    out.append(None)
+                else:
+                    self.ticks[row] = self.tick
+                    out.append(np.array(self.vectors[row]))
+            return out
+
+    def put_many(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self.lock:
+            if self.dim is None:
+                self._open(vectors.shape[1], "w+")
+            self.tick += 1
+            for k, v in zip(keys, vectors):
+                if k in self.rows:
+                    continue
+                if not self.free:
+                    self._evict()
+                row = self.free.pop()
+                # clear the key first so a crash mid-write never maps a key to a torn vector
+                self.keys[row] = 0
+                self.vectors[row] = v
+                self.keys[row] = np.frombuffer(k, dtype=np.uint8)
+                self.ticks[row] = self.tick
+                self.rows[k] = row
+
+    def _evict(self):
+        n = max(1, int(self.capacity * self.evict_fraction))
+        victims = np.argpartition(self.ticks, n - 1)[:n]
+        for row in victims.tolist():
+            self.rows.pop(self.keys[row].tobytes(), None)
+            self.keys[row] = 0
+            self.ticks[row] = 0
+            self.free.append(row)
+
+    def flush(self):
+        with self.lock:
+            if self.dim is not None:
+                self.vectors.flush()
+                self.keys.flush()
+                self.ticks.flush()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves repeated texts from an EmbeddingCache and sends
+    only the misses to the wrapped model, `batch_size` texts per call.
+
+    One instance serves every job using the model, so it keeps no hit/miss
+    counters itself; callers pass their own `counts` dict to embed_documents().
+    """
+
+    def __init__(self, base, cache: EmbeddingCache, batch_size=64):
+        self.base = base
+        self.cache = cache
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts, counts=None):
+        """`counts`, if given, gets this call's cache_hits/cache_misses added to it."""
+        texts = list(texts)
+        keys = [self.cache.key(t) for t in texts]
+        vectors = self.cache.get_many(keys)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if counts is not None:
+            counts["cache_hits"] = counts.get("cache_hits", 0) + len(texts) - len(missing)
+            counts["cache_misses"] = counts.get("cache_misses", 0) + len(missing)
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            embedded = self.base.embed_documents([texts[i] for i in batch])
+            self.cache.put_many([keys[i] for i in batch], embedded)
+            for i, v in zip(batch, embedded):
+                vectors[i] = v
+        return np.asarray(vectors, dtype=np.float32).tolist()
+
+    def embed_query(self, text):
+        return self.base.embed_query(text)
+
+    def embed_queries(self, texts):
+        # queries are not cached on disk: they rarely repeat across restarts
+        return self.base.embed_documents(list(texts))
+
+    def flush(self):
+        self.cache.flush()
@@ -0,0 +1,207 @@
+# indexing/lexical.py
+import math
+import re
+from collections import Counter, defaultdict
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9_]+(?:[.\-/:][a-z0-9_]+)*")
+SPLIT_RE = re.compile(r"[.\-/:]")
+MAX_TOKEN = 64
+
+
+def tokenize(text):
+    """
+    Lowercased word tokens. Identifiers joined by . - / : (error codes, versions,
+    dotted API names) are kept whole and also split into their parts, so
+    "ERR-404" matches queries for "err-404" and for "404".
+    """
+    out = []
+    for tok in TOKEN_RE.findall(text.lower()):
+        tok = tok[:MAX_TOKEN]
+        out.append(tok)
+        if SPLIT_RE.search(tok):
+            out += [part for part in SPLIT_RE.split(tok) if part]
+    return out
+
+
+def _pack(strings):
+    # newline-joined utf-8: far smaller than a fixed-width numpy string array
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _unpack(array):
+    data = array.tobytes().decode("utf-8")
+    return data.split("\n") if data else []
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over chunk texts, keyed by the same chunk ids as the FAISS
+    index. Postings are frozen into flat integer arrays (per-term offsets into one
+    doc-number array and one term-frequency array), so a snapshot is a single .npz
+    that loads without unpickling. Chunks added since the last compact() sit in
+    small per-term lists; deleted chunks are tombstoned and dropped by compact().
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.terms = {}  # {term: row in offsets}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.docs = np.zeros(0, dtype=np.int32)
+        self.tfs = np.zeros(0, dtype=np.int32)
+        self.pending = defaultdict(list)  # {term: [(doc, tf)]} not yet frozen
+        self.ids = []  # doc number -> chunk id
+        self.doc_of = {}  # chunk id -> doc number, live chunks only
+        self.lengths = np.zeros(0, dtype=np.float32)
+        self.live = np.zeros(0, dtype=bool)
+        self.total_length = 0.0
+
+    def __len__(self):
+        return len(self.doc_of)
+
+    def add(self, ids, texts):
+        """Index chunks; an id that is already present is replaced."""
+        self.delete([cid for cid in ids if cid in self.doc_of])
+        base = len(self.ids)
+        lengths = []
+        for n, (cid, text) in enumerate(zip(ids, texts)):
+            counts = Counter(tokenize(text))
+            for term, tf in counts.items():
+                self.pending[term].append((base + n, tf))
+            lengths.append(sum(counts.values()))
+            self.doc_of[cid] = base + n
+        self.ids += list(ids)
+        self.lengths = np.concatenate([self.lengths, np.asarray(lengths, dtype=np.float32)])
+        self.live = np.concatenate([self.live, np.ones(len(lengths), dtype=bool)])
+        self.total_length += sum(lengths)
+
+    def delete(self, ids):
+        for cid in ids:
+            doc = self.doc_of.pop(cid, None)
+            if doc is not None:
+                self.live[doc] = False
+                self.total_length -= float(self.lengths[doc])
+
+    def postings(self, term):
+        """(doc numbers, term frequencies) of `term`, tombstoned docs included."""
+        row = self.terms.get(term)
+        docs = tfs = None
+        if row is not None:
+            start, end = self.offsets[row], self.offsets[row + 1]
+            docs, tfs = self.docs[start:end], self.tfs[start:end]
+        extra = self.pending.get(term)
+        if extra:
+            extra = np.asarray(extra, dtype=np.int32)
+            if docs is None:
+                return extra[:, 0], extra[:, 1]
+            return np.concatenate([docs, extra[:, 0]]), np.concatenate([tfs, extra[:, 1]])
+        if docs is None:
+            return self.docs[:0], self.tfs[:0]
+        return docs, tfs
+
+    def term_stats(self, terms):
+        """(live chunks, total length, {term: document frequency}): the statistics search() can take."""
+        df = {}
+        for term in set(terms):
+            docs, _ = self.postings(term)
+            df[term] = int(np.count_nonzero(self.live[docs])) if len(docs) else 0
+        return len(self.doc_of), self.total_length, df
+
+    def search(self, query, k=10, stats=None):
+        """
+        Top-k (chunk id, BM25 score) pairs, best first. `stats` replaces this
+        index's collection statistics with term_stats() summed over several indexes
+        (the shards of one collection), so their scores can be merged.
+        """
+        if not len(self.doc_of):
+            return []
+        n, total_length, dfs = stats if stats is not None else (len(self.doc_of), self.total_length, {})
+        avg_length = total_length / n or 1.0
+        # only documents in the query terms' postings are scored, so the cost
+        # follows the postings touched rather than the corpus size
+        doc_parts, score_parts = [], []
+        for term in set(tokenize(query)):
+            docs, tfs = self.postings(term)
+            if not len(docs):
+                continue
+            df = dfs[term] if term in dfs else int(np.count_nonzero(self.live[docs]))
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[docs] / avg_length)
+            doc_parts.append(docs)
+            score_parts.append((idf * tfs * (self.k1 + 1) / (tfs + norm)).astype(np.float32))
+        if not doc_parts:
+            return []
+        if len(doc_parts) == 1:
+            docs, scores = doc_parts[0], score_parts[0]  # one posting list: each doc once, in doc order
+        else:
+            docs, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(score_parts)).astype(np.float32)
+        if len(self.doc_of) < len(self.ids):  # this index's own tombstones, whatever `n` covers
+            live = self.live[docs]
+            docs, scores = docs[live], scores[live]
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(self.ids[d], float(s)) for d, s in zip(docs[hits].tolist(), scores[hits].tolist())]
+
+    def compact(self):
+        """Fold pending postings into the frozen arrays and renumber away deleted chunks."""
+        terms = list(self.terms)
+        rows = dict(self.terms)
+        term_col = [np.repeat(np.arange(len(terms), dtype=np.int64), np.diff(self.offsets))]
+        doc_col, tf_col = [self.docs.astype(np.int64)], [self.tfs]
+        for term, plist in self.pending.items():
+            if term not in rows:
+                rows[term] = len(terms)
+                terms.append(term)
+            plist = np.asarray(plist, dtype=np.int64)
+            term_col.append(np.full(len(plist), rows[term], dtype=np.int64))
+            doc_col.append(plist[:, 0])
+            tf_col.append(plist[:, 1].astype(np.int32))
+        term_col, doc_col, tf_col = (np.concatenate(c) for c in (term_col, doc_col, tf_col))
+
+        keep = self.live[doc_col]
+        renumber = np.cumsum(self.live) - 1
+        term_col, doc_col, tf_col = term_col[keep], renumber[doc_col[keep]], tf_col[keep]
+        order = np.lexsort((doc_col, term_col))
+        counts = np.bincount(term_col, minlength=len(terms))
+        used = counts > 0
+        self.terms = {term: row for row, term in enumerate(t for t, u in zip(terms, used.tolist()) if u)}
+        self.offsets = np.concatenate([[0], np.cumsum(counts[used])]).astype(np.int64)
+        self.docs = doc_col[order].astype(np.int32)
+        self.tfs = tf_col[order].astype(np.int32)
+        self.pending = defaultdict(list)
+
+        live_docs = np.flatnonzero(self.live)
+        self.ids = [self.ids[d] for d in live_docs.tolist()]
+        self.doc_of = {cid: doc for doc, cid in enumerate(self.ids)}
+        self.lengths = self.lengths[live_docs]
+        self.live = np.ones(len(self.ids), dtype=bool)
+        self.total_length = float(self.lengths.sum())
+
+    def nbytes(self):
+        """Approximate memory held: posting arrays plus the term and id tables."""
+        arrays = (self.offsets, self.docs, self.tfs, self.lengths, self.live)
+        pending = sum(len(p) for p in self.pending.values())
+        return sum(a.nbytes for a in arrays) + 100 * (len(self.terms) + len(self.ids)) + 80 * pending
+
+    def save(self, path):
+        self.compact()
+        with open(path, "wb") as f:
+            np.savez(f, terms=_pack(self.terms), ids=_pack(self.ids), offsets=self.offsets,
+                     docs=self.docs, tfs=self.tfs, lengths=self.lengths, params=np.array([self.k1, self.b]))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            index = cls(k1=float(z["params"][0]), b=float(z["params"][1]))
+            index.terms = {term: row for row, term in enumerate(_unpack(z["terms"]))}
+            index.ids = _unpack(z["ids"])
+            index.offsets, index.docs, index.tfs = z["offsets"], z["docs"], z["tfs"]
+            index.lengths = z["lengths"]
+        index.doc_of = {cid: doc for doc, cid in enumerate(index.ids)}
+        index.live = np.ones(len(index.ids), dtype=bool)
+        index.total_length = float(index.lengths.sum())
+        return index
@@ -0,0 +1,183 @@
+# indexing/pipeline.py
+import contextvars
+import queue
+import threading
+import time
+from indexing.chunker import chunk_documents
+from utils.logger import get_logger
+
+_DONE = object()
+
+
+class StreamingPipeline:
+    """
+    crawl -> parse -> chunk -> embed -> index with the stages connected by bounded
+    queues, so embedding starts while the crawl is still running and memory is
+    bounded by `page_queue` pages plus `chunk_queue` chunks instead of the site size.
+
+    The crawler extracts each page (see crawler/extractor.py) and hands the parsed
+    doc to the chunk stage via its on_page hook; it keeps nothing itself. The
+    embed stage batches `embed_batch` chunks per model call and appends them to the
+    FAISS index. `on_first_index(store)` fires as soon as the first batch is
+    searchable.
+
+    On an incremental run with a Deduplicator holding the previous run's page state,
+    pages that were merged into a page that has changed are read back with
+    `reread(urls)` once the crawl ends and checked again.
+    """
+
+    def __init__(self, crawler, store, chunk_size=256, chunk_overlap=50, chunk_unit="chars",
+                 page_queue=64, chunk_queue=1024, embed_batch=64,
+                 incremental=False, on_first_index=None, dedup=None, reread=None):
+        self.crawler = crawler
+        self.store = store  # FaissVectorStore; its embeddings are used for the embed stage
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunk_unit = chunk_unit
+        self.embed_batch = embed_batch
+        self.incremental = incremental
+        self.on_first_index = on_first_index
+        self.dedup = dedup  # indexing.dedup.Deduplicator, applied between chunking and embedding
+        self.reread = reread  # callable(urls) -> parsed pages from the page store
+        self.released = set()  # copies of changed pages, to check again after the crawl
+        self.pages = queue.Queue(maxsize=page_queue)
+        self.chunks = queue.Queue(maxsize=chunk_queue)
+        self.error = None
+        self.replaced = set()
+        self.stats = {"pages": 0, "chunks": 0, "vectors": 0, "removed": 0}
+        self.logger = get_logger("pipeline")
+
+        crawler.keep_pages = False
+        crawler.on_page = self._put_page
+
+    def _put(self, q, item):
+        # blocking put that gives up once another stage has failed
+        while self.error is None:
+            try:
+                q.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+        raise RuntimeError("pipeline aborted") from self.error
+
+    def _get(self, q):
+        while self.error is None:
+            try:
+                return q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+        raise RuntimeError("pipeline aborted") from self.error
+
+    def _put_page(self, doc):
+        self._put(self.pages, doc)
+
+    def _stage(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+                self.logger.error(f"Pipeline stage {fn.__name__} failed: {e}")
+
+    def _crawl(self):
+        try:
+            self.crawl_result = self.crawler.start()
+        finally:
+            self._put(self.pages, _DONE)
+
+    def _chunk(self):
+        crawled = set()
+        while True:
+            doc = self._get(self.pages)
+            if doc is _DONE:
+                break
+            self.stats["pages"] += 1
+            if self.dedup is not None and self.incremental:
+                self.released |= self.dedup.release([doc["url"]])
+                crawled.add(doc["url"])
+            self._chunk_page(doc)
+        if self.released and self.reread is not None:
+            for doc in self.reread(sorted(self.released - crawled)):
+                self._chunk_page(doc)
+        self._put(self.chunks, _DONE)
+
+    def _chunk_page(self, doc):
+        if self.dedup is not None and not self.dedup.pages([doc]):
+            return
+        chunks = chunk_documents([doc], self.chunk_size, self.chunk_overlap, self.chunk_unit)
+        if self.dedup is not None:
+            chunks = self.dedup.chunks(chunks)
+        for chunk in chunks:
+            self._put(self.chunks, chunk)
+
+    def _embed(self):
+        batch = []
+        done = False
+        while not done:
+            item = self._get(self.chunks)
+            if item is _DONE:
+                done = True
+            else:
+                batch.append(item)
+            if batch and (done or len(batch) >= self.embed_batch):
+                self._index_batch(batch)
+                batch = []
+
+    def _index_batch(self, batch):
+        texts = [c["page_content"] for c in batch]
+        metadatas = [c["metadata"] for c in batch]
+        sources = set()
+        if self.incremental:
+            # replace what the saved index holds for these pages (once per page:
+            # a page's chunks can span several batches)
+            sources = {m["source"] for m in metadatas} - self.replaced
+            self.replaced |= sources
+        vectors = self.store.embed_documents(texts)
+        first = self.stats["vectors"] == 0
+        if self.store.index is None:
+            self.store.add_embeddings(texts, vectors, metadatas)
+        else:
+            # run() writes a full snapshot at the end, so skip the per-batch journal
+            self.stats["removed"] += self.store.apply(texts, vectors, metadatas,
+                                                      delete_sources=sources, journal=False)
+        self.stats["vectors"] += len(texts)
+        self.stats["chunks"] += len(batch)
+        if first:
+            self.stats["first_index_s"] = round(time.time() - self.t0, 3)
+            if self.on_first_index is not None:
+                self.on_first_index(self.store)
+
+    def run(self):
+        self.t0 = time.time()
+        if self.incremental:
+            self.store.load()
+        self.crawl_result = {}
+        # each stage thread runs in a copy of the caller's context so its timings
+        # land in the caller's request trace (utils/metrics.py)
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(self._stage, fn), daemon=True)
+                   for fn in (self._crawl, self._chunk, self._embed)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        try:
+            if self.error is not None:
+                raise self.error
+            if self.dedup is not None:
+                self.stats.update(self.dedup.stats)
+                dropped = {url for urls in self.dedup.merged.values() for url in urls}
+                if self.incremental and dropped and self.store.index is not None:
+                    # a page that is now a copy of another must not keep its old chunks
+                    self.stats["removed"] += self.store.apply([], [], [], delete_sources=dropped, journal=False)
+            if self.store.index is not None:
+                self.store.save()
+        except BaseException:
+            # sharded stores: drop the unsaved shard updates the servers hold for this run
+            self.store.discard()
+            raise
+        result = dict(self.crawl_result)
+        result.pop("urls", None)
+        result.update(self.stats)
+        result.update(self.store.cache_stats())
+        result["elapsed_s"] = round(time.time() - self.t0, 3)
+        return result
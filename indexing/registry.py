@@ -0,0 +1,86 @@
+# indexing/registry.py
+import threading
+from collections import OrderedDict
+from utils.logger import get_logger
+
+logger = get_logger("registry")
+
+
+class CollectionRegistry:
+    """
+    The collections currently loaded, by name, in least-recently-used order.
+    get() loads a collection on first use through `open_fn(name)` (which returns a
+    loaded FaissVectorStore, or None when the collection has no snapshot). After
+    every load or put, least recently used collections are dropped until at most
+    `max_loaded` remain and their estimated size (FaissVectorStore.memory_bytes)
+    fits in `budget_mb`; the collection just used always stays.
+
+    Dropping only releases the registry's reference: a request still holding the
+    store finishes on it, and the next get() loads the saved snapshot again.
+    """
+
+    def __init__(self, open_fn, budget_mb=2048, max_loaded=16):
+        self.open_fn = open_fn
+        self.budget = budget_mb * 1024 * 1024
+        self.max_loaded = max(1, max_loaded)
+        self.stores = OrderedDict()  # {name: FaissVectorStore}
+        self.loading = {}  # {name: lock}, so concurrent first requests load a collection once
+        self.lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, name):
+        """The loaded store for `name`, loading it if needed; None if it has no snapshot."""
+        with self.lock:
+            store = self.stores.get(name)
+            if store is not None:
+                self.stores.move_to_end(name)
+                return store
+            load_lock = self.loading.setdefault(name, threading.Lock())
+        with load_lock:
+            with self.lock:
+                store = self.stores.get(name)
+            if store is not None:
+                return store
+            store = self.open_fn(name)
+            if store is None:
+                return None
+            self.loads += 1
+            self.put(name, store)
+            return store
+
+    def put(self, name, store):
+        """Register a store that was just built (or loaded) as the current one for `name`."""
+        with self.lock:
+            self.stores[name] = store
+            self.stores.move_to_end(name)
+            self._evict(keep=name)
+
+    def drop(self, name):
+        with self.lock:
+            self.stores.pop(name, None)
+
+    def _evict(self, keep):
+        sizes = {name: store.memory_bytes() for name, store in self.stores.items()}
+        total = sum(sizes.values())
+        for name in list(self.stores):
+            if len(self.stores) <= self.max_loaded and total <= self.budget:
+                break
+            if name == keep:
+                continue
+            del self.stores[name]
+            total -= sizes[name]
+            self.evictions += 1
+            logger.info(f"Evicted collection {name} ({sizes[name] / 1e6:.1f} MB)")
+
+    def __contains__(self, name):
+        with self.lock:
+            return name in self.stores
+
+    def stats(self):
+        with self.lock:
+            loaded = [{"name": name, "vectors": store.vector_count(),
+                       "mb": round(store.memory_bytes() / 1e6, 2)} for name, store in reversed(self.stores.items())]
+        return {"loaded": loaded, "resident_mb": round(sum(c["mb"] for c in loaded), 2),
+                "budget_mb": round(self.budget / 1024 / 1024), "max_loaded": self.max_loaded,
+                "loads": self.loads, "evictions": self.evictions}
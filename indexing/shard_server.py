@@ -0,0 +1,245 @@
+# indexing/shard_server.py
+"""
+Serves shards of sharded collections (indexing/shards.py) over HTTP: searches
+with precomputed query vectors, and the writes the coordinating API process
+routes to the shard owning each source URL. One server can hold shards of
+several collections; shard snapshots live under
+<index dir>/collections/<name>/shards/NNN.
+
+    python -m indexing.shard_server --port 8101 --threads 4
+"""
+import argparse
+import threading
+from typing import List, Optional
+import faiss
+import numpy as np
+import yaml
+from fastapi import FastAPI
+from pydantic import BaseModel
+from indexing import vectorstore
+from indexing.registry import CollectionRegistry
+from indexing.shards import decode_vectors
+from indexing.vectorstore import FaissVectorStore, RETRIEVAL_MODES, chunk_id
+from utils.logger import get_logger
+
+logger = get_logger("shard_server")
+
+app = FastAPI(title="RAG-Web shard server")
+
+index_cfg = {}
+building = {}  # {(collection, shard): FaissVectorStore filled by /build or /fork, /apply and swapped in by /save or /publish}
+lock = threading.Lock()
+
+
+class ShardRequest(BaseModel):
+    collection: str
+    shard: int
+    build: Optional[bool] = False  # address the store being built rather than the serving one
+
+
+class SearchRequest(ShardRequest):
+    queries: List[str]
+    depth: int
+    mode: Optional[str] = "vector"
+    vectors: Optional[str] = None  # base64 float32 query matrix (not needed for bm25)
+    dim: Optional[int] = 0
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    lexical_stats: Optional[list] = None  # [chunks, total length, {term: df}] over all shards
+
+
+class StatsRequest(ShardRequest):
+    terms: List[str]
+
+
+class BuildRequest(ShardRequest):
+    dim: int
+
+
+class ApplyRequest(ShardRequest):
+    texts: List[str] = []
+    metadatas: List[dict] = []
+    vectors: Optional[str] = ""
+    dim: Optional[int] = 0
+    delete_sources: List[str] = []
+    journal: Optional[bool] = True
+
+
+def make_store(collection, shard):
+    return FaissVectorStore(None, compact_ops=index_cfg.get("journal_compact_ops", 200), index_cfg=index_cfg,
+                            mmap=index_cfg.get("mmap", True), collection=collection, shard=shard)
+
+
+def open_shard(key):
+    """The saved snapshot of a (collection, shard), loaded; None if there is none."""
+    store = make_store(*key)
+    if not store.load():
+        return None
+    logger.info(f"Loaded {key[0]} shard {key[1]} ({store.vector_count()} vectors)")
+    return store
+
+
+# serving stores by (collection, shard), least recently used paged out as in the API
+# process (settings.yaml sharding.server_memory_budget_mb / server_max_loaded)
+stores = CollectionRegistry(open_shard)
+
+
+def get_store(req: ShardRequest):
+    """The store `req` addresses, loading the serving one from disk on first use; None if there is none."""
+    key = (req.collection, req.shard)
+    if req.build:
+        with lock:
+            return building.get(key)
+    return stores.get(key)
+
+
+def sizes(store):
+    """What the coordinator keeps per shard (ShardedStore.counts / sizes)."""
+    return {"vectors": store.vector_count(), "bytes": store.memory_bytes()}
+
+
+@app.get("/health")
+def api_health():
+    stats = stores.stats()
+    loaded = {f"{c}/{s}": entry["vectors"] for entry in stats["loaded"] for c, s in [entry["name"]]}
+    return {"status": "ok", "loaded": loaded, "resident_mb": stats["resident_mb"], "evictions": stats["evictions"],
+            "building": len(building)}
+
+
+@app.post("/load")
+def api_load(req: ShardRequest):
+    store = get_store(req)
+    if store is None:
+        return {"vectors": 0, "bytes": 0, "loaded": False}
+    return {**sizes(store), "loaded": True}
+
+
+@app.post("/search")
+def api_search(req: SearchRequest):
+    if req.mode not in RETRIEVAL_MODES:
+        return {"error": f"mode must be one of {', '.join(RETRIEVAL_MODES)}"}
+    store = get_store(req)
+    if store is None or store.index is None:
+        return {"results": [{} for _ in req.queries], "docs": {}}
+    vectors = decode_vectors(req.vectors, req.dim) if req.mode != "bm25" else None
+    results = store.rank(req.queries, req.depth, req.mode, vectors, req.nprobe, req.ef_search, req.lexical_stats)
+    ids = list({cid for r in results for ranking in r.values() for cid, _ in ranking})
+    docs = {chunk_id(d.metadata): {"page_content": d.page_content, "metadata": d.metadata}
+            for d in store.docstore.get_many(ids)}
+    return {"results": results, "docs": docs}
+
+
+@app.post("/stats")
+def api_stats(req: StatsRequest):
+    """BM25 statistics of the shard for the given terms, summed by the coordinator over all shards."""
+    store = get_store(req)
+    if store is None or store.lexical is None:
+        return {"stats": [0, 0.0, {}]}
+    return {"stats": store.lexical.term_stats(req.terms)}
+
+
+@app.post("/build")
+def api_build(req: BuildRequest):
+    """Start a new snapshot of the shard; searches keep using the current one until /save."""
+    store = make_store(req.collection, req.shard)
+    store.add_embeddings([], np.zeros((0, req.dim), dtype=np.float32), [])
+    with lock:
+        building[(req.collection, req.shard)] = store
+    return {"status": "building"}
+
+
+@app.post("/fork")
+def api_fork(req: ShardRequest):
+    """
+    Start an incremental change of the shard: a copy loaded from its snapshot and
+    journal takes the writes (build=true) while searches keep using the serving
+    store until /publish or /save.
+    """
+    store = make_store(req.collection, req.shard)
+    if not store.load():
+        return {"forked": False}
+    with lock:
+        building[(req.collection, req.shard)] = store
+    return {"forked": True}
+
+
+@app.post("/publish")
+def api_publish(req: ShardRequest):
+    """Swap a forked shard in as the serving store without a snapshot (its writes are journaled)."""
+    key = (req.collection, req.shard)
+    with lock:
+        store = building.pop(key, None)
+    if store is None:
+        return {"vectors": 0, "bytes": 0, "published": False}
+    stores.put(key, store)
+    return {**sizes(store), "published": True}
+
+
+@app.post("/discard")
+def api_discard(req: ShardRequest):
+    """Drop a build or fork that will not be saved or published (a failed or cancelled update)."""
+    with lock:
+        store = building.pop((req.collection, req.shard), None)
+    return {"discarded": store is not None}
+
+
+@app.post("/apply")
+def api_apply(req: ApplyRequest):
+    store = get_store(req)
+    vectors = decode_vectors(req.vectors, req.dim) if req.texts else []
+    if store is None:
+        if req.build:
+            return {"error": f"no build in progress for {req.collection} shard {req.shard}"}
+        if not req.texts:
+            return {"removed": 0}
+        # first write to a shard that has no snapshot yet
+        store = make_store(req.collection, req.shard)
+        store.add_embeddings(req.texts, vectors, req.metadatas)
+        store.save()
+        stores.put((req.collection, req.shard), store)
+        return {"removed": 0}
+    return {"removed": store.apply(req.texts, vectors, req.metadatas, delete_sources=req.delete_sources,
+                                   journal=req.journal)}
+
+
+@app.post("/save")
+def api_save(req: ShardRequest):
+    """Write a full snapshot; for a build, swap it in as the serving store."""
+    store = get_store(req)
+    if store is None:
+        return {"vectors": 0, "bytes": 0}
+    store.save()
+    if req.build:
+        with lock:
+            building.pop((req.collection, req.shard), None)
+        stores.put((req.collection, req.shard), store)
+    return sizes(store)
+
+
+def main():
+    import uvicorn
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8101)
+    ap.add_argument("--config", default="config/settings.yaml")
+    ap.add_argument("--index-dir", default=None, help=f"default: {vectorstore.INDEX_DIR}")
+    ap.add_argument("--threads", type=int, default=0, help="FAISS threads (0 = library default)")
+    args = ap.parse_args()
+
+    global stores
+    with open(args.config) as f:
+        cfg = yaml.safe_load(f)
+    index_cfg.update(cfg["vectorstore"])
+    sharding = cfg.get("sharding", {})
+    stores = CollectionRegistry(open_shard, budget_mb=sharding.get("server_memory_budget_mb", 2048),
+                                max_loaded=sharding.get("server_max_loaded", 64))
+    if args.index_dir:
+        vectorstore.INDEX_DIR = args.index_dir
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,493 @@
+# indexing/shards.py
+import atexit
+import base64
+import heapq
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
+import requests
+from langchain.docstore.document import Document
+from indexing import vectorstore
+from indexing.lexical import tokenize
+from indexing.vectorstore import FaissVectorStore, RETRIEVAL_MODES, search_depth, select
+from utils.logger import get_logger
+from utils.metrics import Counter, timed
+
+logger = get_logger("shards")
+
+WRITE_BATCH = 512  # chunks per /apply call
+MAX_CACHED_TERMS = 100000
+WRITE_TIMEOUT_S = 600
+LOAD_TIMEOUT_S = 60
+
+SHARD_FAILURES = Counter("rag_shard_failures_total", "Shard calls that failed or timed out", ["server", "op"])
+
+
+def shard_of(source, shards):
+    """Shard of a source URL: every chunk of a page lives in one shard, so replacing a page touches one shard."""
+    return zlib.crc32(source.encode("utf-8")) % shards
+
+
+def encode_vectors(vectors):
+    return base64.b64encode(np.ascontiguousarray(vectors, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def decode_vectors(data, dim):
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).reshape(-1, dim)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ShardServer:
+    """
+    Client side of one shard server (indexing/shard_server.py). After a failed or
+    timed-out call the server is skipped for `retry_s` seconds, so a dead or
+    stalled process costs one timeout rather than one per query. A local server
+    (`port` set) that has exited is restarted once that window has passed.
+    """
+
+    def __init__(self, url, retry_s=10, port=None, args=()):
+        self.url = url.rstrip("/")
+        self.retry_s = retry_s
+        self.port = port
+        self.args = list(args)
+        self.process = None
+        self.session = requests.Session()
+        self.session.trust_env = False  # skips the proxy/netrc lookups requests otherwise does on every call
+        self.session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=32))
+        self.down_until = 0.0
+        self.failures = 0
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def spawn(self):
+        cmd = [sys.executable, "-m", "indexing.shard_server", "--port", str(self.port)] + self.args
+        # same working directory as this process (relative data and config paths), with the package importable
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+        self.process = subprocess.Popen(cmd, env=env)
+
+    def available(self):
+        if time.monotonic() < self.down_until:
+            return False
+        with self.lock:
+            if self.process is not None and self.process.poll() is not None:
+                logger.warning(f"Shard server {self.url} exited ({self.process.returncode}); restarting")
+                self.spawn()
+        return True
+
+    def post(self, path, payload, timeout):
+        response = self.session.post(self.url + path, json=payload, timeout=timeout)
+        response.raise_for_status()
+        body = response.json()
+        if "error" in body:
+            raise RuntimeError(body["error"])
+        return body
+
+    def failed(self, op, error):
+        self.failures += 1
+        self.last_error = str(error)
+        self.down_until = time.monotonic() + self.retry_s
+        SHARD_FAILURES.inc(server=self.url, op=op)
+        logger.warning(f"Shard server {self.url} {op} failed: {error}")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def status(self):
+        return {"url": self.url, "up": time.monotonic() >= self.down_until, "failures": self.failures,
+                "last_error": self.last_error, "local": self.port is not None}
+
+
+class ShardPool:
+    """
+    The shard servers of the process. With `endpoints` (URLs of servers started
+    with `python -m indexing.shard_server` on this or other nodes) those are
+    used; otherwise `workers` local server processes are started on first use and
+    stopped at exit. Shard i of any collection is served by server i % servers,
+    so a collection may have more shards than there are servers.
+
+    gather() gives up on servers that have not answered within `timeout_ms` and
+    returns what the others found; writes wait and raise on any failure, since a
+    silently missing shard update would leave the index inconsistent.
+    """
+
+    def __init__(self, endpoints=None, workers=2, timeout_ms=2000, retry_s=10, startup_s=60, index_dir=None):
+        self.endpoints = list(endpoints or [])
+        self.workers = max(1, workers)
+        self.timeout = timeout_ms / 1000.0
+        self.retry_s = retry_s
+        self.startup_s = startup_s
+        self.index_dir = index_dir
+        self.servers = []
+        self.executor = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg, index_dir=None):
+        return cls(endpoints=cfg.get("endpoints"), workers=cfg.get("workers", 2),
+                   timeout_ms=cfg.get("timeout_ms", 2000), retry_s=cfg.get("retry_s", 10), index_dir=index_dir)
+
+    def start(self):
+        with self.lock:
+            if self.servers:
+                return
+            if self.endpoints:
+                servers = [ShardServer(url, self.retry_s) for url in self.endpoints]
+            else:
+                # split the cores between the servers so FAISS threads do not oversubscribe them
+                threads = max(1, (os.cpu_count() or 1) // self.workers)
+                args = ["--threads", str(threads)] + (["--index-dir", self.index_dir] if self.index_dir else [])
+                servers = []
+                for _ in range(self.workers):
+                    port = _free_port()
+                    servers.append(ShardServer(f"http://127.0.0.1:{port}", self.retry_s, port=port, args=args))
+                    servers[-1].spawn()
+                atexit.register(self.close)
+                self._wait_ready(servers)
+            self.executor = ThreadPoolExecutor(max_workers=4 * len(servers), thread_name_prefix="shard")
+            self.servers = servers
+            logger.info(f"Shard pool: {len(servers)} servers")
+
+    def _wait_ready(self, servers):
+        deadline = time.monotonic() + self.startup_s
+        pending = list(servers)
+        while pending and time.monotonic() < deadline:
+            for server in list(pending):
+                if server.process is not None and server.process.poll() is not None:
+                    pending.remove(server)
+                    server.failed("start", f"exited with {server.process.returncode}")
+                    continue
+                try:
+                    server.session.get(server.url + "/health", timeout=1).raise_for_status()
+                    pending.remove(server)
+                except requests.RequestException:
+                    pass
+            if pending:
+                time.sleep(0.1)
+        for server in pending:
+            server.failed("start", f"not ready after {self.startup_s}s")
+
+    def server(self, shard):
+        self.start()
+        return self.servers[shard % len(self.servers)]
+
+    def gather(self, path, calls, timeout=None):
+        """
+        POSTs each (shard, payload) of `calls` to `path` at once. Replies in the same
+        order; None for shards that failed or did not answer within the timeout.
+        """
+        timeout = timeout or self.timeout
+        op = path.strip("/")
+        futures = []
+        for shard, payload in calls:
+            server = self.server(shard)
+            futures.append(self.executor.submit(server.post, path, payload, timeout) if server.available() else None)
+        wait([f for f in futures if f is not None], timeout=timeout)
+        replies = []
+        for (shard, _), future in zip(calls, futures):
+            if future is None:
+                replies.append(None)
+            elif not future.done():
+                # a running request cannot be cancelled: it keeps its pool thread until
+                # it ends or hits its own HTTP timeout (the same `timeout`), and its
+                # late reply is dropped
+                self.server(shard).failed(op, f"no reply within {timeout * 1000:.0f}ms")
+                replies.append(None)
+            elif future.exception() is not None:
+                self.server(shard).failed(op, future.exception())
+                replies.append(None)
+            else:
+                replies.append(future.result())
+        return replies
+
+    def write(self, calls):
+        """
+        calls: {shard: [(path, payload)]}. Each shard's calls run in order, shards in
+        parallel. Returns {shard: [reply]}; raises if any call fails.
+        """
+        def run(shard, ops):
+            server = self.server(shard)
+            out = []
+            for path, payload in ops:
+                try:
+                    out.append(server.post(path, payload, WRITE_TIMEOUT_S))
+                except Exception as e:
+                    server.failed(path.strip("/"), e)
+                    raise RuntimeError(f"shard {shard} ({server.url}) {path} failed: {e}")
+            return out
+
+        self.start()
+        futures = {shard: self.executor.submit(run, shard, ops) for shard, ops in calls.items() if ops}
+        return {shard: future.result() for shard, future in futures.items()}
+
+    def status(self):
+        return [server.status() for server in self.servers]
+
+    def close(self):
+        for server in self.servers:
+            server.stop()
+
+
+class ShardedStore(FaissVectorStore):
+    """
+    A collection partitioned by source URL (shard_of) across `shards` FAISS
+    shards, each held by a shard server process (see ShardPool). This process
+    embeds queries and chunks; searches are scattered to every shard with the
+    query vectors and the per-shard top-k candidates merged by score, so the
+    merged ranking is the one a single index would give. For BM25 that takes
+    collection-wide term statistics: document frequencies are summed over the
+    shards once per term and cached until the next write. Hybrid fuses the merged
+    dense and lexical rankings with the same reciprocal rank fusion as
+    FaissVectorStore.
+
+    A shard that fails or misses the pool timeout is left out of that search
+    rather than failing it; only when no shard answers does the search raise.
+
+    Writes go to the shard owning each source: build() / add_embeddings() on an
+    empty store start a new build on every shard that is swapped in by save()
+    (searches through this store see it as it fills, as the streaming pipeline
+    expects, while other stores keep the previous snapshot). apply() on a loaded
+    store first forks each shard it writes to -- the shard server loads a private
+    copy that takes this store's writes and searches -- and publish() or save()
+    swaps the forks in, so other stores keep serving the previous state until
+    then. A build or update that fails or is cancelled before that is dropped on
+    the shard servers by discard(). meta.json of the collection records the shard
+    count.
+
+    `index` is the shard layout once loaded or being built, so callers' `index is
+    None` checks mean what they do for FaissVectorStore. memory_bytes() is what
+    the shard servers reported holding for the collection at the last
+    load/publish/save, so the API's collection budget covers sharded collections
+    too (each shard server also pages out its least recently used shards).
+    """
+
+    def __init__(self, embeddings, pool, shards, index_cfg=None, model_name=None, collection=None, chunking=None):
+        super().__init__(embeddings, index_cfg=index_cfg, model_name=model_name, collection=collection,
+                         chunking=chunking)
+        self.pool = pool
+        self.shards = shards
+        self.building = False
+        self.forked = set()  # shards whose writes go to a private copy until publish()/save()
+        self.counts = {}  # {shard: vectors} as of the last load/save
+        self.sizes = {}  # {shard: bytes resident in its shard server}, likewise
+        self.term_stats = None  # (version, chunks, total length, {term: df}) summed over the shards
+        self.stats_lock = threading.Lock()
+
+    def exists(self):
+        return bool(self.read_meta(self.collection).get("shards"))
+
+    def load(self):
+        meta = self.read_meta(self.collection)
+        if not meta.get("shards"):
+            return False
+        self.shards = meta["shards"]
+        self.chunking = self.chunking or meta.get("chunking")
+        with self.lock:
+            # load every shard now rather than on the first query; an unreachable
+            # shard is reported and left out of searches until it is back
+            calls = [(s, self._payload(s)) for s in range(self.shards)]
+            for shard, reply in enumerate(self.pool.gather("/load", calls, LOAD_TIMEOUT_S)):
+                if reply is not None:
+                    self.counts[shard] = reply["vectors"]
+                    self.sizes[shard] = reply.get("bytes", 0)
+            self.index = {"shards": self.shards}
+            self.building = False
+            self.forked = set()
+            self.version = next(vectorstore._versions)
+        return True
+
+    def _payload(self, shard, **fields):
+        return {"collection": self.collection, "shard": shard, "build": self.building or shard in self.forked,
+                **fields}
+
+    def _fork(self, shards):
+        """Fork the given shards of a loaded store before their first write (see /fork)."""
+        shards = [s for s in shards if s not in self.forked]
+        if self.building or not shards:
+            return
+        replies = self.pool.write({s: [("/fork", self._payload(s))] for s in shards})
+        # a shard with no snapshot yet has nothing to fork; its first /apply creates it
+        self.forked |= {shard for shard, ops in replies.items() if ops[0].get("forked")}
+
+    def publish(self):
+        with self.lock:
+            if not self.forked:
+                return
+            replies = self.pool.write({s: [("/publish", self._payload(s))] for s in self.forked})
+            self.counts.update({shard: ops[0]["vectors"] for shard, ops in replies.items()})
+            self.sizes.update({shard: ops[0].get("bytes", 0) for shard, ops in replies.items()})
+            self.forked = set()
+
+    def discard(self):
+        with self.lock:
+            shards = range(self.shards) if self.building else sorted(self.forked)
+            if shards:
+                try:
+                    self.pool.write({s: [("/discard", self._payload(s))] for s in shards})
+                except Exception as e:
+                    logger.warning(f"Discarding the unfinished writes of {self.collection} failed: {e}")
+            if self.building:
+                self.index = None
+            self.building = False
+            self.forked = set()
+
+    def build(self, texts, vectors, metadatas):
+        with self.lock:
+            try:
+                self._begin(np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1).shape[1] if texts else None)
+                self.apply(texts, vectors, metadatas, journal=False)
+                self.save()
+            finally:
+                if self.building:
+                    self.discard()  # save() did not get to swap the build in
+        return {"vector_count": len(texts), "index_type": self.index_cfg["index_type"], "shards": self.shards,
+                "errors": [], **self.cache_stats()}
+
+    def _begin(self, dim):
+        if dim is None:
+            dim = len(self.embed_queries(["dimension probe"])[0])
+        self.building = True
+        self.pool.write({s: [("/build", self._payload(s, dim=dim))] for s in range(self.shards)})
+        self.index = {"shards": self.shards}
+        self.version = next(vectorstore._versions)
+
+    def add_embeddings(self, texts, vectors, metadatas):
+        with self.lock:
+            if self.index is None:
+                self._begin(len(vectors[0]))
+            self.apply(texts, vectors, metadatas, journal=False)
+        return len(texts)
+
+    def apply(self, texts, vectors, metadatas, delete_sources=(), journal=True):
+        with self.lock, timed("index_write", items=len(texts)):
+            rows = defaultdict(list)
+            for i, m in enumerate(metadatas):
+                rows[shard_of(m["source"], self.shards)].append(i)
+            deletes = defaultdict(list)
+            for source in delete_sources:
+                deletes[shard_of(source, self.shards)].append(source)
+            vectors = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1) if texts else None
+            self._fork(set(rows) | set(deletes))
+            calls = {}
+            for shard in set(rows) | set(deletes):
+                idx = rows.get(shard, [])
+                ops = []
+                # deletes go with the first batch so they cannot remove chunks a later batch adds
+                for start in range(0, max(1, len(idx)), WRITE_BATCH):
+                    part = idx[start:start + WRITE_BATCH]
+                    ops.append(("/apply", self._payload(
+                        shard, texts=[texts[i] for i in part], metadatas=[metadatas[i] for i in part],
+                        vectors=encode_vectors(vectors[part]) if part else "",
+                        dim=vectors.shape[1] if part else 0,
+                        delete_sources=deletes.get(shard, []) if start == 0 else [], journal=journal)))
+                calls[shard] = ops
+            replies = self.pool.write(calls)
+            if calls:
+                self.version = next(vectorstore._versions)
+            return sum(r["removed"] for ops in replies.values() for r in ops)
+
+    def save(self):
+        with self.lock, timed("index_save"):
+            replies = self.pool.write({s: [("/save", self._payload(s))] for s in range(self.shards)})
+            self.counts = {shard: ops[0]["vectors"] for shard, ops in replies.items()}
+            self.sizes = {shard: ops[0].get("bytes", 0) for shard, ops in replies.items()}
+            self.building = False
+            self.forked = set()
+            os.makedirs(self.index_path, exist_ok=True)
+            path = os.path.join(self.index_path, "meta.json")
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"embedding_model": self.model_name, "chunking": self.chunking,
+                           "index_type": self.index_cfg["index_type"], "vector_count": self.vector_count(),
+                           "shards": self.shards}, f)
+            os.replace(path + ".tmp", path)
+        if hasattr(self.embeddings, "flush"):
+            self.embeddings.flush()
+
+    def vector_count(self):
+        return sum(self.counts.values())
+
+    def memory_bytes(self):
+        return sum(self.sizes.values())
+
+    def retrieve_many(self, queries, k=3, nprobe=None, ef_search=None, mode="vector", vectors=None):
+        if self.index is None:
+            raise ValueError("Index not loaded")
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {RETRIEVAL_MODES}")
+        candidates, docs = self._scatter(queries, search_depth(mode, k), mode, vectors, nprobe, ef_search)
+        return [[docs[cid] for cid in select(c, mode, k) if cid in docs] for c in candidates]
+
+    def rank(self, queries, depth, mode="vector", vectors=None, nprobe=None, ef_search=None):
+        return self._scatter(queries, depth, mode, vectors, nprobe, ef_search)[0]
+
+    def _scatter(self, queries, depth, mode, vectors, nprobe, ef_search):
+        """Merged rank() candidates per query plus {chunk id: Document} for all of them."""
+        if mode != "bm25" and vectors is None:
+            vectors = self.embed_queries(queries)
+        fields = {"queries": queries, "depth": depth, "mode": mode, "nprobe": nprobe, "ef_search": ef_search}
+        if mode != "vector":
+            fields["lexical_stats"] = self._lexical_stats(queries)
+        if mode != "bm25":
+            vectors = np.asarray(vectors, dtype=np.float32).reshape(len(queries), -1)
+            fields.update(vectors=encode_vectors(vectors), dim=vectors.shape[1])
+        with timed("shard_search", items=len(queries)):
+            replies = self.pool.gather("/search", [(s, self._payload(s, **fields)) for s in range(self.shards)])
+        answered = [r for r in replies if r is not None]
+        if not answered:
+            raise RuntimeError(f"No shard of collection {self.collection} answered")
+        docs = {}
+        for reply in answered:
+            for cid, doc in reply["docs"].items():
+                docs[cid] = Document(page_content=doc["page_content"], metadata=doc["metadata"])
+        merged = []
+        for i in range(len(queries)):
+            candidates = {}
+            for ranking in ("dense", "lexical"):
+                lists = [reply["results"][i][ranking] for reply in answered if ranking in reply["results"][i]]
+                if lists:
+                    candidates[ranking] = heapq.nlargest(depth, itertools.chain(*lists), key=lambda c: c[1])
+            merged.append(candidates)
+        return merged, docs
+
+    def _lexical_stats(self, queries):
+        """Collection-wide BM25 statistics for the query terms; asks the shards only for terms not seen since the last write."""
+        terms = {t for q in queries for t in tokenize(q)}
+        with self.stats_lock:
+            cached = self.term_stats
+        if cached is None or cached[0] != self.version or len(cached[3]) > MAX_CACHED_TERMS:
+            cached = (self.version, 0, 0.0, {})
+        version, n, total, dfs = cached
+        missing = sorted(terms - dfs.keys())
+        if not missing and n:
+            return [n, total, {t: dfs[t] for t in terms}]
+        replies = self.pool.gather("/stats", [(s, self._payload(s, terms=missing)) for s in range(self.shards)])
+        n, total, found = 0, 0.0, dict.fromkeys(missing, 0)
+        for reply in replies:
+            if reply is not None:
+                shard_n, shard_total, shard_dfs = reply["stats"]
+                n, total = n + shard_n, total + shard_total
+                for term, df in shard_dfs.items():
+                    found[term] += df
+        if all(reply is not None for reply in replies):
+            with self.stats_lock:
+                self.term_stats = (version, n, total, {**dfs, **found})
+        return [n, total, {t: dfs.get(t, found.get(t, 0)) for t in terms}]
@@ -1,41 +1,751 @@
 # indexing/vectorstore.py
+import itertools
+import json
 import os
+import re
+import shutil
+import threading
+import faiss
+import numpy as np
 from langchain_community.vectorstores import FAISS
 from langchain.docstore.document import Document
-import faiss
-import pickle
+from indexing import ann
+from indexing.docstore import OverlayDocstore, SQLiteDocstore
+from indexing.embedding_cache import CachedEmbeddings
+from indexing.lexical import LexicalIndex
+from utils.logger import get_logger
+from utils.metrics import timed
 
 INDEX_DIR = "data/index"
+RETRIEVAL_MODES = ("vector", "bm25", "hybrid")
+RRF_K = 60  # reciprocal rank fusion constant for hybrid retrieval
+PROGRESS_BATCH = 256  # texts per embedding call when progress is reported
+
+DEFAULT_COLLECTION = "default"
+COLLECTION_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+logger = get_logger("vectorstore")
+
+_versions = itertools.count(1)  # process-wide, so a new store never reuses an old version
+_private_files = itertools.count(1)
+
+
+def collection_path(collection=None, shard=None):
+    """
+    Snapshot directory of a collection (the default one keeps the original
+    data/index/faiss_index), or of one shard of a sharded collection.
+    """
+    if not collection or collection == DEFAULT_COLLECTION:
+        path = os.path.join(INDEX_DIR, "faiss_index")
+    else:
+        path = os.path.join(INDEX_DIR, "collections", collection)
+    return path if shard is None else os.path.join(path, "shards", f"{shard:03d}")
+
+
+def collection_exists(collection=None):
+    """True if the collection has a saved snapshot, single-store or sharded (indexing/shards.py)."""
+    if FaissVectorStore(None, collection=collection).exists():
+        return True
+    return bool(FaissVectorStore.read_meta(collection).get("shards"))
+
+
+def list_collections():
+    """Names of the collections with a saved snapshot."""
+    names = [DEFAULT_COLLECTION] if collection_exists() else []
+    root = os.path.join(INDEX_DIR, "collections")
+    if os.path.isdir(root):
+        names += sorted(name for name in os.listdir(root) if collection_exists(name))
+    return names
+
+
+def search_depth(mode, k):
+    # hybrid goes deeper than k so chunks ranked well by only one ranking still surface
+    return max(4 * k, 20) if mode == "hybrid" else k
+
+
+def fuse(dense, lexical, k):
+    """Reciprocal rank fusion of two rankings of chunk ids."""
+    scores = {}
+    for ranking in (dense, lexical):
+        for rank, cid in enumerate(ranking):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+
+def select(candidates, mode, k):
+    """Top-k chunk ids for one query from its FaissVectorStore.rank() candidates."""
+    dense = [cid for cid, _ in candidates.get("dense", ())]
+    lexical = [cid for cid, _ in candidates.get("lexical", ())]
+    if mode == "hybrid":
+        return fuse(dense, lexical, k)
+    return (lexical if mode == "bm25" else dense)[:k]
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def chunk_id(metadata):
+    """Stable chunk id: the same page chunk keeps its id across rebuilds and upserts."""
+    return f"{metadata.get('source')}#{metadata.get('chunk_index', 0)}"
+
 
 class FaissVectorStore:
-    def __init__(self, embeddings):
+    """
+    LangChain FAISS index plus an incremental update path.
+
+    Every chunk is stored under chunk_id(metadata) (LangChain's index_to_docstore_id
+    maps FAISS labels to those ids, `label_of` the other way). upsert_documents /
+    delete_by_source do not rewrite the index: each change is appended to a journal
+    next to the snapshot (journal.jsonl plus one .npy of vectors per upsert) and
+    replayed on load. The journal is folded into a fresh snapshot once it holds
+    `compact_ops` entries. Records are numbered and the snapshot's meta.json keeps
+    the last number folded into it (`journal_seq`), so records left behind by a
+    crash during save() are skipped on replay.
+
+    Deletes never rebuild the index (see ann.delete_mode): flat indexes remove rows
+    in place, IVF removes them by label, and HNSW, which cannot remove, keeps the
+    deleted labels as `tombstones` that searches filter out. save() rebuilds an HNSW
+    index without its tombstones, outside `lock`.
+
+    Embedding runs outside `lock`; only the FAISS mutation holds it, and retrieve()
+    takes it too, so queries keep being served while an update is embedding.
+
+    `index_cfg` is the vectorstore section of settings.yaml and selects the FAISS
+    index type (flat, hnsw, ivf_flat, ivf_pq; see indexing/ann.py). Indexes that
+    start from a small streaming batch are built flat and converted to the
+    configured type when a snapshot is saved. nprobe / ef_search can be overridden
+    per query (retrieve).
+
+    On disk a snapshot is index.faiss (raw FAISS, loaded memory-mapped so worker
+    processes share its pages), ids.json (chunk ids by FAISS label) and
+    docstore.sqlite (chunk text and metadata, read lazily for the top-k hits; see
+    indexing/docstore.py). Neither is copied for an update: changes to a loaded
+    snapshot are held in memory on top of it (_ensure_writable) -- the docstore's
+    in an OverlayDocstore, and while the index is memory-mapped (read-only) new
+    vectors in a small flat `delta` index and deleted rows as tombstones -- and
+    are folded into the next snapshot by save(). Other stores loaded from the same
+    snapshot, such as the one serving /ask during an update, never see them.
+    Snapshots in LangChain's pickle format (index.pkl) still load and are
+    converted on load.
+
+    A BM25 inverted index over the same chunk ids (indexing/lexical.py) is kept in
+    step with every build and update and saved with the snapshot as lexical.npz;
+    retrieve() can search it alone (mode="bm25") or fuse it with the dense
+    ranking (mode="hybrid").
+
+    `version` changes whenever the indexed content does (build, load, update), so
+    query caches keyed by it never serve results from an older index.
+
+    Each named `collection` (one per site or tenant) has its own snapshot
+    directory, docstore and journal; see collection_path(). `shard` selects one
+    partition of a sharded collection (indexing/shards.py serves those).
+    """
+
+    def __init__(self, embeddings, compact_ops=200, index_cfg=None, model_name=None, mmap=True, collection=None,
+                 shard=None, chunking=None):
         self.embeddings = embeddings
+        self.index_cfg = ann.index_config(index_cfg)
+        self.model_name = model_name
+        self.chunking = chunking  # {"size", "overlap", "unit"} the chunks were cut with, kept in meta.json
+        self.mmap = mmap
+        self.collection = collection or DEFAULT_COLLECTION
         os.makedirs(INDEX_DIR, exist_ok=True)
-        self.index_path = os.path.join(INDEX_DIR, "faiss_index")
+        self.shard = shard
+        self.index_path = collection_path(self.collection, shard)
+        self.journal_dir = os.path.join(self.index_path, "journal")
+        self.docstore_path = os.path.join(self.index_path, "docstore.sqlite")
+        self.compact_ops = compact_ops
         self.index = None
         self.docstore = None
+        self.lexical = None
+        self.label_of = {}  # {chunk id: FAISS label}
+        self.next_label = 0  # next IVF label; IVF labels are never renumbered
+        self.tombstones = set()  # deleted labels still in the index (HNSW, or memory-mapped)
+        self._selector = None  # ann.exclude(tombstones), built on the next search
+        self.delta = None  # vectors added to a memory-mapped index: IndexIDMap2 over a flat index
+        self.delta_from = 0  # labels >= this are in `delta`
+        self.mmapped = False
+        self.journal_ops = 0
+        self.journal_seq = 0  # number of the last journal record written or folded in
+        self.cache_counts = {}  # embedding-cache hits/misses of this store's writes (one store per job)
+        self.version = 0
+        self.progress = None  # optional callback(embedded, total); may raise to abort a build
+        self.lock = threading.RLock()
 
     def index_documents(self, docs: list):
         """
         docs: list of dicts { page_content, metadata }
         """
         # convert to LangChain Document
-        lc_docs = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in docs]
-        vs = FAISS.from_documents(lc_docs, self.embeddings)
-        # save to disk
-        vs.save_local(self.index_path)
-        self.index = vs
-        return {"vector_count": len(lc_docs), "errors": []}
+        texts = [d["page_content"] for d in docs]
+        metadatas = [d["metadata"] for d in docs]
+        return self.build(texts, self.embed_documents(texts), metadatas)
 
-    def load(self):
-        if os.path.exists(self.index_path):
-            self.index = FAISS.load_local(self.index_path, self.embeddings)
+    def build(self, texts, vectors, metadatas):
+        """Replace the index with the given chunks and their precomputed vectors, and save it."""
+        with self.lock:
+            with timed("index_write", items=len(texts)):
+                self.index = self._wrap(ann.build_index(vectors, self.index_cfg), texts, metadatas)
+            # save to disk
+            self.save()
+        return {"vector_count": len(texts), "index_type": self.index_cfg["index_type"],
+                "errors": [], **self.cache_stats()}
+
+    def _wrap(self, index, texts, metadatas):
+        """LangChain FAISS around a prebuilt index whose rows are texts/metadatas in order."""
+        ids = [chunk_id(m) for m in metadatas]
+        # a new build gets its own docstore file; save() swaps it in, so a store that
+        # is still serving the previous snapshot keeps reading its own file
+        os.makedirs(self.index_path, exist_ok=True)
+        docstore = SQLiteDocstore.private(self._private_path())
+        docstore.add({cid: Document(page_content=t, metadata=m) for cid, t, m in zip(ids, texts, metadatas)})
+        self.docstore = docstore
+        self.lexical = LexicalIndex()
+        self.lexical.add(ids, texts)
+        self.version = next(_versions)
+        self.mmapped = False
+        self.delta = None
+        wrapped = FAISS(self.embeddings, index, docstore, {})
+        self._set_ids(wrapped, ids)
+        return wrapped
+
+    def _set_ids(self, wrapped, ids, labels=None):
+        """Label maps for `wrapped` (a LangChain FAISS) whose rows are `ids`; labels default to positions."""
+        labels = range(len(ids)) if labels is None else labels
+        wrapped.index_to_docstore_id = dict(zip(labels, ids))
+        self.label_of = dict(zip(ids, labels))
+        self.next_label = max(labels, default=-1) + 1
+        # an HNSW graph still holds the rows that are not in the map
+        self.tombstones = set(range(wrapped.index.ntotal)) - set(labels) if len(ids) < wrapped.index.ntotal else set()
+        self._selector = None
+
+    def upsert_documents(self, docs: list):
+        """
+        Add or replace pages: every chunk already stored for a source URL that appears
+        in `docs` is dropped and the new chunks are added in one journaled step.
+        Falls back to a full build when no index exists yet.
+        """
+        if self.index is None and not self.load():
+            return self.index_documents(docs)
+        texts = [d["page_content"] for d in docs]
+        metadatas = [d["metadata"] for d in docs]
+        vectors = self.embed_documents(texts) if texts else []
+        removed = self.apply(texts, vectors, metadatas, delete_sources={m["source"] for m in metadatas})
+        return {"vector_count": len(texts), "removed_count": removed, "errors": [], **self.cache_stats()}
+
+    def refresh_sources(self, docs: list, sources):
+        """
+        Incrementally replace every chunk whose source URL is in `sources` with `docs`
+        (sources with no new chunks are removed).
+        """
+        stats = self.upsert_documents(docs)
+        stats["removed_count"] = stats.get("removed_count", 0) + self.delete_by_source(
+            set(sources) - {d["metadata"]["source"] for d in docs})
+        return stats
+
+    def delete_by_source(self, sources):
+        """Drop every chunk of the given source URLs; returns the number removed."""
+        if self.index is None and not self.load():
+            return 0
+        return self.apply([], [], [], delete_sources=sources)
+
+    def publish(self):
+        """
+        Make this store's changes what other stores load. Journaled changes already
+        are; ShardedStore swaps its forked shards in.
+        """
+
+    def discard(self):
+        """
+        Give up a write that failed or was cancelled before save()/publish(). Private
+        files here go with the store; ShardedStore drops its shard servers' builds.
+        """
+
+    def add_embeddings(self, texts, vectors, metadatas):
+        """Add chunks whose vectors were computed by the caller (e.g. a streaming embed stage)."""
+        if self.index is None:
+            # a first streaming batch is too small to train IVF/PQ on; save() converts it
+            cfg = self.index_cfg if self.index_cfg["index_type"] in ("flat", "hnsw") else {**self.index_cfg, "index_type": "flat"}
+            with self.lock, timed("index_write", items=len(texts)):
+                self.index = self._wrap(ann.build_index(vectors, cfg), texts, metadatas)
+            return len(texts)
+        self.apply(texts, vectors, metadatas)
+        return len(texts)
+
+    def apply(self, texts, vectors, metadatas, delete_sources=(), journal=True):
+        """
+        Delete the chunks of `delete_sources`, then add the given chunks. journal=False
+        is for callers that write a full snapshot themselves when they finish.
+        """
+        with self.lock, timed("index_write", items=len(texts)):
+            self._ensure_writable()
+            stale = set(self.docstore.ids_for_sources(delete_sources)) if delete_sources else set()
+            ids = [chunk_id(m) for m in metadatas]
+            # an id may also be present without its source being replaced (re-adding a chunk)
+            stale |= {cid for cid in ids if cid in self.docstore}
+            stale = sorted(stale)
+            self._delete_ids(stale)
+            if texts:
+                self._add(texts, vectors, metadatas, ids)
+            if stale or texts:
+                self.version = next(_versions)
+            if journal and (stale or texts):
+                self._journal(stale, texts, vectors, metadatas, ids)
+        # compaction may rebuild the index, which must not hold up searches
+        if self.journal_ops >= self.compact_ops:
+            self.save()
+        return len(stale)
+
+    def _add(self, texts, vectors, metadatas, ids):
+        index = self.index.index
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape[1] != index.d:
+            raise ValueError(f"{vectors.shape[1]}-dimensional vectors cannot go into a {index.d}-dimensional index "
+                             f"(embedding model {self.model_name}?); rebuild the collection")
+        if self.mmapped:
+            if self.delta is None:
+                self.delta = faiss.IndexIDMap2(faiss.IndexFlat(index.d, index.metric_type))
+                self.delta_from = max(self.next_label, index.ntotal)
+                self.next_label = self.delta_from
+            labels = list(range(self.next_label, self.next_label + len(ids)))
+            self.delta.add_with_ids(vectors, np.asarray(labels, dtype=np.int64))
+            self.next_label += len(ids)
+        elif ann.delete_mode(index) == "ids":
+            labels = list(range(self.next_label, self.next_label + len(ids)))
+            index.add_with_ids(vectors, np.asarray(labels, dtype=np.int64))
+            self.next_label += len(ids)
+        else:
+            labels = list(range(index.ntotal, index.ntotal + len(ids)))
+            index.add(vectors)
+        self.docstore.add({cid: Document(page_content=t, metadata=m) for cid, t, m in zip(ids, texts, metadatas)})
+        self.index.index_to_docstore_id.update(zip(labels, ids))
+        self.label_of.update(zip(ids, labels))
+        self.lexical.add(ids, texts)
+
+    def _delete_ids(self, ids):
+        ids = [cid for cid in ids if cid in self.label_of]
+        if not ids:
+            return
+        self.lexical.delete(ids)
+        self.docstore.delete(ids)
+        id_of = self.index.index_to_docstore_id
+        labels = [self.label_of.pop(cid) for cid in ids]
+        for label in labels:
+            del id_of[label]
+        if self.mmapped and self.delta is not None:
+            added = [label for label in labels if label >= self.delta_from]
+            if added:
+                self.delta.remove_ids(np.asarray(added, dtype=np.int64))
+            labels = [label for label in labels if label < self.delta_from]
+        mode = ann.delete_mode(self.index.index)
+        if mode == "tombstone" or self.mmapped:
+            self.tombstones.update(labels)
+            self._selector = None
+            return
+        self.index.index.remove_ids(np.asarray(labels, dtype=np.int64))
+        if mode == "renumber":
+            self._set_ids(self.index, [cid for _, cid in sorted(id_of.items())])
+
+    def convert_index(self):
+        """
+        Rebuild the FAISS index as the configured type if it is not already (e.g.
+        flat -> IVF), or without its tombstoned rows (HNSW). The build runs outside
+        `lock` so searches keep being served; it is dropped if the index changed in
+        the meantime (the next save retries).
+        """
+        self._fold()
+        with self.lock:
+            if self.index is None:
+                return False
+            index = self.index.index
+            # an empty index (e.g. a shard no page hashed to) has nothing to train on
+            convert = index.ntotal > len(self.tombstones) and not ann.same_kind(index, self.index_cfg)
+            if not convert and not self.tombstones:
+                return False
+            version = self.version
+            labels = sorted(self.index.index_to_docstore_id)
+            ids = [self.index.index_to_docstore_id[label] for label in labels]
+            vectors = ann.reconstruct(index, labels)
+        cfg = self.index_cfg
+        if not ids and cfg["index_type"] not in ("flat", "hnsw"):
+            cfg = {**cfg, "index_type": "flat"}
+        with timed("index_rebuild", items=len(ids)):
+            fresh = ann.build_index(vectors, cfg)
+        with self.lock:
+            if self.version != version:
+                return False
+            self.index.index = fresh
+            self.mmapped = False
+            self._set_ids(self.index, ids)
             return True
-        return False
 
-    def retrieve(self, query, k=3):
+    def _ensure_writable(self):
+        """
+        Before the first change after load, put an OverlayDocstore over the
+        snapshot's docstore file, which other stores may be reading. Changes to a
+        memory-mapped index go to `delta` and `tombstones` (_add, _delete_ids).
+        """
+        if isinstance(self.docstore, SQLiteDocstore) and self.docstore.path == self.docstore_path:
+            self.docstore = OverlayDocstore(self.docstore)
+            self.index.docstore = self.docstore
+
+    def _fold(self):
+        """
+        Move the changes held over a memory-mapped index (`delta`, tombstoned rows)
+        into an in-memory copy of it, ahead of a snapshot. The copy is made outside
+        `lock`: the mapped index itself never changes.
+        """
+        with self.lock:
+            if not self.mmapped or (self.delta is None and not self.tombstones):
+                return
+            base = self.index.index
+        index = faiss.deserialize_index(faiss.serialize_index(base))
+        with self.lock:
+            if self.index.index is not base or not self.mmapped:
+                return
+            mode = ann.delete_mode(index)
+            id_of = self.index.index_to_docstore_id
+            if self.delta is not None:
+                added = faiss.vector_to_array(self.delta.id_map)
+                vectors = self.delta.index.reconstruct_n(0, self.delta.ntotal)
+            else:
+                added, vectors = np.zeros(0, dtype=np.int64), np.zeros((0, index.d), dtype=np.float32)
+            kept = sorted(label for label in id_of if label < self.delta_from or self.delta is None)
+            if mode != "tombstone" and self.tombstones:
+                index.remove_ids(np.asarray(sorted(self.tombstones), dtype=np.int64))
+            labels = list(range(len(kept))) if mode == "renumber" else list(kept)
+            if mode == "ids":
+                index.add_with_ids(vectors, added)
+                labels += added.tolist()
+            else:
+                labels += list(range(index.ntotal, index.ntotal + len(added)))
+                index.add(vectors)
+            ann.set_search_params(index, self.index_cfg["nprobe"], self.index_cfg["ef_search"])
+            ids = [id_of[label] for label in kept] + [id_of[label] for label in added.tolist()]
+            self.index.index = index
+            self.delta = None
+            self.mmapped = False
+            self._set_ids(self.index, ids, labels)
+
+    def _private_path(self):
+        return f"{self.docstore_path}.{os.getpid()}-{next(_private_files)}.building"
+
+    def _remove_stale_files(self):
+        """Private docstore copies left behind by processes that have exited."""
+        prefix = os.path.basename(self.docstore_path) + "."
+        for name in os.listdir(self.index_path):
+            if not (name.startswith(prefix) and ".building" in name):
+                continue
+            owner = name[len(prefix):].split("-")[0]
+            if owner.isdigit() and _alive(int(owner)):
+                continue
+            try:
+                os.remove(os.path.join(self.index_path, name))
+            except OSError:
+                pass
+
+    def _journal(self, deleted, texts, vectors, metadatas, ids):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self.journal_ops += 1
+        self.journal_seq += 1
+        record = {"seq": self.journal_seq, "delete": deleted}
+        if texts:
+            name = f"{self.journal_seq:06d}.npy"
+            np.save(os.path.join(self.journal_dir, name), np.asarray(vectors, dtype=np.float32))
+            record.update({"vectors": name, "ids": ids, "texts": texts, "metadatas": metadatas})
+        with open(os.path.join(self.journal_dir, "journal.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _replay_journal(self, folded_seq=0):
+        """Re-applies the journal records written after the snapshot (seq > folded_seq)."""
+        path = os.path.join(self.journal_dir, "journal.jsonl")
+        self.journal_seq = folded_seq
+        if not os.path.exists(path):
+            return
+        # the snapshot's docstore is as of the snapshot, so rows are replayed into the
+        # overlay along with the vectors
+        self._ensure_writable()
+        indexed = set(self.label_of)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # torn final write
+                seq = record.get("seq")
+                if seq is not None and seq <= folded_seq:
+                    continue  # already in the snapshot: save() crashed before removing the journal
+                vectors = None
+                if record.get("texts"):
+                    vectors_path = os.path.join(self.journal_dir, record["vectors"])
+                    if not os.path.exists(vectors_path):
+                        logger.error(f"Journal record {seq} of {self.index_path} lost its vectors; skipped")
+                        continue
+                    vectors = np.load(vectors_path)
+                # records from before seq numbering are replayed idempotently instead
+                present = (set(record["delete"]) | set(record.get("ids", []))) & indexed
+                self._delete_ids(sorted(present))
+                indexed -= present
+                if vectors is not None:
+                    self._add(record["texts"], vectors.tolist(), record["metadatas"], record["ids"])
+                    indexed |= set(record["ids"])
+                self.journal_seq = max(self.journal_seq, seq or 0)
+                self.journal_ops += 1
+
+    def cache_stats(self):
+        """This store's embedding-cache hits/misses since the last call ({} without a cache)."""
+        if not isinstance(self.embeddings, CachedEmbeddings):
+            return {}
+        stats = {"cache_hits": 0, "cache_misses": 0, **self.cache_counts}
+        self.cache_counts = {}
+        return stats
+
+    def save(self):
+        """Write a full snapshot and truncate the journal."""
+        self.convert_index()
+        with self.lock, timed("index_save"):
+            os.makedirs(self.index_path, exist_ok=True)
+            path = lambda name: os.path.join(self.index_path, name)
+            # write-then-rename: processes that mmap the old index.faiss keep a valid file
+            faiss.write_index(self.index.index, path("index.faiss.tmp"))
+            labels = sorted(self.index.index_to_docstore_id)
+            ids = [self.index.index_to_docstore_id[label] for label in labels]
+            with open(path("ids.json.tmp"), "w", encoding="utf-8") as f:
+                # a plain list when labels are positions; IVF labels after deletes, or
+                # HNSW tombstones a rebuild was skipped for, need the labels spelled out
+                if len(ids) == self.index.index.ntotal and labels[-1:] in ([], [len(labels) - 1]):
+                    json.dump(ids, f)
+                else:
+                    json.dump({"labels": labels, "ids": ids}, f)
+            with open(path("meta.json.tmp"), "w", encoding="utf-8") as f:
+                json.dump({"embedding_model": self.model_name, "chunking": self.chunking,
+                           "index_type": self.index_cfg["index_type"], "vector_count": self.index.index.ntotal,
+                           "journal_seq": self.journal_seq}, f)
+            self.lexical.save(path("lexical.npz.tmp"))
+            if isinstance(self.docstore, OverlayDocstore):
+                overlay = self.docstore
+                self.docstore = overlay.merged_into(self._private_path())
+                overlay.close()
+            if self.docstore.path != self.docstore_path:
+                self.docstore.close()
+                os.replace(self.docstore.path, self.docstore_path)
+                self.docstore = SQLiteDocstore(self.docstore_path)
+                self.index.docstore = self.docstore
+            for name in ("index.faiss", "ids.json", "meta.json", "lexical.npz"):
+                os.replace(path(name + ".tmp"), path(name))
+            if os.path.exists(path("index.pkl")):
+                os.remove(path("index.pkl"))  # superseded LangChain pickle snapshot
+            self._remove_journal()
+            self._remove_stale_files()
+            self.journal_ops = 0
+        if hasattr(self.embeddings, "flush"):
+            self.embeddings.flush()
+
+    def _remove_journal(self):
+        # rename first: a crash halfway through rmtree must not leave a journal.jsonl
+        # whose .npy files are gone (its records are skipped by journal_seq anyway)
+        old = self.journal_dir + ".old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.isdir(self.journal_dir):
+            os.replace(self.journal_dir, old)
+            shutil.rmtree(old, ignore_errors=True)
+
+    def exists(self):
+        return any(os.path.exists(os.path.join(self.index_path, name)) for name in ("ids.json", "index.pkl"))
+
+    def vector_count(self):
+        return len(self.index.index_to_docstore_id) if self.index is not None else 0
+
+    def memory_bytes(self):
+        """Rough resident size: the FAISS index (its file size once saved), id map and BM25 arrays."""
+        size = 0
+        if self.index is not None:
+            path = os.path.join(self.index_path, "index.faiss")
+            index = self.index.index
+            size += os.path.getsize(path) if os.path.exists(path) else index.ntotal * index.d * 4
+            if self.delta is not None:
+                size += self.delta.ntotal * (index.d * 4 + 8)
+            size += 200 * len(self.index.index_to_docstore_id)
+        if self.lexical is not None:
+            size += self.lexical.nbytes()
+        return size
+
+    @staticmethod
+    def read_meta(collection=None):
+        """meta.json of the saved snapshot (embedding model, chunking, index type), or {}."""
+        path = os.path.join(collection_path(collection), "meta.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def load(self):
+        if not self.exists():
+            return False
+        with self.lock:
+            legacy = not os.path.exists(os.path.join(self.index_path, "ids.json"))
+            if legacy:
+                self._load_legacy()
+            else:
+                flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+                index = faiss.read_index(os.path.join(self.index_path, "index.faiss"), flags if self.mmap else 0)
+                with open(os.path.join(self.index_path, "ids.json"), encoding="utf-8") as f:
+                    ids = json.load(f)
+                labels = None
+                if isinstance(ids, dict):
+                    labels, ids = ids["labels"], ids["ids"]
+                self.docstore = SQLiteDocstore(self.docstore_path)
+                self.index = FAISS(self.embeddings, index, self.docstore, {})
+                self._set_ids(self.index, ids, labels)
+                self.mmapped = self.mmap
+                lexical_path = os.path.join(self.index_path, "lexical.npz")
+                if os.path.exists(lexical_path):
+                    self.lexical = LexicalIndex.load(lexical_path)
+                else:
+                    self._build_lexical(ids)  # snapshot from before the lexical index existed
+            ann.set_search_params(self.index.index, self.index_cfg["nprobe"], self.index_cfg["ef_search"])
+            self.journal_ops = 0
+            meta_path = os.path.join(self.index_path, "meta.json")
+            meta = {}
+            if os.path.exists(meta_path):
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+            self.chunking = self.chunking or meta.get("chunking")
+            self._replay_journal(meta.get("journal_seq", 0))
+            self.version = next(_versions)
+            if legacy:
+                self.save()
+        return True
+
+    def _load_legacy(self):
+        # the pickle was written by this app (save_local), so unpickling it is trusted
+        legacy = FAISS.load_local(self.index_path, self.embeddings, allow_dangerous_deserialization=True)
+        positions = sorted(legacy.index_to_docstore_id.items())
+        docs = [legacy.docstore.search(cid) for _, cid in positions]
+        self.docstore = SQLiteDocstore.private(self._private_path())
+        self.docstore.add({cid: doc for (_, cid), doc in zip(positions, docs)})
+        self.index = FAISS(self.embeddings, legacy.index, self.docstore, {})
+        self._set_ids(self.index, [cid for _, cid in positions])
+        self.mmapped = False
+        self._build_lexical([cid for _, cid in positions])
+
+    def _build_lexical(self, ids):
+        texts = self.docstore.texts(ids)
+        self.lexical = LexicalIndex()
+        self.lexical.add(ids, [texts.get(cid, "") for cid in ids])
+
+    def retrieve(self, query, k=3, nprobe=None, ef_search=None, mode="vector", vector=None):
+        """
+        mode is "vector" (dense FAISS search), "bm25" (lexical only) or "hybrid"
+        (both rankings fused by reciprocal rank). `vector` is a precomputed query
+        embedding. nprobe (IVF) / ef_search (HNSW) override the configured values
+        for this query.
+        """
+        vectors = None if vector is None else [vector]
+        return self.retrieve_many([query], k=k, nprobe=nprobe, ef_search=ef_search, mode=mode, vectors=vectors)[0]
+
+    def retrieve_many(self, queries, k=3, nprobe=None, ef_search=None, mode="vector", vectors=None):
+        """
+        retrieve() for a batch of queries: one embedding call and one FAISS search
+        over the whole query matrix (see retrieval/batcher.py).
+        """
         if self.index is None:
             raise ValueError("Index not loaded")
-        docs = self.index.similarity_search(query, k=k)
-        # each doc is langchain Document with .page_content and .metadata
-        return docs
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {RETRIEVAL_MODES}")
+        if mode != "bm25" and vectors is None:
+            vectors = self.embed_queries(queries)
+        with self.lock:
+            candidates = self.rank(queries, search_depth(mode, k), mode, vectors, nprobe, ef_search)
+            ranked = [select(c, mode, k) for c in candidates]
+            # each doc is langchain Document with .page_content and .metadata
+            with timed("docstore_fetch"):
+                return [self.docstore.get_many(ids) for ids in ranked]
+
+    def rank(self, queries, depth, mode="vector", vectors=None, nprobe=None, ef_search=None, lexical_stats=None):
+        """
+        Per query {"dense": [(chunk id, score)], "lexical": [(chunk id, score)]}, best
+        first, `depth` of each ranking `mode` uses. Dense scores are negated L2
+        distances (inner products for IP indexes), so higher is better in both and
+        lists from stores built with the same model can be merged by score; BM25
+        scores are too when every store is given the same `lexical_stats` (see
+        LexicalIndex.search).
+        """
+        if mode != "bm25" and vectors is None:
+            vectors = self.embed_queries(queries)
+        out = [{} for _ in queries]
+        with self.lock:
+            if self.index is None:
+                raise ValueError("Index not loaded")
+            if mode != "bm25":
+                index = self.index.index
+                if self.tombstones and self._selector is None:
+                    self._selector = ann.exclude(self.tombstones)
+                params = ann.search_params(index, nprobe, ef_search, self._selector if self.tombstones else None)
+                queries_matrix = np.asarray(vectors, dtype=np.float32)
+                with timed("vector_search", items=len(queries)):
+                    scores, positions = index.search(queries_matrix, depth, params=params)
+                    if self.delta is not None and self.delta.ntotal:
+                        added_scores, added = self.delta.search(queries_matrix, depth)
+                        scores, positions = np.hstack([scores, added_scores]), np.hstack([positions, added])
+                if index.metric_type == faiss.METRIC_L2:
+                    scores = -scores
+                if scores.shape[1] > depth:
+                    best = np.argsort(-scores, axis=1, kind="stable")[:, :depth]
+                    scores = np.take_along_axis(scores, best, axis=1)
+                    positions = np.take_along_axis(positions, best, axis=1)
+                id_of = self.index.index_to_docstore_id
+                for o, row, hits in zip(out, scores.tolist(), positions.tolist()):
+                    o["dense"] = [(id_of[p], score) for p, score in zip(hits, row) if p >= 0]
+            if mode != "vector":
+                with timed("lexical_search", items=len(queries)):
+                    for o, q in zip(out, queries):
+                        o["lexical"] = self.lexical.search(q, depth, lexical_stats)
+        return out
+
+    def _embed(self, texts):
+        if isinstance(self.embeddings, CachedEmbeddings):
+            # counted here: the embeddings object is shared by concurrent jobs
+            return self.embeddings.embed_documents(texts, counts=self.cache_counts)
+        return self.embeddings.embed_documents(texts)
+
+    def embed_documents(self, texts):
+        if self.progress is None:
+            with timed("embed", items=len(texts)):
+                return self._embed(texts)
+        # embed in slices so a job can report progress (and stop) between them
+        vectors = []
+        self.progress(0, len(texts))
+        for start in range(0, len(texts), PROGRESS_BATCH):
+            batch = texts[start:start + PROGRESS_BATCH]
+            with timed("embed", items=len(batch)):
+                vectors += self._embed(batch)
+            self.progress(len(vectors), len(texts))
+        return vectors
+
+    def embed_query(self, query):
+        with timed("query_embed", items=1):
+            return self.embeddings.embed_query(query)
+
+    def embed_queries(self, queries):
+        """Query embeddings in one model call (not written to the chunk embedding cache)."""
+        embed = getattr(self.embeddings, "embed_queries", None)
+        with timed("query_embed", items=len(queries)):
+            if embed is not None:
+                return embed(queries)
+            if len(queries) == 1:
+                return [self.embeddings.embed_query(queries[0])]
+            return self.embeddings.embed_documents(queries)
+
+    def as_retriever(self, k=4, cache=None, mode="vector", batcher=None, nprobe=None, ef_search=None):
+        from retrieval.retriever import Retriever
+        return Retriever(store=self, k=k, cache=cache, mode=mode, batcher=batcher, nprobe=nprobe, ef_search=ef_search)
@@ -1,18 +1,38 @@
 # main.py
+import asyncio
+import json
+import os
 import yaml
+import threading
 import time
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from dotenv import load_dotenv
 load_dotenv()
 from crawler.crawler import WebCrawler
+from crawler.async_crawler import AsyncWebCrawler
+from crawler.manifest import CrawlManifest, MANIFEST_DIR
+from crawler.checkpoint import CrawlCheckpoint, CHECKPOINT_DIR
+from crawler.pagestore import PageStore, PAGE_STORE_DIR
 from crawler.parser import HTMLParser
 from indexing.chunker import chunk_documents
-from indexing.embedder import get_embedding_model
-from indexing.vectorstore import FaissVectorStore
-#from retrieval.retriever import Retriever
-from generation.generator import make_llm, build_qa_chain
+from indexing.dedup import Deduplicator
+from indexing.embedder import get_embedding_model, set_pool_size, set_threads
+from indexing import vectorstore
+from indexing.vectorstore import (FaissVectorStore, RETRIEVAL_MODES, COLLECTION_RE, collection_exists, collection_path,
+                                   list_collections)
+from indexing.shards import ShardedStore, ShardPool
+from indexing.registry import CollectionRegistry
+from indexing.pipeline import StreamingPipeline
+from retrieval.cache import QueryCache
+from retrieval.batcher import QueryBatcher
+from generation.context import pack_context
+from generation.generator import get_llm, build_prompt, format_prompt, stream_groq_api
+from utils import metrics
+from utils.jobs import JobQueue, JobCancelled
 from utils.logger import get_logger
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -22,7 +42,15 @@ logger = get_logger()
 with open("config/settings.yaml") as f:
     cfg = yaml.safe_load(f)
 
-app = FastAPI(title="RAG-Web API (LangChain prototype)")
+@asynccontextmanager
+async def lifespan(app):
+    if cfg["vectorstore"].get("warm_start", True):
+        warm_start()
+    yield
+    if _shard_pool is not None:
+        _shard_pool.close()
+
+app = FastAPI(title="RAG-Web API (LangChain prototype)", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,12 +60,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    # labelled by route template (/jobs/{job_id}, not each job's path) so the series
+    # count stays fixed; unmatched paths share one label. Streaming responses are
+    # timed to their first byte
+    route = request.scope.get("route")
+    endpoint = route.path if route is not None else "unmatched"
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint=endpoint, status=response.status_code)
+    return response
+
+set_pool_size(cfg["index"].get("model_pool_size", 2))
+set_threads(cfg["index"].get("embedding_threads", 0))
+
 # In-memory/global objects
+DEFAULT_COLLECTION = cfg["collections"].get("default", "default")
 _embeddings = None
-_vector_store = None
-_retriever = None
-_parsed_docs = []  # list of parsed pages (dicts)
-_crawled_pages = {}  # {url: html}
+# crawl to index per collection: {"urls": pages kept (their HTML is in the collection's page store),
+# "changed": urls to replace in the saved index, or None for a full rebuild, "indexed": an /index
+# has taken it}; see pending_crawl()
+_crawls = {}
+_crawls_lock = threading.Lock()
+# raw HTML per collection, shared by its crawls and index builds
+_page_stores = {}
+_page_stores_lock = threading.Lock()
+_query_cache = QueryCache.from_config(cfg["cache"]) if cfg["cache"].get("enabled", True) else None
+_query_batcher = QueryBatcher(
+    max_wait_ms=cfg["retrieval"].get("batch_max_wait_ms", 2),
+    max_batch=cfg["retrieval"].get("batch_max_size", 32)
+) if cfg["retrieval"].get("batching", False) else None
+# loaded collections, least recently used paged out (see open_collection)
+_collections = CollectionRegistry(
+    lambda name: open_collection(name),
+    budget_mb=cfg["collections"].get("memory_budget_mb", 2048),
+    max_loaded=cfg["collections"].get("max_loaded", 16)
+)
+# shard server processes, started when the first sharded collection is used
+_shard_pool = None
+_shard_pool_lock = threading.Lock()
+# /crawl, /index and /pipeline run here so they never hold up /ask
+_jobs = JobQueue(workers=cfg["jobs"].get("workers", 1), keep=cfg["jobs"].get("keep", 100))
 
 # Request models
 class CrawlRequest(BaseModel):
@@ -45,110 +109,625 @@ class CrawlRequest(BaseModel):
     max_pages: Optional[int] = cfg["crawl"]["max_pages"]
     max_depth: Optional[int] = cfg["crawl"]["max_depth"]
     crawl_delay_ms: Optional[int] = cfg["crawl"]["crawl_delay_ms"]
+    mode: Optional[str] = cfg["crawl"].get("mode", "sync")
+    concurrency: Optional[int] = cfg["crawl"].get("concurrency", 8)
+    parse_workers: Optional[int] = cfg["crawl"].get("parse_workers", 0)
+    incremental: Optional[bool] = cfg["crawl"].get("incremental", True)
+    sitemap: Optional[bool] = cfg["crawl"].get("sitemap", True)
+    max_page_kb: Optional[int] = cfg["crawl"].get("max_page_kb", 5120)
+    resume: Optional[bool] = False  # continue this site's unfinished (crashed or cancelled) crawl
+    collection: Optional[str] = DEFAULT_COLLECTION  # one index per site or tenant
+    trace: Optional[bool] = False  # return per-stage timings with the response
+    wait: Optional[bool] = False  # run inline and return the result instead of a job id
 
 class IndexRequest(BaseModel):
+    collection: Optional[str] = DEFAULT_COLLECTION
     chunk_size: Optional[int] = cfg["index"]["chunk_size"]
     chunk_overlap: Optional[int] = cfg["index"]["chunk_overlap"]
+    chunk_unit: Optional[str] = cfg["index"].get("chunk_unit", "chars")
     embedding_model: Optional[str] = cfg["index"]["embedding_model"]
+    shards: Optional[int] = cfg["sharding"].get("shards", 0)  # > 1 partitions a full build across shard servers
+    trace: Optional[bool] = False
+    wait: Optional[bool] = False
+
+class PipelineRequest(CrawlRequest):
+    chunk_size: Optional[int] = cfg["index"]["chunk_size"]
+    chunk_overlap: Optional[int] = cfg["index"]["chunk_overlap"]
+    chunk_unit: Optional[str] = cfg["index"].get("chunk_unit", "chars")
+    embedding_model: Optional[str] = cfg["index"]["embedding_model"]
+    page_queue: Optional[int] = cfg["pipeline"]["page_queue"]
+    chunk_queue: Optional[int] = cfg["pipeline"]["chunk_queue"]
+    embed_batch: Optional[int] = cfg["pipeline"]["embed_batch"]
+    shards: Optional[int] = cfg["sharding"].get("shards", 0)
 
 class AskRequest(BaseModel):
     question: str
+    collection: Optional[str] = DEFAULT_COLLECTION
     top_k: Optional[int] = 3
+    retrieval_mode: Optional[str] = cfg["retrieval"]["mode"]
     hf_model: Optional[str] = cfg["generation"]["hf_model"]
+    trace: Optional[bool] = False
+    nprobe: Optional[int] = None     # IVF lists probed; None uses vectorstore.nprobe
+    ef_search: Optional[int] = None  # HNSW search breadth; None uses vectorstore.ef_search
 
-@app.post("/crawl")
-def api_crawl(req: CrawlRequest):
-    global _crawled_pages, _parsed_docs
-    crawler = WebCrawler(
+def make_checkpoint(req: CrawlRequest):
+    """The collection's checkpoint for the site, or None if checkpointing is off."""
+    interval_s = cfg["crawl"].get("checkpoint_s", 5)
+    if not interval_s or interval_s <= 0:
+        return None
+    checkpoint_dir = CHECKPOINT_DIR
+    if req.collection != DEFAULT_COLLECTION:
+        checkpoint_dir = os.path.join(CHECKPOINT_DIR, req.collection)
+    return CrawlCheckpoint(req.start_url, checkpoint_dir=checkpoint_dir, interval_s=interval_s)
+
+def page_store_dir(collection):
+    if collection == DEFAULT_COLLECTION:
+        return PAGE_STORE_DIR
+    return os.path.join(PAGE_STORE_DIR, collection)
+
+def page_store(collection):
+    with _page_stores_lock:
+        if collection not in _page_stores:
+            _page_stores[collection] = PageStore(page_store_dir(collection),
+                                                 segment_mb=cfg["crawl"].get("page_segment_mb", 256))
+        return _page_stores[collection]
+
+def stored_crawl(collection):
+    """
+    The pages of the collection's last crawl, read from its page store, as a crawl
+    to fully rebuild from (every stored page if no crawl was recorded); None if
+    there are none. Pages later crawls no longer found are left out.
+    """
+    if not os.path.exists(os.path.join(page_store_dir(collection), "index.sqlite")):
+        return None
+    store = page_store(collection)
+    urls = store.crawl_urls() or store.urls()
+    return {"urls": urls, "changed": None} if urls else None
+
+def record_crawl(collection, crawler):
+    """Remember the pages a crawl kept for stored_crawl(); a stopped crawl adds to the previous set."""
+    urls = list(crawler.changed_urls) + sorted(crawler.unchanged)
+    page_store(collection).set_crawl(urls, merge=crawler.stopped.is_set())
+
+def pending_crawl(collection, urls, changed):
+    """
+    Hand a crawl to /index. Until an /index succeeds, the pages of earlier crawls
+    are kept with it, so their changes are not lost; a full crawl replaces them.
+    """
+    with _crawls_lock:
+        pending = _crawls.get(collection)
+        if pending is not None and not pending["indexed"] and changed is not None:
+            urls = list(dict.fromkeys(pending["urls"] + urls))
+            changed = None if pending["changed"] is None else pending["changed"] | changed
+        _crawls[collection] = {"urls": urls, "changed": changed, "indexed": False}
+
+def index_settings(req):
+    """What a collection's vectors depend on besides its pages, as saved in meta.json."""
+    return {"embedding_model": req.embedding_model,
+            "chunking": {"size": req.chunk_size, "overlap": req.chunk_overlap, "unit": req.chunk_unit}}
+
+def settings_changed(collection, req):
+    """True if `req` embeds or chunks differently from the collection's saved snapshot."""
+    meta = FaissVectorStore.read_meta(collection)
+    return any(meta.get(key) not in (None, value) for key, value in index_settings(req).items())
+
+def stored_docs(collection, urls):
+    """Parsed pages read back from the collection's page store, one page of HTML in memory at a time."""
+    parser = HTMLParser()
+    return [parser.parse_html(html, url) for url, html in page_store(collection).items(urls)]
+
+def make_crawler(req: CrawlRequest):
+    """Returns (crawler, incremental) for a crawl request."""
+    manifest = None
+    incremental = False
+    if req.incremental:
+        manifest_dir = MANIFEST_DIR
+        if req.collection != DEFAULT_COLLECTION:
+            manifest_dir = os.path.join(MANIFEST_DIR, req.collection)
+        manifest = CrawlManifest(req.start_url, manifest_dir=manifest_dir)
+        # without a saved index, unchanged pages would never reach it: fetch everything.
+        # The same when a pipeline changes the embedding model or chunking of the saved one
+        incremental = collection_exists(req.collection) and not (
+            isinstance(req, PipelineRequest) and settings_changed(req.collection, req))
+        if not incremental:
+            manifest.clear()
+
+    crawl_args = dict(
         start_url=req.start_url,
         max_depth=req.max_depth,
         max_pages=req.max_pages,
-        delay=req.crawl_delay_ms / 1000.0
+        delay=req.crawl_delay_ms / 1000.0,
+        manifest=manifest,
+        sitemap=req.sitemap,
+        sitemap_max_urls=cfg["crawl"].get("sitemap_max_urls", 50000),
+        checkpoint=make_checkpoint(req),
+        resume=req.resume,
+        store=page_store(req.collection),
+        max_bytes=req.max_page_kb * 1024,
+        keep_pages=False
     )
-    result = crawler.start()
-    _crawled_pages = crawler.pages
+    if req.mode == "async":
+        crawler = AsyncWebCrawler(concurrency=req.concurrency, parse_workers=req.parse_workers, **crawl_args)
+    else:
+        crawler = WebCrawler(**crawl_args)
+    return crawler, incremental
 
-    # parse immediately for easy indexing later
-    parser = HTMLParser()
-    _parsed_docs = parser.parse_multiple(_crawled_pages)
-    logger.info(f"Crawled {len(_parsed_docs)} pages.")
+def load_embeddings(model_name):
+    """Pooled embedding model configured from the index section of settings.yaml."""
+    return get_embedding_model(
+        model_name,
+        cache_mb=cfg["index"].get("embedding_cache_mb", 0),
+        batch_size=cfg["index"].get("embed_batch_size", 64),
+        backend=cfg["index"].get("embedding_backend", "torch")
+    )
+
+def shard_pool():
+    global _shard_pool
+    with _shard_pool_lock:
+        if _shard_pool is None:
+            _shard_pool = ShardPool.from_config(cfg["sharding"], index_dir=vectorstore.INDEX_DIR)
+        return _shard_pool
+
+def layout(collection, shards):
+    """Shard count for a write: a saved collection keeps its own; `shards` applies to new ones and full rebuilds."""
+    return FaissVectorStore.read_meta(collection).get("shards", 0) if shards is None else shards
+
+def make_store(embeddings, model_name, collection=None, shards=0, chunking=None):
+    if shards and shards > 1:
+        return ShardedStore(embeddings, shard_pool(), shards, index_cfg=cfg["vectorstore"], model_name=model_name,
+                            collection=collection, chunking=chunking)
+    return FaissVectorStore(
+        embeddings,
+        compact_ops=cfg["vectorstore"]["journal_compact_ops"],
+        index_cfg=cfg["vectorstore"],
+        model_name=model_name,
+        mmap=cfg["vectorstore"].get("mmap", True),
+        collection=collection,
+        chunking=chunking
+    )
+
+def open_collection(name):
+    """Load a collection's saved snapshot with the embedding model it was built with; None if there is none."""
+    if not collection_exists(name):
+        return None
+    t0 = time.time()
+    meta = FaissVectorStore.read_meta(name)
+    model_name = meta.get("embedding_model") or cfg["index"]["embedding_model"]
+    store = make_store(load_embeddings(model_name), model_name, collection=name, shards=meta.get("shards", 0))
+    store.load()
+    logger.info(f"Loaded collection {name} ({store.vector_count()} vectors) in {time.time() - t0:.2f}s")
+    return store
+
+def check_collection(name):
+    if not COLLECTION_RE.match(name or ""):
+        return "collection must be 1-64 letters, digits, '.', '_' or '-'"
+    return None
+
+def dedup_path(collection):
+    return os.path.join(collection_path(collection), "dedup.npz")
+
+def make_dedup(collection, incremental):
+    """An incremental run starts from the page dedup state the collection's last run saved."""
+    if not cfg["dedup"].get("enabled", True):
+        return None
+    dedup = Deduplicator.from_config(cfg["dedup"])
+    if incremental:
+        dedup.load(dedup_path(collection))
+    return dedup
+
+def save_dedup(collection, dedup):
+    """Keep a finished run's page dedup state for the next incremental one."""
+    path = dedup_path(collection)
+    try:
+        if dedup is not None:
+            dedup.save(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        # the index is written; the next incremental run just dedups against less
+        logger.warning(f"Could not save the dedup state of {collection}: {e}")
+
+def warm_start():
+    """Serve the default collection straight away after a restart; others load on first use."""
+    try:
+        _collections.get(DEFAULT_COLLECTION)
+    except Exception as e:
+        logger.error(f"Warm start failed: {e}")
+
+def submit(kind, run, req):
+    """Queues run(req, job) on the job pool and returns its id; wait=true runs it inline instead."""
+    error = check_collection(req.collection)
+    if error:
+        return {"error": error}
+    if req.wait:
+        return run(req, None)
+
+    def task(job):
+        result = run(req, job)
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result
+
+    job = _jobs.submit(kind, task, params=req.model_dump(exclude={"wait"}))
+    return {"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
+
+@app.post("/crawl")
+def api_crawl(req: CrawlRequest):
+    return submit("crawl", run_crawl, req)
+
+def run_crawl(req: CrawlRequest, job=None):
+    t0 = time.time()
+    with metrics.trace(req.trace) as spans:
+        crawler, incremental = make_crawler(req)
+        if job is not None:
+            # cancelling stops the crawl early; what was fetched is kept (the manifest already has it)
+            crawler.stopped = job.cancelled
+            job.probe = lambda: {"done": crawler.page_count(), "total": req.max_pages, "unit": "pages"}
+        result = crawler.start()
+    record_crawl(req.collection, crawler)
+    # only the urls are kept; /index reads the pages back from the page store
+    pending_crawl(req.collection, list(crawler.changed_urls), set(crawler.changed_urls) if incremental else None)
+    logger.info(f"Crawled {len(crawler.changed_urls)} pages into collection {req.collection}.")
+    result["cancelled"] = crawler.stopped.is_set()
+    result["timings"] = {"total_ms": round((time.time() - t0) * 1000, 2)}
+    if spans is not None:
+        result["trace"] = metrics.summarize(spans)
     return result
 
 @app.post("/index")
 def api_index(req: IndexRequest):
-    global _embeddings, _vector_store, _retriever
+    return submit("index", run_index, req)
+
+def run_index(req: IndexRequest, job=None):
+    global _embeddings
+    t0 = time.time()
     try:
-        if not _parsed_docs:
-            return {"error": "No pages crawled. Call /crawl first."}
+        # after a restart there is no crawl in memory: rebuild from the pages of the last one
+        with _crawls_lock:
+            pending = _crawls.get(req.collection)
+        crawl = pending or stored_crawl(req.collection)
+        if crawl is not None and crawl["changed"] is not None and settings_changed(req.collection, req):
+            # the saved vectors were made with another model or chunking; mixing them in is no good
+            logger.info(f"Embedding model or chunking changed for {req.collection}: rebuilding it")
+            crawl = stored_crawl(req.collection)
+        if crawl is None or (not crawl["urls"] and crawl["changed"] is None):
+            return {"error": f"No pages crawled for collection {req.collection}. Call /crawl first."}
+        changed_sources = crawl["changed"]
 
         # chunk
         logger.info(f"Received /index request with chunk_size")
                     
 
 
-        docs = chunk_documents(
-            _parsed_docs,
-            chunk_size=req.chunk_size,
-            chunk_overlap=req.chunk_overlap
-        )
+        with metrics.trace(req.trace) as spans:
+            with metrics.timed("parse", items=len(crawl["urls"])):
+                parsed_docs = stored_docs(req.collection, crawl["urls"])
+            dedup = make_dedup(req.collection, changed_sources is not None)
+            if dedup and changed_sources is not None:
+                # pages merged into a changed page are not indexed anywhere: check them again
+                copies = dedup.release(changed_sources)
+                if copies:
+                    parsed_docs += stored_docs(req.collection, sorted(copies))
+                    changed_sources = set(changed_sources) | copies
+            docs = chunk_documents(
+                dedup.pages(parsed_docs) if dedup else parsed_docs,
+                chunk_size=req.chunk_size,
+                chunk_overlap=req.chunk_overlap,
+                unit=req.chunk_unit,
+                workers=cfg["index"].get("chunk_workers", 0)
+            )
+            if dedup:
+                docs = dedup.chunks(docs)
+
+            # embeddings
+            _embeddings = load_embeddings(req.embedding_model)
 
-        # embeddings
-        _embeddings = get_embedding_model(req.embedding_model)
+            # vector store (FAISS). A full build writes new files and an incremental one
+            # keeps its changes in memory over the snapshot (FaissVectorStore._ensure_writable),
+            # so the store in _collections keeps serving the previous snapshot until put(); a sharded
+            # collection's shards are swapped in by the save()/publish() just before it
+            shards = layout(req.collection, None if changed_sources is not None else req.shards)
+            store = make_store(_embeddings, req.embedding_model, collection=req.collection, shards=shards,
+                               chunking=index_settings(req)["chunking"])
+            if job is not None:
+                job.update(pages=len(parsed_docs), chunks=len(docs))
 
-        # vector store (FAISS)
-        _vector_store = FaissVectorStore(_embeddings)
-        _vector_store.index_documents(docs)
+                def progress(done, total):
+                    job.advance(done, total, "chunks")
+                    job.check()  # a cancelled build stops before anything is written
+                store.progress = progress
+            try:
+                if changed_sources is not None:
+                    stats = store.refresh_sources(docs, changed_sources)
+                else:
+                    stats = store.index_documents(docs)
+                # sharded collections: swap the shards this update forked in
+                store.publish()
+            except BaseException:
+                store.discard()  # sharded collections: drop what the shard servers hold for it
+                raise
+            finally:
+                store.progress = None
 
-        # retriever wrapper
-        _retriever = _vector_store.index.as_retriever()
+        save_dedup(req.collection, dedup)
+        _collections.put(req.collection, store)
+        with _crawls_lock:
+            if pending is not None and _crawls.get(req.collection) is pending:
+                pending["indexed"] = True
 
-        return {
+        result = {
             "status": "success",
             "message": "Documents indexed successfully.",
+            "collection": req.collection,
             "documents_indexed": len(docs),
+            "incremental": changed_sources is not None,
+            "shards": shards,
+            "cache_hits": stats.get("cache_hits", 0),
+            "cache_misses": stats.get("cache_misses", 0),
             "chunk_size": req.chunk_size,
+            "duplicates": dedup.stats if dedup else None,
+            "timings": {"total_ms": round((time.time() - t0) * 1000, 2)},
         }
+        if spans is not None:
+            result["trace"] = metrics.summarize(spans)
+        return result
 
+    except JobCancelled:
+        raise
     except Exception as e:
         logger.error(f"Indexing failed: {e}")
         return {"error": f"Indexing failed: {str(e)}"}
 
 
+@app.post("/pipeline")
+def api_pipeline(req: PipelineRequest):
+    """Crawl and index in one streaming run; /ask works as soon as the first batch is indexed."""
+    return submit("pipeline", run_pipeline, req)
+
+def run_pipeline(req: PipelineRequest, job=None):
+    global _embeddings
+    try:
+        crawler, incremental = make_crawler(req)
+        _embeddings = load_embeddings(req.embedding_model)
+
+        def publish(store):
+            _collections.put(req.collection, store)
+
+        pipeline = StreamingPipeline(
+            crawler, make_store(_embeddings, req.embedding_model, collection=req.collection,
+                                shards=layout(req.collection, None if incremental else req.shards),
+                                chunking=index_settings(req)["chunking"]),
+            chunk_size=req.chunk_size,
+            chunk_overlap=req.chunk_overlap,
+            chunk_unit=req.chunk_unit,
+            page_queue=req.page_queue,
+            chunk_queue=req.chunk_queue,
+            embed_batch=req.embed_batch,
+            incremental=incremental,
+            on_first_index=publish,
+            dedup=make_dedup(req.collection, incremental),
+            reread=lambda urls: stored_docs(req.collection, urls)
+        )
+        if job is not None:
+            # cancelling stops the crawl; pages already fetched are still indexed and saved
+            crawler.stopped = job.cancelled
+            job.probe = lambda: {"done": pipeline.stats["pages"], "total": req.max_pages, "unit": "pages",
+                                 "vectors": pipeline.stats["vectors"]}
+        with metrics.trace(req.trace) as spans:
+            result = pipeline.run()
+        save_dedup(req.collection, pipeline.dedup)
+        record_crawl(req.collection, crawler)
+        if pipeline.store.index is not None:
+            publish(pipeline.store)
+        # pages went straight into the index; an incremental run leaves the changes of a
+        # crawl no /index has taken yet for one
+        with _crawls_lock:
+            pending = _crawls.get(req.collection)
+            if pending is not None and (pending["indexed"] or not incremental):
+                del _crawls[req.collection]
+        result["cancelled"] = crawler.stopped.is_set()
+        if spans is not None:
+            result["trace"] = metrics.summarize(spans)
+        return {"status": "success", "collection": req.collection, **result}
+
+    except Exception as e:
+        logger.error(f"Pipeline failed: {e}")
+        return {"error": f"Pipeline failed: {str(e)}"}
+
+
+@app.get("/jobs")
+def api_jobs():
+    return {"jobs": [job.to_dict() for job in reversed(_jobs.list())]}
+
+@app.get("/jobs/{job_id}")
+def api_job(job_id: str):
+    job = _jobs.get(job_id)
+    if job is None:
+        return {"error": f"Unknown job {job_id}"}
+    return job.to_dict()
+
+@app.post("/jobs/{job_id}/cancel")
+def api_cancel_job(job_id: str):
+    if _jobs.get(job_id) is None:
+        return {"error": f"Unknown job {job_id}"}
+    cancelled = _jobs.cancel(job_id)
+    return {"job_id": job_id, "cancelled": cancelled, "status": _jobs.get(job_id).status}
+
+
+@app.get("/collections")
+def api_collections():
+    """Collections saved on disk and the ones currently loaded."""
+    shards = _shard_pool.status() if _shard_pool is not None else []
+    return {"collections": list_collections(), **_collections.stats(), "shard_servers": shards}
+
+def check_ask(req: AskRequest):
+    """(retriever, None) for the request's collection, or (None, error message). May load the collection."""
+    error = check_collection(req.collection)
+    if error:
+        return None, error
+    if req.retrieval_mode not in RETRIEVAL_MODES:
+        return None, f"retrieval_mode must be one of {', '.join(RETRIEVAL_MODES)}"
+    if not req.top_k or req.top_k < 1:
+        return None, "top_k must be at least 1"
+    if (req.nprobe is not None and req.nprobe < 1) or (req.ef_search is not None and req.ef_search < 1):
+        return None, "nprobe and ef_search must be at least 1"
+    store = _collections.get(req.collection)
+    if store is None:
+        return None, f"Index not built for collection {req.collection}. Call /index first."
+    # MMR picks top_k from a deeper candidate list
+    k = req.top_k * max(1, cfg["context"]["fetch_factor"])
+    return store.as_retriever(k=k, cache=_query_cache, batcher=_query_batcher, nprobe=req.nprobe,
+                              ef_search=req.ef_search), None
+
+def cached_answer(req: AskRequest, store):
+    """(answer cache key, cached response body or None); the key is None without a cache."""
+    if _query_cache is None:
+        return None, None
+    _query_cache.sync(store)
+    key = _query_cache.answer_key(store, req.question, req.top_k, req.retrieval_mode, req.hf_model, req.nprobe,
+                                  req.ef_search)
+    return key, _query_cache.answers.get(key)
+
+def remember_answer(key, answer, sources):
+    # failed Groq calls come back as an error string; those must not be cached
+    if key is not None and answer and not answer.startswith("Error"):
+        _query_cache.answers.put(key, {"answer": answer, "sources": sources})
+
+def pack(req: AskRequest, docs):
+    """(passages for the prompt, packing stats): top_k of `docs` by MMR, merged and fit to the token budget."""
+    ctx = cfg["context"]
+    with metrics.timed("context_pack"):
+        return pack_context(docs, req.top_k, ctx["max_tokens"], ctx["per_source_tokens"],
+                            ctx["mmr_lambda"], ctx["duplicate_threshold"])
+
+def source_list(docs):
+    sources = []
+    for d in docs:
+        source = {"url": d.metadata.get("source"), "snippet": d.page_content[:300]}
+        if d.metadata.get("duplicate_sources"):
+            source["also_at"] = d.metadata["duplicate_sources"]  # near-identical pages merged at index time
+        sources.append(source)
+    return sources
+
 @app.post("/ask")
 def api_ask(req: AskRequest):
-    global _vector_store, _retriever
-    if _retriever is None:
-        return {"error": "Index not built. Call /index first."}
-
-    # Build LLM (HuggingFace pipeline)
-    llm = make_llm(
-        model_name=req.hf_model,
-        max_new_tokens=cfg["generation"]["max_new_tokens"],
-        temperature=cfg["generation"]["temperature"]
-    )
+    retriever, error = check_ask(req)
+    if error:
+        return {"error": error}
 
-    # Use the new chain
-    qa_chain = build_qa_chain(llm, _retriever)
+    with metrics.trace(req.trace) as spans:
+        response = answer_question(req, retriever)
+    if spans is not None:
+        response["trace"] = metrics.summarize(spans)
+    return response
 
+def answer_question(req: AskRequest, retriever):
     t0 = time.time()
-    # Run the chain using the new invoke method with 'input' key
-    out = qa_chain.invoke({"input": req.question})
-    t1 = time.time()
+    answer_key, cached = cached_answer(req, retriever.store)
+    if cached is not None:
+        total_ms = round((time.time() - t0) * 1000, 2)
+        metrics.CACHE_LAYER.inc(layer="answer")
+        return {**cached, "cache": "answer",
+                "timings": {"retrieval_ms": 0.0, "prompt_ms": 0.0, "generation_ms": 0.0, "total_ms": total_ms}}
 
-    # The answer is now in the 'answer' key, and sources are in the 'context' key.
-    answer = out.get("answer") or ""
-    source_docs = out.get("context", [])
+    # retrieval runs here rather than in a retrieval chain so the query cache can serve it
+    with metrics.timed("retrieval"):
+        source_docs, layer = retriever.search(req.question, mode=req.retrieval_mode)
+    t1 = time.time()
+    gen = cfg["generation"]
+    passages, packing = pack(req, source_docs)
+    with metrics.timed("prompt_build"):
+        prompt = build_prompt(req.question, passages)
+    t2 = time.time()
+    with metrics.timed("llm"):
+        answer = get_llm(req.hf_model, gen["max_new_tokens"], gen["temperature"], gen.get("base_url")).invoke(prompt) or ""
+    t3 = time.time()
 
-    sources = []
-    for sd in source_docs:
-        meta = sd.metadata
-        snippet = sd.page_content[:300]
-        sources.append({"url": meta.get("source"), "snippet": snippet})
+    sources = source_list(passages)
+    remember_answer(answer_key, answer, sources)
+    metrics.CACHE_LAYER.inc(layer=layer or "none")
 
     timings = {
-        "retrieval_ms": "n/a (internal to chain)",
-        "generation_ms": round((t1 - t0) * 1000, 2),
-        "total_ms": round((t1 - t0) * 1000, 2)
+        "retrieval_ms": round((t1 - t0) * 1000, 2),
+        "prompt_ms": round((t2 - t1) * 1000, 2),
+        "generation_ms": round((t3 - t2) * 1000, 2),
+        "total_ms": round((t3 - t0) * 1000, 2)
     }
 
-    return {"answer": answer, "sources": sources, "timings": timings}
\ No newline at end of file
+    return {"answer": answer, "sources": sources, "cache": layer or "none", "context": packing, "timings": timings}
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/ask/stream")
+async def api_ask_stream(req: AskRequest):
+    """
+    /ask as Server-Sent Events: a `sources` event once retrieval is done, one
+    `token` event per generated token, then `done` with the timings (including
+    time to first token), or `error` if generation fails.
+    """
+    t0 = time.time()
+    # a collection that is not loaded is read from disk; keep that off the event loop
+    retriever, error = await asyncio.to_thread(check_ask, req)
+    if error:
+        return {"error": error}
+
+    answer_key, cached = cached_answer(req, retriever.store)
+    gen = cfg["generation"]
+
+    async def events():
+        if cached is not None:
+            metrics.CACHE_LAYER.inc(layer="answer")
+            yield sse("sources", {"sources": cached["sources"]})
+            yield sse("token", {"token": cached["answer"]})
+            total_ms = round((time.time() - t0) * 1000, 2)
+            yield sse("done", {"cache": "answer", "timings": {"retrieval_ms": 0.0, "ttft_ms": total_ms,
+                                                             "generation_ms": 0.0, "total_ms": total_ms}})
+            return
+
+        # embedding and FAISS search are blocking; keep them off the event loop
+        docs, layer = await asyncio.to_thread(retriever.search, req.question, req.retrieval_mode)
+        t1 = time.time()
+        metrics.observe("retrieval", t1 - t0)
+        metrics.CACHE_LAYER.inc(layer=layer or "none")
+        passages, packing = pack(req, docs)
+        sources = source_list(passages)
+        yield sse("sources", {"sources": sources})
+
+        with metrics.timed("prompt_build"):
+            prompt = format_prompt(req.question, passages)
+        tokens, t_first = [], None
+        t_llm = time.time()
+        try:
+            async for token in stream_groq_api(prompt, req.hf_model,
+                                               gen["max_new_tokens"], gen["temperature"], gen.get("base_url")):
+                if t_first is None:
+                    t_first = time.time()
+                    metrics.observe("llm_first_token", t_first - t_llm)
+                tokens.append(token)
+                yield sse("token", {"token": token})
+        except Exception as e:
+            metrics.STAGE_ERRORS.inc(stage="llm")
+            logger.error(f"Streaming generation failed: {e}")
+            yield sse("error", {"error": f"Error during Groq API call: {e}"})
+            return
+        t2 = time.time()
+        metrics.observe("llm", t2 - t_llm)
+        remember_answer(answer_key, "".join(tokens), sources)
+
+        yield sse("done", {"cache": layer or "none", "context": packing, "timings": {
+            "retrieval_ms": round((t1 - t0) * 1000, 2),
+            "ttft_ms": round(((t_first or t2) - t0) * 1000, 2),
+            "generation_ms": round((t2 - t1) * 1000, 2),
+            "total_ms": round((t2 - t0) * 1000, 2)
+        }})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/metrics")
+def api_metrics():
+    """Stage and request latency histograms and counters in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,155 @@
+# retrieval/batcher.py
+import queue
+import threading
+import time
+from collections import defaultdict
+from utils import metrics
+from utils.logger import get_logger
+from utils.metrics import timed
+
+logger = get_logger("batcher")
+
+
+class _Pending:
+    __slots__ = ("store", "query", "k", "mode", "nprobe", "ef_search", "vector", "docs", "error", "done", "spans")
+
+    def __init__(self, store, query, k, mode, vector, nprobe=None, ef_search=None):
+        self.store = store
+        self.query = query
+        self.k = k
+        self.mode = mode
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.vector = vector
+        self.docs = None
+        self.error = None
+        self.done = threading.Event()
+        self.spans = metrics.current_trace()  # the caller's request trace; the batch's stages are added to it
+
+
+class _Lane:
+    """The queue and worker thread of one store."""
+    __slots__ = ("queue", "waiting", "thread")
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.waiting = 0  # callers between enqueueing and getting their result
+        self.thread = None
+
+
+class QueryBatcher:
+    """
+    Coalesces concurrent retrievals against the same store. Callers block in
+    search(); each store has its own queue and worker thread, which takes the
+    first waiting query, collects whatever else arrives within `max_wait_ms` (up
+    to `max_batch` queries), embeds the batch in one model call and runs one
+    FAISS search per (k, mode, nprobe, ef_search) over the query matrix
+    (FaissVectorStore.retrieve_many), then hands each caller its own result.
+
+    A query that arrives while no other caller of its store is waiting is
+    dispatched at once, so the wait only applies when there is something to batch
+    with. A store that is slow (a held store lock, a shard waiting out its
+    timeout) only delays its own queries. A worker that has had nothing to do for
+    `idle_s` exits; the next query for its store starts a new one.
+    """
+
+    def __init__(self, max_wait_ms=2.0, max_batch=32, idle_s=30.0):
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.idle_s = idle_s
+        self.lanes = {}  # {id(store): _Lane}
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+
+    def search(self, store, query, k=3, mode="vector", vector=None, nprobe=None, ef_search=None):
+        """Returns (docs, query vector); the vector is None for bm25."""
+        item = _Pending(store, query, k, mode, vector, nprobe, ef_search)
+        key = id(store)
+        with self.lock:
+            lane = self.lanes.get(key)
+            if lane is None:
+                lane = self.lanes[key] = _Lane()
+                lane.thread = threading.Thread(target=self._run, args=(key, lane), name="query-batcher", daemon=True)
+                lane.thread.start()
+            lane.waiting += 1
+        try:
+            lane.queue.put(item)
+            item.done.wait()
+        finally:
+            with self.lock:
+                lane.waiting -= 1
+        if item.error is not None:
+            raise item.error
+        return item.docs, item.vector
+
+    def _collect(self, lane, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(lane.queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            with self.lock:
+                alone = lane.waiting <= len(batch)
+            remaining = deadline - time.monotonic()
+            if alone or remaining <= 0:
+                break
+            try:
+                batch.append(lane.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, key, lane):
+        while True:
+            try:
+                first = lane.queue.get(timeout=self.idle_s)
+            except queue.Empty:
+                with self.lock:
+                    # callers register in `waiting` before they enqueue, so none is about to
+                    if lane.waiting == 0 and lane.queue.empty():
+                        del self.lanes[key]
+                        return
+                continue
+            items = self._collect(lane, first)
+            with self.lock:
+                self.batches += 1
+                self.queries += len(items)
+            spans = None
+            try:
+                # the stages run on this thread, outside the callers' trace contexts
+                with metrics.trace(any(item.spans is not None for item in items)) as spans:
+                    with timed("retrieval_batch", items=len(items)):
+                        self._run_store(items)
+            except Exception as e:
+                logger.error(f"Batched retrieval failed: {e}")
+                for item in items:
+                    item.error = e
+            finally:
+                for item in items:
+                    if spans and item.spans is not None:
+                        item.spans.extend(spans)
+                    item.done.set()
+
+    def _run_store(self, items):
+        store = items[0].store
+        unembedded = [item for item in items if item.vector is None and item.mode != "bm25"]
+        if unembedded:
+            for item, vector in zip(unembedded, store.embed_queries([item.query for item in unembedded])):
+                item.vector = vector
+        groups = defaultdict(list)
+        for item in items:
+            groups[(item.k, item.mode, item.nprobe, item.ef_search)].append(item)
+        for (k, mode, nprobe, ef_search), group in groups.items():
+            vectors = None if mode == "bm25" else [item.vector for item in group]
+            results = store.retrieve_many([item.query for item in group], k=k, nprobe=nprobe, ef_search=ef_search,
+                                          mode=mode, vectors=vectors)
+            for item, docs in zip(group, results):
+                item.docs = docs
+
+    def stats(self):
+        return {"batches": self.batches, "queries": self.queries, "stores": len(self.lanes),
+                "mean_batch": round(self.queries / self.batches, 2) if self.batches else 0.0}
@@ -0,0 +1,131 @@
+# retrieval/cache.py
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU map of at most `maxsize` entries, each expiring `ttl` seconds after it was stored."""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()  # {key: (expires_at, value)}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """The cached value, or None on a miss or an expired entry."""
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def discard(self, predicate):
+        """Drop every entry whose key matches."""
+        with self.lock:
+            for key in [key for key in self.data if predicate(key)]:
+                del self.data[key]
+
+    def __len__(self):
+        return len(self.data)
+
+
+def normalize_question(question):
+    """Case, whitespace and trailing punctuation do not make a question different."""
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+
+class QueryCache:
+    """
+    Layered cache in front of /ask:
+      embeddings  (model, question) -> query vector; independent of the index
+      retrievals  (index version, question, k, mode, nprobe, ef_search) -> retrieved documents
+      answers     (index version, question, k, mode, llm model, nprobe, ef_search) -> /ask response body
+    Every change to the vector store gives it a new `version` (see FaissVectorStore),
+    so entries for an older index are never served; sync() also drops them eagerly,
+    per collection, so serving several collections does not flush the others.
+    """
+
+    def __init__(self, embedding_size=4096, embedding_ttl=3600, retrieval_size=2048, retrieval_ttl=600,
+                 answer_size=1024, answer_ttl=300):
+        self.embeddings = TTLCache(embedding_size, embedding_ttl)
+        self.retrievals = TTLCache(retrieval_size, retrieval_ttl)
+        self.answers = TTLCache(answer_size, answer_ttl)
+        self.versions = {}  # {collection: index version last seen}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Built from the cache section of settings.yaml (sizes in entries, TTLs in seconds)."""
+        return cls(
+            embedding_size=cfg.get("embedding_size", 4096), embedding_ttl=cfg.get("embedding_ttl_s", 3600),
+            retrieval_size=cfg.get("retrieval_size", 2048), retrieval_ttl=cfg.get("retrieval_ttl_s", 600),
+            answer_size=cfg.get("answer_size", 1024), answer_ttl=cfg.get("answer_ttl_s", 300),
+        )
+
+    def sync(self, store, version=None):
+        """Drop a collection's retrieval and answer entries when its index has changed since the last call."""
+        version = store.version if version is None else version
+        collection = getattr(store, "collection", None)
+        with self.lock:
+            previous = self.versions.get(collection)
+            if version == previous:
+                return
+            self.versions[collection] = version
+        if previous is not None:
+            self.retrievals.discard(lambda key: key[0] == previous)
+            self.answers.discard(lambda key: key[0] == previous)
+
+    def answer_key(self, store, question, k, mode, model, nprobe=None, ef_search=None):
+        return store.version, normalize_question(question), k, mode, model, nprobe, ef_search
+
+    def retrieve(self, store, query, k, mode="vector", batcher=None, nprobe=None, ef_search=None):
+        """
+        Returns (docs, layer): layer is "retrieval" or "embedding" for a cache hit,
+        None otherwise. Misses go through `batcher` (retrieval/batcher.py) if given.
+        """
+        version = store.version  # read before searching: a concurrent update must not be cached as current
+        self.sync(store, version)
+        question = normalize_question(query)
+        key = (version, question, k, mode, nprobe, ef_search)
+        docs = self.retrievals.get(key)
+        if docs is not None:
+            return docs, "retrieval"
+
+        vector, layer = None, None
+        embedding_key = (store.model_name or id(store.embeddings), question)
+        if mode != "bm25":
+            vector = self.embeddings.get(embedding_key)
+            layer = "embedding" if vector is not None else None
+        if batcher is not None:
+            docs, vector = batcher.search(store, query, k=k, mode=mode, vector=vector, nprobe=nprobe,
+                                          ef_search=ef_search)
+        else:
+            if mode != "bm25" and vector is None:
+                vector = store.embed_query(query)
+            docs = store.retrieve(query, k=k, mode=mode, vector=vector, nprobe=nprobe, ef_search=ef_search)
+        if vector is not None and layer is None:
+            self.embeddings.put(embedding_key, vector)
+        self.retrievals.put(key, docs)
+        return docs, layer
+
+    def stats(self):
+        return {"embeddings": len(self.embeddings), "retrievals": len(self.retrievals), "answers": len(self.answers)}
@@ -0,0 +1,40 @@
+# retrieval/retriever.py
+from typing import Any, List, Optional
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+
+class Retriever(BaseRetriever):
+    """
+    LangChain retriever over a FaissVectorStore. Searches go through
+    FaissVectorStore.retrieve, which holds the store lock, so they are safe to run
+    while upsert_documents / delete_by_source are changing the index.
+
+    With a `cache` (retrieval/cache.py QueryCache) repeated queries are served from
+    its embedding and retrieval layers, and with a `batcher` (retrieval/batcher.py
+    QueryBatcher) concurrent misses are embedded and searched together. `mode` is
+    "vector", "bm25" or "hybrid" (see FaissVectorStore.retrieve); nprobe (IVF) and
+    ef_search (HNSW) override the configured search depth for this retriever.
+    """
+
+    store: Any
+    k: int = 4
+    cache: Any = None
+    mode: str = "vector"
+    batcher: Any = None
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+
+    def search(self, query: str, mode: str = None):
+        """Returns (docs, layer); layer names the cache layer that served the query, or None."""
+        mode = mode or self.mode
+        params = {"nprobe": self.nprobe, "ef_search": self.ef_search}
+        if self.cache is not None:
+            return self.cache.retrieve(self.store, query, self.k, mode, batcher=self.batcher, **params)
+        if self.batcher is not None:
+            return self.batcher.search(self.store, query, k=self.k, mode=mode, **params)[0], None
+        return self.store.retrieve(query, k=self.k, mode=mode, **params), None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.search(query)[0]
@@ -0,0 +1,27 @@
+# tests/test_async_crawler.py
+import asyncio
+import time
+from crawler.async_crawler import TokenBucket
+
+
+def acquire_times(bucket, n):
+    async def run():
+        t0 = time.monotonic()
+        times = []
+        for _ in range(n):
+            await bucket.acquire()
+            times.append(time.monotonic() - t0)
+        return times
+    return asyncio.run(run())
+
+
+def test_token_bucket_bursts_then_paces():
+    times = acquire_times(TokenBucket(rate=20, capacity=2), 5)
+    assert times[1] < 0.02  # the burst
+    # then one token per 1/rate seconds
+    assert 0.12 <= times[-1] < 0.5
+    assert all(b - a >= 0.04 for a, b in zip(times[1:], times[2:]))
+
+
+def test_token_bucket_without_rate_never_waits():
+    assert acquire_times(TokenBucket(rate=0), 50)[-1] < 0.05
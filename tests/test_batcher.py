@@ -0,0 +1,67 @@
+# tests/test_batcher.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from retrieval.batcher import QueryBatcher
+
+
+class FakeStore:
+    def __init__(self):
+        self.release = threading.Event()
+        self.embed_calls = []
+        self.search_calls = []
+
+    def embed_queries(self, queries):
+        self.embed_calls.append(list(queries))
+        return [[float(len(q))] for q in queries]
+
+    def retrieve_many(self, queries, k, nprobe=None, ef_search=None, mode="vector", vectors=None):
+        self.release.wait(5)
+        self.search_calls.append((list(queries), k))
+        if "bad" in queries:
+            raise RuntimeError("search failed")
+        return [[f"{q}@{k}"] for q in queries]
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def test_waiting_queries_share_one_batch():
+    batcher, store = QueryBatcher(max_wait_ms=50, max_batch=8), FakeStore()
+    with ThreadPoolExecutor(6) as pool:
+        first = pool.submit(batcher.search, store, "q0", 4)
+        wait_until(lambda: store.embed_calls)  # q0 went alone and is held in its search
+        rest = [pool.submit(batcher.search, store, f"q{i}", 4 if i < 4 else 2) for i in range(1, 6)]
+        wait_until(lambda: batcher.lanes[id(store)].queue.qsize() == 5)
+        store.release.set()
+        assert first.result() == (["q0@4"], [2.0])
+        assert [f.result()[0] for f in rest] == [["q1@4"], ["q2@4"], ["q3@4"], ["q4@2"], ["q5@2"]]
+    assert store.embed_calls == [["q0"], ["q1", "q2", "q3", "q4", "q5"]]
+    # one search per k within the batch
+    assert sorted(store.search_calls) == [(["q0"], 4), (["q1", "q2", "q3"], 4), (["q4", "q5"], 2)]
+    assert batcher.stats()["batches"] == 2
+
+
+def test_given_vector_is_not_embedded_again():
+    batcher, store = QueryBatcher(), FakeStore()
+    store.release.set()
+    assert batcher.search(store, "q", vector=[7.0]) == (["q@3"], [7.0])
+    assert store.embed_calls == []
+
+
+def test_failure_reaches_every_caller_in_the_batch():
+    batcher, store = QueryBatcher(max_wait_ms=50), FakeStore()
+    with ThreadPoolExecutor(3) as pool:
+        first = pool.submit(batcher.search, store, "q0")
+        wait_until(lambda: store.embed_calls)
+        rest = [pool.submit(batcher.search, store, q) for q in ("bad", "q2")]
+        wait_until(lambda: batcher.lanes[id(store)].queue.qsize() == 2)
+        store.release.set()
+        assert first.result()[0] == ["q0@3"]
+        for future in rest:
+            with pytest.raises(RuntimeError):
+                future.result()
@@ -0,0 +1,63 @@
+# tests/test_cache.py
+import itertools
+from retrieval.cache import QueryCache, TTLCache, normalize_question
+
+_versions = itertools.count(1)  # unique across stores, as FaissVectorStore's are
+
+
+class FakeStore:
+    def __init__(self, collection="c"):
+        self.collection = collection
+        self.version = next(_versions)
+        self.model_name = "m"
+        self.embeddings = None
+        self.embedded = []
+        self.searched = []
+
+    def embed_query(self, query):
+        self.embedded.append(query)
+        return [float(len(query))]
+
+    def retrieve(self, query, k, mode, vector, nprobe=None, ef_search=None):
+        self.searched.append((query, vector))
+        return [f"{self.collection}:{query}:{self.version}"]
+
+
+def test_ttl_cache_lru_and_expiry():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)  # "b" is the least recently used
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    expired = TTLCache(ttl=-1)
+    expired.put("a", 1)
+    assert expired.get("a") is None and len(expired) == 0
+
+
+def test_normalized_question_hits_retrieval_layer():
+    cache, store = QueryCache(), FakeStore()
+    assert normalize_question("  What is  FAISS? ") == "what is faiss"
+    docs, layer = cache.retrieve(store, "What is FAISS?", k=4)
+    assert layer is None
+    assert cache.retrieve(store, "what is faiss", k=4) == (docs, "retrieval")
+    assert len(store.searched) == 1
+
+
+def test_new_index_version_reuses_only_the_embedding():
+    cache, store = QueryCache(), FakeStore()
+    cache.retrieve(store, "q", k=4)
+    store.version = next(_versions)
+    docs, layer = cache.retrieve(store, "q", k=4)
+    assert (docs, layer) == ([f"c:q:{store.version}"], "embedding")
+    assert store.embedded == ["q"] and len(store.searched) == 2
+    assert cache.stats()["retrievals"] == 1  # the old version's entry was dropped
+
+
+def test_sync_is_per_collection():
+    cache, first, second = QueryCache(), FakeStore("a"), FakeStore("b")
+    cache.retrieve(first, "q", k=4)
+    cache.retrieve(second, "q", k=4)
+    second.version = next(_versions)
+    cache.sync(second)
+    assert cache.retrieve(first, "q", k=4)[1] == "retrieval"
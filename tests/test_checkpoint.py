@@ -0,0 +1,33 @@
+# tests/test_checkpoint.py
+from crawler.checkpoint import CHANGED, QUEUED, CrawlCheckpoint
+
+START = "http://site/"
+
+
+def test_page_recorded_only_after_done(tmp_path):
+    checkpoint = CrawlCheckpoint(START, checkpoint_dir=str(tmp_path), interval_s=0)
+    checkpoint.reset(START)
+    checkpoint.queued(START, 0, 1.0)
+    checkpoint.fetch_done(START, CHANGED, {"url": START, "text": "home"})
+    checkpoint.flush()
+    # fetched but its links not yet queued: still queued on disk
+    assert [row[3] for row in checkpoint.rows()] == [QUEUED]
+    checkpoint.queued("http://site/a", 1, 0.5)
+    checkpoint.done(START)
+    assert checkpoint.due()
+    checkpoint.flush()
+    assert list(checkpoint.rows()) == [(START, 0, 1.0, CHANGED, {"url": START, "text": "home"}),
+                                       ("http://site/a", 1, 0.5, QUEUED, None)]
+
+
+def test_resumable_until_finished(tmp_path):
+    checkpoint = CrawlCheckpoint(START, checkpoint_dir=str(tmp_path))
+    checkpoint.reset(START)
+    checkpoint.queued(START, 0, 1.0)
+    checkpoint.close(finished=False)
+    reopened = CrawlCheckpoint(START, checkpoint_dir=str(tmp_path))
+    assert reopened.resumable(START)
+    assert not reopened.resumable("http://other/")
+    assert [row[0] for row in reopened.rows()] == [START]
+    reopened.close()
+    assert not CrawlCheckpoint(START, checkpoint_dir=str(tmp_path)).resumable(START)
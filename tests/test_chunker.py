@@ -0,0 +1,49 @@
+# tests/test_chunker.py
+import pytest
+from indexing.chunker import char_spans, chunk_documents, page_text, token_spans
+
+TEXT = ("First paragraph with a handful of words in it.\n\n"
+        "Second paragraph, somewhat longer, that goes on for a while so it has to be split somewhere.\n"
+        "A line of its own.\n\n" + " ".join(f"word{i}" for i in range(60)))
+
+
+def test_char_spans_within_size_on_boundaries():
+    spans = list(char_spans(TEXT, 60, 15))
+    assert spans[0][0] == 0 and spans[-1][1] == len(TEXT)
+    for start, end in spans:
+        chunk = TEXT[start:end]
+        assert 0 < len(chunk) <= 60
+        assert chunk == chunk.strip()
+        assert start == 0 or TEXT[start - 1].isspace()  # never starts mid-word
+    # every character outside whitespace is in some chunk
+    covered = set()
+    for start, end in spans:
+        covered.update(range(start, end))
+    assert all(i in covered for i, ch in enumerate(TEXT) if not ch.isspace())
+
+
+def test_char_overlap_not_carried_across_line_breaks():
+    spans = list(char_spans(TEXT, 60, 15))
+    starts = {start for start, _ in spans}
+    assert TEXT.index("Second") in starts and TEXT.index("A line") in starts
+    tail = [(s, e) for s, e in spans if s > TEXT.index("word0")]
+    assert any(s < e0 for (_, e0), (s, _) in zip(tail, tail[1:]))  # words do overlap
+
+
+def test_token_spans_offsets():
+    text = "a bb ccc dddd eeeee"
+    spans = list(token_spans(text, 3, 1))
+    assert [text[s:e] for s, e in spans] == ["a bb ccc", "ccc dddd eeeee"]
+    with pytest.raises(ValueError):
+        list(token_spans(text, 3, 3))
+
+
+def test_chunks_index_into_page_text():
+    docs = [{"url": "http://e.com/a", "title": "A", "content": TEXT}, {"url": "http://e.com/b", "content": "short"}]
+    chunks = chunk_documents(docs, 80, 20)
+    assert [c["metadata"]["chunk_index"] for c in chunks if c["metadata"]["source"] == "http://e.com/a"] == \
+        list(range(len(chunks) - 1))
+    assert chunks[-1] == {"page_content": "short", "metadata": {"source": "http://e.com/b", "title": "", "chunk_index": 0}}
+    assert all(c["page_content"] in page_text(docs[0]) for c in chunks[:-1])
+    # a process pool cuts the same chunks
+    assert chunk_documents(docs, 80, 20, workers=2) == chunks
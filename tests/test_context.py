@@ -0,0 +1,40 @@
+# tests/test_context.py
+from langchain_core.documents import Document
+from generation.context import estimate_tokens, merge_adjacent, mmr, pack_context
+
+
+def doc(text, source="http://e.com/a", index=0, **metadata):
+    return Document(page_content=text, metadata={"source": source, "chunk_index": index, **metadata})
+
+
+def words(seed, n=40):
+    return " ".join(f"w{seed}x{i}" for i in range(n))
+
+
+def test_mmr_drops_duplicates_and_prefers_new_content():
+    docs = [doc(words(1), index=0), doc(words(1), "http://e.com/b"), doc(words(1, 30) + " " + words(2, 10), index=1),
+            doc(words(3), index=2)]
+    picked, dropped = mmr(docs, k=3, lambda_=0.5)
+    assert dropped == 1
+    # the mostly-repeated third chunk goes after the distinct fourth one
+    assert picked == [docs[0], docs[3], docs[2]]
+
+
+def test_adjacent_chunks_merged_without_the_overlap():
+    docs = [doc("second part of the page text", index=1), doc("other page", "http://e.com/b"),
+            doc("first part, then the second part", index=0, duplicate_sources=["http://e.com/copy"])]
+    passages = merge_adjacent(docs)
+    assert [p.page_content for p in passages] == ["first part, then the second part of the page text", "other page"]
+    assert passages[0].metadata["chunks"] == [0, 1]
+    assert passages[0].metadata["duplicate_sources"] == ["http://e.com/copy"]
+
+
+def test_pack_within_budgets():
+    docs = [doc(words(1, 200), index=0), doc(words(2, 200), index=5), doc(words(3, 50), "http://e.com/b")]
+    packed, stats = pack_context(docs, top_k=3, max_tokens=800, per_source_tokens=500)
+    per_source = {}
+    for p in packed:
+        per_source[p.metadata["source"]] = per_source.get(p.metadata["source"], 0) + estimate_tokens(p.page_content)
+    assert per_source["http://e.com/a"] <= 500 and sum(per_source.values()) == stats["tokens"] <= 800
+    assert packed[-1].metadata["source"] == "http://e.com/b" and packed[-1].page_content == words(3, 50)
+    assert stats["truncated"] == 1 and packed[1].page_content.endswith(" ...")
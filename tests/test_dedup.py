@@ -0,0 +1,76 @@
+# tests/test_dedup.py
+from indexing.dedup import Deduplicator, NearDuplicateIndex
+
+
+def words(seed, n=200):
+    return [f"w{seed}x{i}" for i in range(n)]
+
+
+def page(url, seed):
+    return {"url": url, "title": url, "content": " ".join(words(seed))}
+
+
+def test_near_copies_found_distinct_texts_kept():
+    index = NearDuplicateIndex(threshold=0.8)
+    text = words(1)
+    assert index.check(" ".join(text), "a") is None
+    assert index.check(" ".join(text).upper(), "b") == "a"  # exact after normalization
+    edited = text[:100] + ["changed"] + text[101:]  # three of ~200 shingles differ
+    assert index.check(" ".join(edited), "c") == "a"
+    assert index.check(" ".join(text[:100] + words(2, 100)), "d") is None  # half the page differs
+    assert index.check(" ".join(words(3)), "e") is None
+    assert index.check("", "f") is None
+
+
+def test_removed_text_no_longer_matches():
+    index = NearDuplicateIndex()
+    index.check(" ".join(words(1)), "a")
+    index.remove(["a"])
+    assert index.check(" ".join(words(1)), "b") is None
+    assert [value for _, _, value in index.entries()] == ["b"]
+
+
+def test_boilerplate_chunk_dropped_and_cited():
+    dedup = Deduplicator()
+    banner = " ".join(words(9, 40))
+    chunks = [{"page_content": banner, "metadata": {"source": "a", "chunk_index": 0}},
+              {"page_content": " ".join(words(1)), "metadata": {"source": "a", "chunk_index": 1}},
+              {"page_content": banner, "metadata": {"source": "b", "chunk_index": 0}}]
+    kept = dedup.chunks(chunks)
+    assert [c["metadata"]["source"] for c in kept] == ["a", "a"]
+    assert kept[0]["metadata"]["duplicate_sources"] == ["b"]
+    assert dedup.stats == {"pages_dropped": 0, "chunks_dropped": 1}
+
+
+def test_page_state_carried_to_next_run(tmp_path):
+    path = str(tmp_path / "dedup.npz")
+    first = Deduplicator()
+    assert [d["url"] for d in first.pages([page("a", 1), page("b", 1), page("c", 2)])] == ["a", "c"]
+    first.save(path)
+
+    # "d" only arrives in the next run; "c" is not re-read then but still counts
+    second = Deduplicator()
+    assert second.load(path)
+    assert second.pages([page("d", 2)]) == []
+    assert second.merged == {"a": ["b"], "c": ["d"]}
+
+
+def test_release_returns_copies_of_changed_pages(tmp_path):
+    path = str(tmp_path / "dedup.npz")
+    first = Deduplicator()
+    first.pages([page("a", 1), page("b", 1)])
+    first.save(path)
+
+    second = Deduplicator()
+    second.load(path)
+    # "a" changed: "b" is no longer indexed anywhere and has to be checked again
+    assert second.release(["a"]) == {"b"}
+    assert [d["url"] for d in second.pages([page("a", 3), page("b", 1)])] == ["a", "b"]
+
+
+def test_other_settings_start_over(tmp_path):
+    path = str(tmp_path / "dedup.npz")
+    first = Deduplicator()
+    first.pages([page("a", 1)])
+    first.save(path)
+    assert not Deduplicator(num_perm=32).load(path)
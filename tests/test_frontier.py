@@ -0,0 +1,48 @@
+# tests/test_frontier.py
+from crawler.frontier import Frontier, VisitedSet, canonicalize
+
+
+def test_canonicalize_one_spelling_per_page():
+    assert canonicalize("HTTP://Example.COM:80/a/./b/../c/?utm_source=x&b=2&a=1#frag") == "http://example.com/a/c?a=1&b=2"
+    assert canonicalize("https://e.com:443/x;jsessionid=abc?fbclid=1") == "https://e.com/x"
+    assert canonicalize("http://e.com/") == canonicalize("http://e.com") == "http://e.com"
+    assert canonicalize("http://e.com:8080/a%2fb") == "http://e.com:8080/a%2Fb"
+
+
+def test_canonicalize_rejects_other_schemes():
+    assert canonicalize("ftp://e.com/file") == ""
+    assert canonicalize("mailto:someone@e.com") == ""
+
+
+def test_frontier_orders_by_priority_then_discovery():
+    frontier = Frontier()
+    assert frontier.push("http://e.com/deep", depth=3) == "http://e.com/deep"
+    frontier.push("http://e.com/first", depth=1)
+    frontier.push("http://e.com/second", depth=1)
+    frontier.push("http://e.com/seed", depth=0, priority=10.0)
+    assert [frontier.pop() for _ in range(4)] == [("http://e.com/seed", 0), ("http://e.com/first", 1),
+                                                 ("http://e.com/second", 1), ("http://e.com/deep", 3)]
+    assert frontier.pop() is None
+
+
+def test_frontier_admits_each_page_once():
+    frontier = Frontier()
+    frontier.push("http://e.com/a?utm_medium=mail", depth=1)
+    assert frontier.push("http://E.com/a/", depth=1) is None
+    assert frontier.push("ftp://e.com/a", depth=1) is None
+    frontier.pop()
+    # popped pages stay seen
+    assert frontier.push("http://e.com/a", depth=2) is None
+    assert "http://e.com/a#top" in frontier
+    assert frontier.stats()["duplicate_links"] == 2
+
+
+def test_visited_set_across_merges():
+    visited = VisitedSet(buffer=4)
+    urls = [f"http://e.com/{i}" for i in range(10)]
+    assert all(visited.add(url) for url in urls)
+    assert len(visited.keys) == 8 and len(visited.recent) == 2
+    assert not any(visited.add(url) for url in urls)
+    assert all(url in visited for url in urls)
+    assert "http://e.com/10" not in visited
+    assert len(visited) == 10
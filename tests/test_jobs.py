@@ -0,0 +1,49 @@
+# tests/test_jobs.py
+import threading
+from utils.jobs import JobQueue
+
+
+def finish(jobs):
+    jobs.pool.shutdown(wait=True)
+
+
+def test_running_job_stops_at_its_next_check():
+    jobs = JobQueue()
+    started, units = threading.Event(), []
+
+    def task(job):
+        started.set()
+        for i in range(1000):
+            job.cancelled.wait(0.01)
+            job.check()
+            units.append(i)
+            job.advance(i + 1, 1000, "units")
+
+    job = jobs.submit("index", task)
+    started.wait(5)
+    assert jobs.cancel(job.id)
+    finish(jobs)
+    assert job.status == "cancelled" and job.result is None
+    assert len(units) < 1000 and job.to_dict()["progress"]["done"] == len(units)
+    assert not jobs.cancel(job.id)  # finished jobs cannot be cancelled
+
+
+def test_queued_job_never_runs():
+    jobs = JobQueue(workers=1)
+    gate, ran = threading.Event(), []
+    blocker = jobs.submit("crawl", lambda job: gate.wait(5))
+    queued = jobs.submit("index", lambda job: ran.append(job.id))
+    assert jobs.cancel(queued.id)
+    gate.set()
+    finish(jobs)
+    assert (blocker.status, queued.status, ran) == ("succeeded", "cancelled", [])
+
+
+def test_result_after_cancel_and_failure():
+    jobs = JobQueue()
+    # a task that returns what it has when cancelled (e.g. a stopped crawl) is still "cancelled"
+    partial = jobs.submit("crawl", lambda job: (job.cancelled.set(), {"pages": 3})[1])
+    failed = jobs.submit("index", lambda job: 1 / 0)
+    finish(jobs)
+    assert (partial.status, partial.result) == ("cancelled", {"pages": 3})
+    assert failed.status == "failed" and "division by zero" in failed.error
@@ -0,0 +1,57 @@
+# tests/test_lexical.py
+from indexing.lexical import LexicalIndex, tokenize
+
+
+def merged_stats(shards, query):
+    """term_stats() summed over the shards, as ShardedStore does."""
+    n, total, df = 0, 0.0, {}
+    for shard in shards:
+        shard_n, shard_total, shard_df = shard.term_stats(tokenize(query))
+        n, total = n + shard_n, total + shard_total
+        for term, count in shard_df.items():
+            df[term] = df.get(term, 0) + count
+    return n, total, df
+
+
+def test_tokenize_keeps_identifiers_whole():
+    assert tokenize("See ERR-404 in v1.2") == ["see", "err-404", "err", "404", "in", "v1.2", "v1", "2"]
+
+
+def test_replaced_chunk_scored_once():
+    index = LexicalIndex()
+    index.add(["a#0", "b#0"], ["foo bar", "bar baz"])
+    index.add(["a#0"], ["foo updated"])
+    hits = index.search("foo", 5)
+    assert [cid for cid, _ in hits] == ["a#0"]
+    index.delete(["a#0"])
+    assert index.search("foo", 5) == []
+
+
+def test_sharded_search_after_upsert():
+    shards = [LexicalIndex(), LexicalIndex()]
+    shards[0].add(["a#0", "b#0"], ["foo bar", "bar baz"])
+    shards[1].add(["c#0", "d#0"], ["foo qux", "qux quux"])
+    shards[0].add(["a#0"], ["foo updated foo"])
+    shards[1].delete(["d#0"])
+    stats = merged_stats(shards, "foo")
+    assert stats[0] == 3
+    hits = [hit for shard in shards for hit in shard.search("foo", 5, stats)]
+    assert sorted(cid for cid, _ in hits) == ["a#0", "c#0"]
+    # the merged scores rank as one index over the same chunks would
+    single = LexicalIndex()
+    single.add(["a#0", "b#0", "c#0"], ["foo updated foo", "bar baz", "foo qux"])
+    expected = single.search("foo", 5)
+    assert [cid for cid, _ in sorted(hits, key=lambda h: -h[1])] == [cid for cid, _ in expected]
+    for cid, score in hits:
+        assert abs(score - dict(expected)[cid]) < 1e-4
+
+
+def test_compact_and_reload(tmp_path):
+    index = LexicalIndex()
+    index.add(["a#0", "b#0", "c#0"], ["foo bar", "bar baz", "foo qux"])
+    index.delete(["b#0"])
+    before = index.search("foo bar", 5)
+    index.save(str(tmp_path / "lexical.npz"))
+    loaded = LexicalIndex.load(str(tmp_path / "lexical.npz"))
+    assert loaded.search("foo bar", 5) == before
+    assert len(loaded) == 2
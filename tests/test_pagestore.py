@@ -0,0 +1,44 @@
+# tests/test_pagestore.py
+from crawler.pagestore import PageStore
+
+
+def page(n):
+    return f"<html><body><h1>Page {n}</h1>" + " ".join(f"word{n}x{i}" for i in range(200)) + "</body></html>"
+
+
+def test_same_content_stored_once(tmp_path):
+    store = PageStore(str(tmp_path))
+    digest = store.put("http://e.com/a", page(1))
+    assert store.put("http://e.com/a?print=1", page(1)) == digest
+    assert store.get("http://e.com/a?print=1") == page(1)
+    assert store.stats()["urls"] == 2 and store.stats()["pages"] == 1
+
+
+def test_replaced_content_and_reopen(tmp_path):
+    store = PageStore(str(tmp_path))
+    store.put("http://e.com/a", page(1))
+    store.put("http://e.com/b", page(2))
+    store.put("http://e.com/a", page(3))
+    store.close()
+    reopened = PageStore(str(tmp_path))
+    assert reopened.get("http://e.com/a") == page(3)
+    assert reopened.get("http://e.com/missing") is None
+    assert sorted(reopened.urls()) == ["http://e.com/a", "http://e.com/b"]
+    assert dict(reopened.items(["http://e.com/b", "http://e.com/missing"])) == {"http://e.com/b": page(2)}
+
+
+def test_segments_roll_over(tmp_path):
+    store = PageStore(str(tmp_path), segment_mb=0)  # every record opens a new segment
+    for n in range(3):
+        store.put(f"http://e.com/{n}", page(n))
+    assert store.stats()["segments"] == 3
+    assert [html for _, html in store.items()] == [page(n) for n in range(3)]
+
+
+def test_last_crawl(tmp_path):
+    store = PageStore(str(tmp_path))
+    store.set_crawl(["http://e.com/a", "http://e.com/b"])
+    store.set_crawl(["http://e.com/c"], merge=True)
+    assert store.crawl_urls() == ["http://e.com/a", "http://e.com/b", "http://e.com/c"]
+    store.set_crawl(["http://e.com/b"])
+    assert store.crawl_urls() == ["http://e.com/b"]
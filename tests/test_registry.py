@@ -0,0 +1,44 @@
+# tests/test_registry.py
+from indexing.registry import CollectionRegistry
+
+MB = 1024 * 1024
+
+
+class FakeStore:
+    def __init__(self, mb):
+        self.mb = mb
+
+    def memory_bytes(self):
+        return self.mb * MB
+
+    def vector_count(self):
+        return 0
+
+
+def test_least_recently_used_evicted_over_budget():
+    opened = []
+
+    def open_fn(name):
+        opened.append(name)
+        return FakeStore(40) if name != "missing" else None
+
+    registry = CollectionRegistry(open_fn, budget_mb=100, max_loaded=10)
+    registry.get("a")
+    registry.get("b")
+    registry.get("a")  # a is now the most recently used
+    registry.get("c")
+    assert "b" not in registry and "a" in registry and "c" in registry
+    assert registry.get("missing") is None
+    registry.get("b")
+    assert opened == ["a", "b", "c", "missing", "b"]
+    assert registry.stats()["evictions"] == 2
+
+
+def test_max_loaded_and_oversized_store_kept():
+    registry = CollectionRegistry(lambda name: FakeStore(1), budget_mb=100, max_loaded=2)
+    for name in ("a", "b", "c"):
+        registry.get(name)
+    assert [entry["name"] for entry in registry.stats()["loaded"]] == ["c", "b"]
+    # the store just put stays even when it alone is over budget
+    registry.put("big", FakeStore(500))
+    assert "big" in registry and len(registry.stats()["loaded"]) == 1
@@ -0,0 +1,201 @@
+# tests/test_vectorstore.py
+import gc
+import json
+import os
+import shutil
+import pytest
+from benchmarks.hashing import HashingEmbeddings
+from indexing import vectorstore
+from indexing.vectorstore import FaissVectorStore
+
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore, "INDEX_DIR", str(tmp_path / "index"))
+
+
+def page(n, version=0):
+    return {"page_content": f"page {n} version {version} " + " ".join(f"word{n}x{i}" for i in range(20)),
+            "metadata": {"source": f"http://site/{n}", "chunk_index": 0}}
+
+
+def make_store(index_type="flat"):
+    return FaissVectorStore(HashingEmbeddings(), index_cfg={"index_type": index_type}, compact_ops=1000)
+
+
+def contents(store):
+    """{chunk id: text} as the store serves it."""
+    ids = sorted(store.label_of)
+    return {cid: doc.page_content for cid, doc in zip(ids, store.docstore.get_many(ids))}
+
+
+def loaded():
+    store = make_store()
+    assert store.load()
+    return store
+
+
+@pytest.fixture
+def journaled():
+    """A saved snapshot of pages 0-9 followed by two journaled changes."""
+    store = make_store()
+    store.index_documents([page(n) for n in range(10)])
+    store.upsert_documents([page(3, 1), page(10)])
+    store.delete_by_source(["http://site/5"])
+    return store
+
+
+def test_journal_replay(journaled):
+    expected = contents(journaled)
+    assert "http://site/5#0" not in expected and expected["http://site/3#0"].startswith("page 3 version 1")
+    store = loaded()
+    assert contents(store) == expected
+    assert store.vector_count() == 10
+    assert store.journal_ops == 2 and store.journal_seq == 2
+
+
+def test_replay_keeps_snapshot_mapped(journaled):
+    store = loaded()
+    # the journal is replayed over the memory-mapped snapshot, not into a copy of it
+    assert store.mmapped and store.delta is not None
+    assert not [name for name in os.listdir(store.index_path) if ".building" in name]
+    assert store.retrieve("word10x3 word10x4 word10x5", k=1)[0].metadata["source"] == "http://site/10"
+    assert all(doc.metadata["source"] != "http://site/5" for doc in store.retrieve("word5x3 word5x4", k=3))
+
+
+def test_replay_after_save_keeps_numbering(journaled):
+    journaled.save()
+    assert not os.path.exists(journaled.journal_dir)
+    journaled.delete_by_source(["http://site/0"])
+    store = loaded()
+    assert "http://site/0#0" not in store.label_of
+    assert store.journal_seq == 3 and store.journal_ops == 1
+
+
+@pytest.mark.parametrize("lose_vectors", [False, True])
+def test_crash_before_journal_removal(journaled, lose_vectors):
+    # save() crashes after the snapshot swap, with the journal (or part of it) left behind
+    kept = journaled.journal_dir + ".kept"
+    shutil.copytree(journaled.journal_dir, kept)
+    expected = contents(journaled)
+    journaled.save()
+    shutil.copytree(kept, journaled.journal_dir)
+    if lose_vectors:
+        os.remove(os.path.join(journaled.journal_dir, "000001.npy"))
+    store = loaded()
+    assert contents(store) == expected
+    assert store.vector_count() == len(expected)
+    assert store.journal_ops == 0
+    # the next change continues after the folded records and survives a reload
+    store.upsert_documents([page(11)])
+    assert "http://site/11#0" in loaded().label_of
+
+
+def test_torn_final_record(journaled):
+    with open(os.path.join(journaled.journal_dir, "journal.jsonl"), "a", encoding="utf-8") as f:
+        f.write('{"seq": 3, "delete": ["http://site/1#0"')
+    store = loaded()
+    assert "http://site/1#0" in store.label_of
+    assert store.journal_ops == 2
+
+
+def test_missing_vectors_are_skipped(journaled):
+    os.remove(os.path.join(journaled.journal_dir, "000001.npy"))
+    store = loaded()
+    # the upsert is lost, the later delete still applies
+    assert "http://site/10#0" not in store.label_of
+    assert "http://site/5#0" not in store.label_of
+
+
+def test_unnumbered_records_replay_idempotently(journaled):
+    path = os.path.join(journaled.journal_dir, "journal.jsonl")
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            record.pop("seq")
+            f.write(json.dumps(record) + "\n")
+    expected = contents(journaled)
+    assert contents(loaded()) == expected
+    assert contents(loaded()) == expected
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf_flat"])
+def test_deletes_survive_reload(index_type):
+    store = make_store(index_type)
+    store.index_documents([page(n) for n in range(60)])
+    store.delete_by_source([f"http://site/{n}" for n in range(0, 60, 3)])
+    store.upsert_documents([page(1, 1)])
+    hits = store.retrieve("page 1 version 1", k=1)
+    assert hits[0].metadata["source"] == "http://site/1"
+    assert all(doc.metadata["source"] != "http://site/0" for doc in store.retrieve("page 0 version 0", k=5))
+    expected = contents(store)
+    store.save()
+    reloaded = FaissVectorStore(HashingEmbeddings(), index_cfg={"index_type": index_type})
+    assert reloaded.load()
+    assert contents(reloaded) == expected
+    assert reloaded.vector_count() == len(expected)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf_flat"])
+def test_update_does_not_touch_serving_store(index_type):
+    store = make_store(index_type)
+    store.index_documents([page(n) for n in range(10)])
+    store.upsert_documents([page(2, 1)])  # leaves a journal for the next load to replay
+    serving = FaissVectorStore(HashingEmbeddings(), index_cfg={"index_type": index_type})
+    assert serving.load()
+    before = contents(serving)
+    hits = [doc.page_content for doc in serving.retrieve("page 4 version 0", k=3)]
+
+    snapshot = {name: os.path.getmtime(os.path.join(serving.index_path, name))
+                for name in ("index.faiss", "docstore.sqlite")}
+    update = FaissVectorStore(HashingEmbeddings(), index_cfg={"index_type": index_type})
+    update.refresh_sources([page(4, 1), page(11)], ["http://site/4", "http://site/6", "http://site/11"])
+    # nothing is copied for the update, and the snapshot's files are not written
+    assert update.mmapped
+    assert not [name for name in os.listdir(update.index_path) if ".building" in name]
+    assert snapshot == {name: os.path.getmtime(os.path.join(serving.index_path, name)) for name in snapshot}
+    assert contents(update)["http://site/4#0"].startswith("page 4 version 1")
+    assert update.retrieve("word11x3 word11x4 word11x5", k=1)[0].metadata["source"] == "http://site/11"
+    assert contents(serving) == before
+    assert [doc.page_content for doc in serving.retrieve("page 4 version 0", k=3)] == hits
+
+    update.save()
+    assert contents(serving) == before
+    after = contents(loaded())
+    assert after == contents(update)
+    assert "http://site/6#0" not in after and after["http://site/4#0"].startswith("page 4 version 1")
+    # private docstore files (written by save) go away with their stores
+    index_path = update.index_path
+    del store, serving, update
+    gc.collect()
+    assert not [name for name in os.listdir(index_path) if ".building" in name]
+
+
+def test_chunking_kept_across_compaction():
+    chunking = {"size": 500, "overlap": 50, "unit": "chars"}
+    store = FaissVectorStore(HashingEmbeddings(), chunking=chunking)
+    store.index_documents([page(n) for n in range(5)])
+    reloaded = loaded()
+    reloaded.upsert_documents([page(1, 1)])
+    reloaded.save()
+    assert FaissVectorStore.read_meta()["chunking"] == chunking
+
+
+def test_other_dimension_is_refused():
+    make_store().index_documents([page(n) for n in range(5)])
+    store = FaissVectorStore(HashingEmbeddings(size=64), compact_ops=1000)
+    with pytest.raises(ValueError, match="dimensional"):
+        store.refresh_sources([page(1, 1)], ["http://site/1"])
+
+
+def test_cache_counts_are_per_store(tmp_path):
+    from indexing.embedding_cache import CachedEmbeddings, EmbeddingCache
+    shared = CachedEmbeddings(HashingEmbeddings(), EmbeddingCache("hashing", cache_dir=str(tmp_path / "cache")))
+    first = FaissVectorStore(shared, collection="a")
+    second = FaissVectorStore(shared, collection="b")
+    assert first.index_documents([page(n) for n in range(4)])["cache_misses"] == 4
+    # the other job's writes do not show up in this one's counts
+    stats = second.index_documents([page(n) for n in range(6)])
+    assert (stats["cache_hits"], stats["cache_misses"]) == (4, 2)
+    assert first.cache_stats() == {"cache_hits": 0, "cache_misses": 0}
@@ -0,0 +1,152 @@
+# utils/jobs.py
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from utils.logger import get_logger
+
+logger = get_logger("jobs")
+
+ACTIVE = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """
+    One background run of a long request. The task reports progress with
+    advance(done, total, unit) and any extra counters with update(); it should call
+    check() between units of work, which raises JobCancelled once cancel() is called.
+    """
+
+    def __init__(self, kind, params=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params or {}
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.done = 0
+        self.total = None
+        self.unit = None
+        self.counters = {}
+        self.probe = None  # optional callable -> live {done, total, unit, ...} read on every status query
+        self.result = None
+        self.error = None
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+
+    def advance(self, done, total=None, unit=None):
+        with self.lock:
+            self.done = done
+            if total is not None:
+                self.total = total
+            if unit is not None:
+                self.unit = unit
+
+    def update(self, **counters):
+        with self.lock:
+            self.counters.update(counters)
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise JobCancelled(f"job {self.id} cancelled")
+
+    def eta_s(self):
+        """Seconds left for the current unit of work, extrapolated from the rate so far."""
+        if self.status != "running" or not self.total or not self.done:
+            return None
+        elapsed = time.time() - self.started
+        return round(elapsed * (self.total - self.done) / self.done, 1) if self.done < self.total else 0.0
+
+    def refresh(self):
+        """Pull live progress from the probe, if the task set one."""
+        if self.probe is not None:
+            live = dict(self.probe())
+            self.advance(live.pop("done"), live.pop("total", None), live.pop("unit", None))
+            self.update(**live)
+
+    def to_dict(self):
+        if self.status == "running":
+            self.refresh()
+        with self.lock:
+            progress = {"done": self.done, "total": self.total, "unit": self.unit, **self.counters}
+        end = self.finished or time.time()
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "params": self.params,
+            "progress": progress,
+            "eta_s": self.eta_s(),
+            "elapsed_s": round(end - self.started, 3) if self.started else None,
+            "created": self.created,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """
+    Runs submitted jobs on a small thread pool so an HTTP handler can return a job
+    id at once. `workers` bounds how many heavy runs overlap (1 serialises them,
+    which also keeps a crawl and an index of the same state from interleaving);
+    the `keep` most recent finished jobs stay queryable.
+    """
+
+    def __init__(self, workers=1, keep=100):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="job")
+        self.keep = keep
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, kind, fn, params=None):
+        """Queue fn(job); its return value becomes job.result."""
+        job = Job(kind, params)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._trim()
+        self.pool.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        if job.cancelled.is_set():
+            job.status, job.finished = "cancelled", time.time()
+            return
+        job.status, job.started = "running", time.time()
+        try:
+            job.result = fn(job)
+            job.status = "cancelled" if job.cancelled.is_set() else "succeeded"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            job.status, job.error = "failed", str(e)
+        finally:
+            job.refresh()
+            job.finished = time.time()
+
+    def _trim(self):
+        finished = [jid for jid, job in self.jobs.items() if job.status not in ACTIVE]
+        for jid in finished[:max(0, len(finished) - self.keep)]:
+            del self.jobs[jid]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        """Ask a job to stop; True if it was still queued or running."""
+        job = self.get(job_id)
+        if job is None or job.status not in ACTIVE:
+            return False
+        job.cancelled.set()
+        return True
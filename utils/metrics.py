@@ -0,0 +1,166 @@
+# utils/metrics.py
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# seconds; spans sub-millisecond searches up to multi-second LLM calls and crawls
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    """Monotonic counter with labels, rendered in the Prometheus text format."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # {label values: float}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in sorted(self.values.items())]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered in the Prometheus text format."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # {label values: [bucket counts..., sum, count]}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            row = self.values.setdefault(key, [0] * (len(self.buckets) + 2))
+            if slot < len(self.buckets):
+                row[slot] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def samples(self):
+        out = []
+        with self.lock:
+            rows = sorted((key, list(row)) for key, row in self.values.items())
+        for key, row in rows:
+            cumulative = 0
+            for bound, n in zip(self.buckets, row):
+                cumulative += n
+                out.append((f"{self.name}_bucket", key + (repr(bound),), cumulative))
+            out.append((f"{self.name}_bucket", key + ("+Inf",), row[-1]))
+            out.append((f"{self.name}_sum", key, row[-2]))
+            out.append((f"{self.name}_count", key, row[-1]))
+        return out
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Latency of one pipeline stage call", ["stage"])
+STAGE_ITEMS = Counter("rag_stage_items_total", "Items processed per stage (pages, chunks, vectors, queries)", ["stage"])
+STAGE_ERRORS = Counter("rag_stage_errors_total", "Stage calls that raised", ["stage"])
+CACHE_LAYER = Counter("rag_query_cache_total", "/ask requests by the query-cache layer that served them", ["layer"])
+REQUEST_SECONDS = Histogram("rag_request_seconds", "HTTP request latency by endpoint", ["endpoint", "status"])
+
+
+def observe(stage, seconds, items=None):
+    """Record one call of `stage` that took `seconds` (and processed `items`, if given)."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    if items is not None:
+        STAGE_ITEMS.inc(items, stage=stage)
+    spans = _trace.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage, items=None):
+    """Times the block as one call of `stage`; exceptions are counted in rag_stage_errors_total."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        observe(stage, time.perf_counter() - t0, items)
+
+
+def current_trace():
+    """The span list of the trace being collected in this context, or None."""
+    return _trace.get()
+
+
+@contextmanager
+def trace(enabled=True):
+    """
+    Collects the stages timed in this context (and in tasks or to_thread calls it
+    starts) for a per-request trace; yields a list that summarize() turns into spans.
+    """
+    if not enabled:
+        yield None
+        return
+    spans = []
+    token = _trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _trace.reset(token)
+
+
+def summarize(spans):
+    """Per-stage call count, total and max milliseconds, in first-seen order."""
+    if spans is None:
+        return None
+    out = {}
+    for stage, seconds in list(spans):
+        entry = out.setdefault(stage, {"stage": stage, "count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        entry["count"] += 1
+        entry["total_ms"] += seconds * 1000
+        entry["max_ms"] = max(entry["max_ms"], seconds * 1000)
+    for entry in out.values():
+        entry["total_ms"] = round(entry["total_ms"], 3)
+        entry["max_ms"] = round(entry["max_ms"], 3)
+    return list(out.values())
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        names = metric.labelnames + (("le",) if metric.kind == "histogram" else ())
+        for name, key, value in metric.samples():
+            label_names = names if len(key) == len(names) else metric.labelnames
+            lines.append(f"{name}{_labels(label_names, key)} {value!r}")
+        lines.append("")
+    return "\n".join(lines)